@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+"""
+Find the rules of semanticRules.py that make the number of parse trees grow
+with the length of the sentence.
+
+The grammar is checked statically for:
+	- cycles of unary productions (A -> B -> ... -> A), which give a
+	  category infinitely many derivations over the same words;
+	- categories that can both start and end with themselves, such as
+	  NP -> NP Plus NP, or Variable -> Det Variable along with
+	  Variable -> Variable Called: the words between two of them can be
+	  grouped either way;
+	- optional affixes: productions C -> y and C -> y z where y can end
+	  with C, so that the words of z can belong to the inner or the outer
+	  C, as with AL -> AP and AL -> AP And AL when an action can end with
+	  an action list (when clicked say a and say b).
+
+Then, for every production through which a category derives itself, a
+synthetic sentence is built with the production applied 1, 2, ..., --depth
+times (around the shortest words of the category), every other
+category being rewritten to its shortest words, and the sentence is
+parsed. The number of trees at each depth shows how the ambiguity grows,
+and the productions that make up the packed nodes with several
+alternatives at the largest depth are the ones responsible for it.
+
+	python analyze_grammar.py
+	python analyze_grammar.py --depth 6 --categories AL WP_2
+"""
+import argparse
+from collections import defaultdict
+import sys
+
+from nltk.featstruct import TYPE
+
+import semanticRules as lab_rules
+import generate_vocab as gv
+
+sys.path.insert(0,'../software/')
+from lab3 import cfg
+from lab3.parse_budget import ParseBudget, ParseBudgetExceeded
+from lab3.parser_backends import parser_backend_names
+
+def is_nonterminal(symbol):
+	return isinstance(symbol, cfg.Nonterminal)
+
+def category_name(label):
+	"""The name of a category, from a rule or from a tree."""
+	try:
+		return str(label[TYPE])
+	except (TypeError, KeyError):
+		return str(label)
+
+class GrammarAnalysis(object):
+	"""
+	The facts about the productions of a rule set that the analysis needs,
+	keyed by the names of the categories.
+
+	Args:
+		productions (list of Production): the productions of the grammar
+		start (str): the start category
+	"""
+
+	def __init__(self, productions, start):
+		self.start = start
+		self.productions = []
+		seen = set()
+		for prod in productions:
+			rule = (str(prod.lhs()), tuple(str(s) if is_nonterminal(s) else s
+										   for s in prod.rhs()))
+			if rule not in seen:
+				seen.add(rule)
+				self.productions.append(rule)
+		self.nonterminals = set(lhs for lhs, _ in self.productions)
+		for prod in productions:
+			self.nonterminals.update(str(s) for s in prod.rhs()
+									 if is_nonterminal(s))
+		self.shortest = self._shortest_yields()
+
+	def is_category(self, symbol):
+		return symbol in self.nonterminals
+
+	def _shortest_yields(self):
+		"""The shortest list of words of every category."""
+		shortest = {}
+		changed = True
+		while changed:
+			changed = False
+			for lhs, rhs in self.productions:
+				words = self.yield_of(rhs, shortest)
+				if words is not None and (lhs not in shortest or
+										  len(words) < len(shortest[lhs])):
+					shortest[lhs] = words
+					changed = True
+		return shortest
+
+	def yield_of(self, symbols, shortest=None):
+		"""The shortest words of a list of symbols, or None."""
+		if shortest is None:
+			shortest = self.shortest
+		words = []
+		for symbol in symbols:
+			if not self.is_category(symbol):
+				words.append(symbol)
+			elif symbol in shortest:
+				words.extend(shortest[symbol])
+			else:
+				return None
+		return words
+
+	def corners(self, first):
+		"""
+		The categories every category can start with (first=True) or end
+		with, itself included.
+		"""
+		corners = dict((nt, set([nt])) for nt in self.nonterminals)
+		changed = True
+		while changed:
+			changed = False
+			for lhs, rhs in self.productions:
+				symbol = rhs[0] if first else rhs[-1]
+				if self.is_category(symbol) and not corners[symbol] <= corners[lhs]:
+					corners[lhs] |= corners[symbol]
+					changed = True
+		return corners
+
+	def unary_cycles(self):
+		"""
+		Returns:
+			list of list of str: the categories of every cycle of unary
+				productions
+		"""
+		edges = defaultdict(set)
+		for lhs, rhs in self.productions:
+			if len(rhs) == 1 and self.is_category(rhs[0]):
+				edges[lhs].add(rhs[0])
+		cycles = []
+		for component in strongly_connected_components(self.nonterminals, edges):
+			if len(component) > 1 or component[0] in edges[component[0]]:
+				cycles.append(sorted(component))
+		return cycles
+
+	def recursive_both_ways(self):
+		"""
+		Returns:
+			list of (str, tuple, tuple): the categories that can start and
+				end with themselves (A -> A x and A -> x A, directly or
+				through other categories), along with a production of each
+				kind; the words between two of them can be grouped either way
+		"""
+		starts = self.corners(first=True)
+		ends = self.corners(first=False)
+		left = {}
+		right = {}
+		for lhs, rhs in self.productions:
+			if len(rhs) < 2:
+				continue
+			if self.is_category(rhs[0]) and lhs in starts[rhs[0]]:
+				left.setdefault(lhs, rhs)
+			if self.is_category(rhs[-1]) and lhs in ends[rhs[-1]]:
+				right.setdefault(lhs, rhs)
+		return [(lhs, left[lhs], right[lhs])
+				for lhs in sorted(set(left) & set(right))]
+
+	def optional_affixes(self):
+		"""
+		Returns:
+			list of (str, tuple, tuple): the pairs of productions C -> y and
+				C -> y z where y can end with C (or C -> y and C -> z y where
+				y can start with C): the words of z can belong to the C
+				embedded in y or to the outer C, as with a dangling else
+		"""
+		starts = self.corners(first=True)
+		ends = self.corners(first=False)
+		by_lhs = defaultdict(list)
+		for lhs, rhs in self.productions:
+			by_lhs[lhs].append(rhs)
+		found = []
+		for lhs, rhs in self.productions:
+			for other in by_lhs[lhs]:
+				if len(other) <= len(rhs):
+					continue
+				if (other[:len(rhs)] == rhs and self.is_category(rhs[-1]) and
+						lhs in ends[rhs[-1]]):
+					found.append((lhs, rhs, other))
+				elif (other[-len(rhs):] == rhs and self.is_category(rhs[0]) and
+						lhs in starts[rhs[0]]):
+					found.append((lhs, rhs, other))
+		return found
+
+	def contexts(self, target):
+		"""
+		The shortest words around target in a derivation of every category:
+		maps a category A to (u, v, rule) such that A derives u target v,
+		where rule is the first production of the derivation (None for
+		target itself).
+		"""
+		contexts = {target: ([], [], None)}
+		changed = True
+		while changed:
+			changed = False
+			for lhs, rhs in self.productions:
+				if lhs == target:
+					continue
+				for i, symbol in enumerate(rhs):
+					if symbol not in contexts or symbol == lhs:
+						continue
+					before = self.yield_of(rhs[:i])
+					after = self.yield_of(rhs[i+1:])
+					if before is None or after is None:
+						continue
+					u, v, _ = contexts[symbol]
+					candidate = (before + u, v + after, (lhs, rhs))
+					if (lhs not in contexts or
+							len(candidate[0]) + len(candidate[1]) <
+							len(contexts[lhs][0]) + len(contexts[lhs][1])):
+						contexts[lhs] = candidate
+						changed = True
+		return contexts
+
+	def pumps(self, category):
+		"""
+		Returns:
+			list of (tuple, list of str, list of str): every production of
+				the category through which it derives itself, along with the
+				shortest words u and v such that the category derives
+				u category v starting with that production
+		"""
+		pumps = []
+		contexts = self.contexts(category)
+		for lhs, rhs in self.productions:
+			if lhs != category:
+				continue
+			best = None
+			for i, symbol in enumerate(rhs):
+				if symbol not in contexts:
+					continue
+				before = self.yield_of(rhs[:i])
+				after = self.yield_of(rhs[i+1:])
+				if before is None or after is None:
+					continue
+				u, v, _ = contexts[symbol]
+				u, v = before + u, v + after
+				if u + v and (best is None or
+							  len(u) + len(v) < len(best[0]) + len(best[1])):
+					best = (u, v)
+			if best is not None:
+				pumps.append(((lhs, rhs), best[0], best[1]))
+		return pumps
+
+	def synthetic_sentences(self, category, depth):
+		"""
+		Returns:
+			list of (tuple, list of list of str): every recursive production
+				of the category, with the sentences in which it is applied 1
+				to depth times; empty if the category cannot be reached from
+				the start category
+		"""
+		outer = self.contexts(category).get(self.start)
+		if outer is None or category not in self.shortest:
+			return []
+		found = []
+		for rule, u, v in self.pumps(category):
+			sentences = []
+			for k in range(1, depth + 1):
+				sentences.append(outer[0] + u * k + self.shortest[category] +
+								 v * k + outer[1])
+			found.append((rule, sentences))
+		return found
+
+def strongly_connected_components(nodes, edges):
+	"""Tarjan's algorithm, without recursion."""
+	index = {}
+	lowlink = {}
+	on_stack = set()
+	stack = []
+	components = []
+	counter = [0]
+	for root in sorted(nodes):
+		if root in index:
+			continue
+		work = [(root, iter(sorted(edges[root])))]
+		index[root] = lowlink[root] = counter[0]
+		counter[0] += 1
+		stack.append(root)
+		on_stack.add(root)
+		while work:
+			node, successors = work[-1]
+			advanced = False
+			for succ in successors:
+				if succ not in index:
+					index[succ] = lowlink[succ] = counter[0]
+					counter[0] += 1
+					stack.append(succ)
+					on_stack.add(succ)
+					work.append((succ, iter(sorted(edges[succ]))))
+					advanced = True
+					break
+				elif succ in on_stack:
+					lowlink[node] = min(lowlink[node], index[succ])
+			if advanced:
+				continue
+			work.pop()
+			if work:
+				parent = work[-1][0]
+				lowlink[parent] = min(lowlink[parent], lowlink[node])
+			if lowlink[node] == index[node]:
+				component = []
+				while True:
+					member = stack.pop()
+					on_stack.discard(member)
+					component.append(member)
+					if member == node:
+						break
+				components.append(component)
+	return components
+
+def ambiguous_rules(forest):
+	"""
+	Count, for every production, the packed nodes of a forest with several
+	alternatives in which the production is one of the alternatives.
+	"""
+	counts = defaultdict(int)
+	if forest is None:
+		return counts
+	seen = set()
+	stack = list(forest.roots)
+	while stack:
+		node = stack.pop()
+		if id(node) in seen:
+			continue
+		seen.add(id(node))
+		ambiguous = len(node.alternatives) > 1
+		for children in node.alternatives:
+			rhs = []
+			for child in children:
+				if hasattr(child, 'alternatives'):
+					stack.append(child)
+					rhs.append(category_name(child.label))
+				else:
+					rhs.append(repr(child))
+			if ambiguous:
+				counts[(category_name(node.label), tuple(rhs))] += 1
+	return counts
+
+def rule_str(rule):
+	lhs, rhs = rule
+	return '%s -> %s'%(lhs, ' '.join(rhs))
+
+def count_trees(sem_rule_set, words):
+	"""The number of trees of a sentence, and the forest they are packed in."""
+	try:
+		chart = sem_rule_set.parser.chart_parse(words)
+		forest = chart.forest(sem_rule_set.parser.grammar().start())
+	except ParseBudgetExceeded as e:
+		return e, None
+	return forest.count(), forest
+
+def growth(counts):
+	"""Describe how a sequence of tree counts grows."""
+	if any(not isinstance(c, (int, long)) for c in counts):
+		return 'gave up'
+	if counts[-1] <= 1:
+		return 'unambiguous'
+	if len(set(counts)) == 1:
+		return 'constant'
+	ratios = [float(b) / a for a, b in zip(counts, counts[1:]) if a]
+	if len(ratios) >= 2 and min(ratios[-2:]) >= 1.5:
+		return 'exponential'
+	return 'polynomial'
+
+def parse_cli_args():
+	arg_parser = argparse.ArgumentParser(description='Find the rules that make the number of parse trees grow.')
+	arg_parser.add_argument('--categories',
+							nargs='+',
+							default=None,
+							help='the recursive categories to measure (default: all of them).')
+	arg_parser.add_argument('--depth',
+							type=int,
+							default=5,
+							help='the largest number of times a recursive production is applied.')
+	arg_parser.add_argument('--top',
+							type=int,
+							default=5,
+							help='number of responsible rules reported for every category.')
+	arg_parser.add_argument('--max_parse_seconds',
+							type=float,
+							default=10.0,
+							help='give up parsing a synthetic sentence after this many seconds.')
+	arg_parser.add_argument('--open_word',
+							default='foo',
+							help='the word of the categories whose words come from the utterances (names, unknown words).')
+	arg_parser.add_argument('--parser_backend',
+							choices=parser_backend_names(),
+							default='compiled',
+							help='the parser used to count the trees.')
+	return arg_parser.parse_args()
+
+def main():
+	args = parse_cli_args()
+	sem_rule_set = lab_rules.sem
+	gv.generate_vocab_list(sem_rule_set)
+	# Categories whose words only come from the utterances are given the
+	# same placeholder word, as an unknown word of an utterance would be.
+	for category in gv.get_open_categories():
+		sem_rule_set.add_lexicon_rule(category, [args.open_word],
+									  lambda word: word)
+	sem_rule_set.parser_backend = args.parser_backend
+	sem_rule_set.parse_budget = ParseBudget(max_seconds=args.max_parse_seconds)
+	sem_rule_set.construct_parser()
+	start = category_name(sem_rule_set.parser.grammar().start())
+	analysis = GrammarAnalysis(sem_rule_set.productions, start)
+	print "> %d productions, %d categories"%(len(analysis.productions),
+											   len(analysis.nonterminals))
+
+	print "\n== Cycles of unary productions"
+	cycles = analysis.unary_cycles()
+	for cycle in cycles:
+		print "  " + " -> ".join(cycle + cycle[:1])
+	if not cycles:
+		print "  none"
+
+	print "\n== Categories that can start and end with themselves"
+	both_ways = analysis.recursive_both_ways()
+	for category, left, right in both_ways:
+		print "  %s\n      %s\n      %s"%(category, rule_str((category, left)),
+										 rule_str((category, right)))
+	if not both_ways:
+		print "  none"
+
+	print "\n== Optional affixes"
+	affixes = analysis.optional_affixes()
+	for category, short, long in affixes:
+		print "  %s\n      %s"%(rule_str((category, short)),
+							   rule_str((category, long)))
+	if not affixes:
+		print "  none"
+
+	print "\n== Number of trees by depth of recursion"
+	categories = args.categories or sorted(analysis.nonterminals)
+	report = []
+	for category in categories:
+		synthetic = analysis.synthetic_sentences(category, args.depth)
+		if not synthetic and args.categories:
+			print "  %s: not recursive, or not reachable from %s"%(category, start)
+		for rule, sentences in synthetic:
+			counts = []
+			forests = []
+			for words in sentences:
+				count, forest = count_trees(sem_rule_set, words)
+				counts.append(count)
+				if forest is None:
+					break
+				forests.append(forest)
+			report.append((category, rule, sentences, counts, forests))
+
+	order = {'gave up': 0, 'exponential': 1, 'polynomial': 2, 'constant': 3,
+			 'unambiguous': 4}
+	report.sort(key=lambda r: (order[growth(r[3])], r[0], r[1]))
+	for category, rule, sentences, counts, forests in report:
+		kind = growth(counts)
+		if kind == 'unambiguous' and not args.categories:
+			continue
+		print "\n  %s [%s] through %s"%(category, kind, rule_str(rule))
+		print "    trees: %s"%(', '.join(str(c) for c in counts))
+		print "    e.g.: %s"%(' '.join(sentences[0]))
+		if forests:
+			# The rules responsible for the growth are those whose share of
+			# the ambiguous nodes grows with the depth.
+			first = ambiguous_rules(forests[0])
+			last = ambiguous_rules(forests[-1])
+			rules = sorted(last.items(), key=lambda item: (
+				-(item[1] - first.get(item[0], 0)), -item[1], item[0]))
+			for responsible, n in rules[:args.top]:
+				print "    %4d packed nodes (%+d): %s"%(
+					n, n - first.get(responsible, 0), rule_str(responsible))
+	unambiguous = sum(1 for r in report if growth(r[3]) == 'unambiguous')
+	if unambiguous and not args.categories:
+		print "\n  %d other recursive productions give a single tree at every depth."%(unambiguous)
+
+if __name__=='__main__':
+	main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Compare the parser backends of SemanticRuleSet on a corpus of sentences.
+
+Every backend parses every sentence of the corpus (by default, the test
+fixtures) with the same grammar. The time to build the parser and to parse
+the corpus is reported along with the number of sentences for which the
+backend finds exactly the trees the first backend finds.
+
+	python benchmark_parsers.py
+	python benchmark_parsers.py --backends compiled cky --repeat 5
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import semanticRules as lab_rules
+import generate_vocab as gv
+
+sys.path.insert(0,'../software/')
+from lab3.parser_backends import parser_backend_names
+
+DEFAULT_CORPUS = os.path.join('..', 'test_fixtures', 'test', '*')
+
+def read_corpus(paths):
+	sentences = []
+	for path in paths:
+		with open(path) as f:
+			sentences.extend(line.strip() for line in f if line.strip())
+	return sentences
+
+def benchmark(sem_rule_set, backend, sentences, repeat):
+	"""
+	Returns:
+		(float, float, list of set of str): the seconds spent building the
+			parser, the mean seconds spent parsing the corpus, and the trees
+			of every sentence
+	"""
+	sem_rule_set.parser_backend = backend
+	sem_rule_set.parser = None
+	start = time.time()
+	sem_rule_set.construct_parser()
+	construct_seconds = time.time() - start
+
+	trees = None
+	start = time.time()
+	for _ in range(repeat):
+		trees = [set(str(t) for t in sem_rule_set.parse_sentence(s))
+				 for s in sentences]
+	parse_seconds = (time.time() - start) / repeat
+	return construct_seconds, parse_seconds, trees
+
+def parse_cli_args():
+	arg_parser = argparse.ArgumentParser(description='Compare the parser backends on a corpus of sentences.')
+	arg_parser.add_argument('corpus',
+							nargs='*',
+							help='files of sentences, one per line (default: the test fixtures).')
+	arg_parser.add_argument('--backends',
+							nargs='+',
+							choices=parser_backend_names(),
+							default=parser_backend_names(),
+							help='the backends to compare; trees are checked against the first one.')
+	arg_parser.add_argument('--repeat',
+							type=int,
+							default=3,
+							help='number of times the corpus is parsed by each backend.')
+	return arg_parser.parse_args()
+
+def main():
+	args = parse_cli_args()
+	paths = args.corpus or sorted(glob.glob(DEFAULT_CORPUS))
+	sentences = read_corpus(paths)
+	print "> %d sentences from %d files"%(len(sentences), len(paths))
+
+	# Every backend parses with the same vocabulary.
+	sem_rule_set = lab_rules.sem
+	gv.generate_vocab_list(sem_rule_set)
+	for sentence in sentences:
+		gv.add_unknowns_to_grammar(sentence, sem_rule_set)
+
+	print "%-10s %12s %12s %14s %12s"%('backend', 'construct s', 'corpus s',
+										'ms / sentence', 'same trees')
+	reference = None
+	for backend in args.backends:
+		construct_seconds, parse_seconds, trees = benchmark(
+			sem_rule_set, backend, sentences, args.repeat)
+		if reference is None:
+			reference = trees
+		same = sum(1 for a, b in zip(reference, trees) if a == b)
+		print "%-10s %12.3f %12.3f %14.2f %7d / %d"%(
+			backend, construct_seconds, parse_seconds,
+			1000.0 * parse_seconds / max(len(sentences), 1), same, len(sentences))
+
+if __name__=='__main__':
+	main()
@@ -161,6 +161,22 @@ def get_core_vocab():
 
 	return new_vocab
 
+def get_open_categories():
+	""" Get the categories whose terminals are taken from the utterances
+	themselves rather than fixed by the grammar.
+
+	Returns:
+		set of str: the names of the categories
+	"""
+	categories = set(get_core_vocab().keys())
+	for expression_map in expression_map_list:
+		for variables in expression_map.values():
+			categories.update(variables)
+	# Word phrases are added word by word.
+	categories.discard('WP')
+	categories.add('Word')
+	return categories
+
 def generate_vocab_list(semantic_rule_set):
 	new_vocab = get_core_vocab()
 	add_to_lexicon(new_vocab, semantic_rule_set)
@@ -228,22 +244,36 @@ def get_unknowns_given_productions(utterance, semantic_rule_set):
 		(str, list of strings): a tuple containing the new utterance and
 			the unknown words
 	"""
-	logged_unknowns = [production.rhs() for production in semantic_rule_set.productions if production.lhs() == 'Unk']
-
-	# Known words must come from the right hand side of rules
-	known_right_hand_sides = [production.rhs() for production in semantic_rule_set.productions]
-	flatten = lambda l: [item for sublist in l for item in sublist]
-	known_words = flatten(known_right_hand_sides)
+	# Known words must come from the right hand side of rules. Unknowns that
+	# have already been logged are in the grammar as 'Unk' words, so they
+	# are known as well.
+	known_words = semantic_rule_set.terminals
 	utterance_tokens = utterance.split()
 
 	unk_list = []
 	for word in utterance_tokens:
-		if word not in known_words or word in logged_unknowns:
-			if word not in logged_unknowns:
-				unk_list.append(word)
+		if word not in known_words and word not in unk_list:
+			unk_list.append(word)
 
 	return unk_list
 
+def get_unknown_vocab(utterance, semantic_rule_set):
+	""" The vocabulary add_unknowns_to_grammar would add to the grammar for an
+	utterance, without adding it.
+	Args:
+		utterance (str): The utterance in which to find unknowns.
+		semantic_rule_set (SemanticRuleSet): the object containing the rules
+	Returns:
+		dict: map of each nonterminal to a list of terminals, the unknown
+			words being under 'Unk'.
+	"""
+	vocab = extract_names_and_words([utterance])
+	names = set(word for words in vocab.values() for word in words)
+	vocab['Unk'] = [word for word in
+					get_unknowns_given_productions(utterance, semantic_rule_set)
+					if word not in names]
+	return vocab
+
 def add_unknowns_to_grammar(utterance, semantic_rule_set, opt_scratch_project=None):
 	""" All words that do not yet exist in the grammar or vocabulary must be
 	added to the vocabulary.
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Rank the rules of the grammar by how they are used, from the profile that
+semantic.py --profile_rules (or the RULE_PROFILE option of the server)
+adds its counts to.
+
+	python semantic.py --batch_mode sentences.txt --profile_rules rules.json
+	python rule_report.py rules.json
+	python rule_report.py rules.json --top 50 --unused
+
+The report lists the most used rules, the rules whose semantics take the
+most time or raise errors, the rules of semanticRules.py that the profiled
+sentences never used, and for the sentences that did not parse, the words
+at which the parse broke down and the categories the grammar expected
+there.
+"""
+import argparse
+import sys
+
+import semanticRules as lab_rules
+import generate_vocab as gv
+
+sys.path.insert(0,'../software/')
+from lab3.profiler import load_profile
+
+def print_ranking(title, rows, top):
+	print "\n== %s"%(title)
+	if not rows:
+		print "  none"
+	for row in rows[:top]:
+		print "  " + row
+	if len(rows) > top:
+		print "  ... %d more"%(len(rows) - top)
+
+def parse_cli_args():
+	arg_parser = argparse.ArgumentParser(description='Rank the rules of the grammar by how they are used.')
+	arg_parser.add_argument('profile',
+							help='the profile written by semantic.py --profile_rules.')
+	arg_parser.add_argument('--top',
+							type=int,
+							default=20,
+							help='number of rules listed in every ranking.')
+	arg_parser.add_argument('--unused',
+							action='store_true',
+							help='list every unused rule rather than the first --top ones.')
+	return arg_parser.parse_args()
+
+def main():
+	args = parse_cli_args()
+	profile = load_profile(args.profile)
+	productions = profile['productions']
+	print "> %d sentences, %d of which did not parse; %d rules used"%(
+		profile['sentences'], profile['failed_sentences'], len(productions))
+
+	used = sorted(productions.items(), key=lambda item: (-item[1]['hits'], item[0]))
+	print_ranking('Most used rules',
+				  ["%8d  %s"%(counts['hits'], rule) for rule, counts in used],
+				  args.top)
+
+	costly = sorted([item for item in productions.items() if item[1]['hits']],
+					key=lambda item: (-item[1]['seconds'], item[0]))
+	print_ranking('Time spent in the semantics of each rule (total, mean per use)',
+				  ["%8.3fs %8.3fms  %s"%(counts['seconds'],
+										 1000.0 * counts['seconds'] / counts['hits'],
+										 rule)
+				   for rule, counts in costly],
+				  args.top)
+
+	errors = sorted([item for item in productions.items() if item[1]['errors']],
+					key=lambda item: (-item[1]['errors'], item[0]))
+	print_ranking('Rules whose semantics raised errors',
+				  ["%8d  %s"%(counts['errors'], rule) for rule, counts in errors],
+				  args.top)
+
+	# The rules of the grammar, without the words added from utterances.
+	sem_rule_set = lab_rules.sem
+	gv.generate_vocab_list(sem_rule_set)
+	rules = []
+	seen = set()
+	for prod in sem_rule_set.productions:
+		rule = str(prod)
+		if rule not in seen:
+			seen.add(rule)
+			rules.append(rule)
+	unused = [text for text in rules if text not in productions]
+	print_ranking('Rules never used (%d of %d)'%(len(unused), len(rules)),
+				  unused, len(unused) if args.unused else args.top)
+
+	failures = profile['failed_at_word']
+	print_ranking('Words at which sentences stopped parsing',
+				  ["%8d  %s"%(n, word) for word, n in
+				   sorted(failures.items(), key=lambda item: (-item[1], item[0]))],
+				  args.top)
+	expected = profile['expected_at_failure']
+	print_ranking('Categories expected where sentences stopped parsing',
+				  ["%8d  %s"%(n, category) for category, n in
+				   sorted(expected.items(), key=lambda item: (-item[1], item[0]))],
+				  args.top)
+
+if __name__=='__main__':
+	main()
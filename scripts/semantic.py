@@ -6,7 +6,9 @@
 """
 
 from copy import deepcopy
+from StringIO import StringIO
 import argparse
+import multiprocessing
 import readline
 import traceback
 import sys
@@ -19,6 +21,7 @@ sys.path.insert(0,'../server/flaskr')
 from scratch_project import ScratchProject
 
 sys.path.insert(0,'../../software/')
+from nltk.corpus import wordnet as wn
 from nltk.tree import Tree
 from nltk.draw.tree import TreeView
 import lab3
@@ -26,6 +29,14 @@ from lab3.drawtree import TreeView as MultiTreeView
 from lab3.production_matcher import decorate_parse_tree
 from lab3.lambda_interpreter import eval_tree, decorate_tree_with_trace
 from lab3.semantic_rule_set import SemanticRuleSet
+from lab3.semantic_db import SemanticDatabase
+from lab3.instrumentation import instrumentation, count_tree_nodes
+from lab3.parse_budget import ParseBudget
+from lab3.segmenter import Segmenter
+from lab3.parse_session import ParseSession
+from lab3.parser_backends import parser_backend_names
+from lab3.spelling import KeywordCorrector
+from lab3.profiler import profiler
 
 ##############################################################################
 # Initialize args in case we are not running this script as the main script.
@@ -36,6 +47,14 @@ class MockArgs:
 		self.spm = None
 global args
 args = MockArgs()
+
+# Long multi-command utterances can be parsed one command at a time (see
+# --segment_min_tokens).
+segmenter = Segmenter(lab_rules.sem, open_categories=gv.get_open_categories())
+# Unknown words that are misspelled keywords are replaced by the keyword.
+corrector = KeywordCorrector(lab_rules.sem,
+							 open_categories=gv.get_open_categories(),
+							 is_word=lambda word: len(wn.synsets(word)) > 0)
 ##############################################################################
 
 def print_verbose(s):
@@ -45,13 +64,11 @@ def print_verbose(s):
 
 def read_sentence(batch_mode_sentences=None):
 	if batch_mode_sentences != None:
-		if len(batch_mode_sentences) == 0:
+		input_str = next(batch_mode_sentences, None)
+		if input_str is None:
 			return None
-		else:
-			input_str = batch_mode_sentences[0]
-			del batch_mode_sentences[0]
-			print "> " + input_str
-			return input_str
+		print "> " + input_str
+		return input_str
 	else:
 		try:
 			return str(raw_input("> ")).strip()
@@ -63,22 +80,94 @@ def read_sentence(batch_mode_sentences=None):
 		except KeyboardInterrupt:
 			return ""
 
+def _name_words(input_str):
+	names = gv.extract_names_and_words([input_str])
+	return set(word for values in names.values()
+			   for name in values for word in name.split())
+
+
+def correct_spelling(input_str):
+	"""
+	Replace the unknown words of an utterance that are misspelled keywords
+	of the grammar. Names and phrases taken from the utterance are left as
+	they are, whether they are found before or after the correction.
+	"""
+	tokens = input_str.split()
+	corrected, corrections = corrector.correct(tokens, _name_words(input_str))
+	if not corrections:
+		return input_str
+	names = _name_words(' '.join(corrected))
+	for i, token in enumerate(tokens):
+		if corrected[i] != token and corrected[i] in names:
+			corrected[i] = token
+	corrections = [(a, b) for a, b in zip(tokens, corrected) if a != b]
+	if corrections:
+		instrumentation.count('spelling_corrections', len(corrections))
+		print_verbose("[SPELLING] " + ', '.join("%s -> %s"%(a, b)
+												 for a, b in corrections))
+	return ' '.join(corrected)
+
+
 # TODO: add some sort of metric for discriminating between parses
 #  This metric could be doing it by simplest parse?
 def parse_input_str(input_str,opt_scratch_project=None):
+	input_str = correct_spelling(input_str)
 	# Before attempting to parse the sentence, update the grammar.
-	gv.add_unknowns_to_grammar(input_str, lab_rules.sem, opt_scratch_project)
+	with instrumentation.timer('add_unknowns_to_grammar'):
+		gv.add_unknowns_to_grammar(input_str, lab_rules.sem, opt_scratch_project)
 	trees = lab_rules.sem.parse_sentence(input_str)
-	index_of_tree_to_pick = 0
-	if len(trees) > 1:
-		print("[WARNING] Obtained %d parses; selecting the parse with the largest height."%(len(trees)))
-		tree_heights= [tree.height() for tree in trees]
-		index_of_tree_to_pick = tree_heights.index(min(tree_heights))
-	elif len(trees) == 0:
+	return select_tree(trees, input_str)
+
+
+def parse_input_segments(input_str,opt_scratch_project=None):
+	"""
+	Parse an utterance, one segment at a time if the segmenter splits it.
+
+	Returns:
+		list of Tree: the selected parse of every segment, in order
+	"""
+	input_str = correct_spelling(input_str)
+	# The grammar is updated with the whole utterance so that every segment
+	# is parsed with the same vocabulary.
+	with instrumentation.timer('add_unknowns_to_grammar'):
+		gv.add_unknowns_to_grammar(input_str, lab_rules.sem, opt_scratch_project)
+	results = segmenter.parse(input_str)
+	if len(results) > 1:
+		instrumentation.count('segments', len(results))
+	return [select_tree(trees, input_str) for trees in results]
+
+
+def select_tree(trees, input_str):
+	num_trees = len(trees)
+	if num_trees and trees.budget_exceeded is not None:
+		print("[WARNING] Kept only the first %d parses (%s)."%(num_trees, trees.budget_exceeded))
+	if num_trees > 1:
+		print("[WARNING] Obtained %d parses; selecting the parse with the largest height."%(num_trees))
+	elif num_trees == 0:
+		if trees.budget_exceeded is not None:
+			raise Exception("Gave up parsing the sentence (%s): %s"%(trees.budget_exceeded, input_str))
 		raise Exception("Failed to parse the sentence: " + input_str)
 
-	assert("I don't understand." != trees[0])
-	return trees[index_of_tree_to_pick]
+	# The tree of minimal height, taken from the parse forest.
+	return trees.best()
+
+
+def stitch_outputs(outputs):
+	"""
+	Combine the results of evaluating the segments of an utterance into the
+	result the whole utterance would have produced: the scripts are
+	concatenated, while the variables, lists and sounds are shared by all
+	segments.
+	"""
+	outputs = [output for output in outputs if output is not None]
+	if len(outputs) == 0:
+		return None
+	if len(outputs) == 1:
+		return outputs[0]
+	stitched = dict(outputs[-1])
+	stitched['scripts'] = [script for output in outputs
+						   for script in output['scripts']]
+	return stitched
 
 
 def handle_syntax_parser_mode(tree, sem_rule_set):
@@ -95,12 +184,13 @@ def validate_output(actual_output, expected_output):
 	# convert to a string before comparing.
 	if str(actual_output) == expected_output:
 		# print "[VALIDATION] SUCCESS: '%s' does match expected output: '%s'"%(actual_output, expected_output)
-		pass
+		return True
 	else:
 		# print "[VALIDATION] FAILURE: '%s' does not match expected output: '%s'"%(actual_output, expected_output)
 		print "[VALIDATION] FAILURE:"
 		print "expected: '%s'" %(expected_output)
 		print "got: '%s'" %(actual_output)
+		return False
 
 def display_trace_gui(GUI_decorated_tree, sem_rule_set):
 	# Display the GUI of the trace through the evaluation.
@@ -119,6 +209,18 @@ def process_single_instruction(input_str, opt_scripts_only=False):
 	Given an input string process the string to generate the appropriate
 	Scratch scripts. The script gets added the the ScratchProject object
 	"""
+	# Callers such as the Flask app may already have opened an
+	# instrumentation record that spans the whole request.
+	owns_record = instrumentation.current_record() is None
+	if owns_record:
+		instrumentation.start_record(input_str)
+	try:
+		return _process_single_instruction(input_str, opt_scripts_only)
+	finally:
+		if owns_record:
+			instrumentation.finish_record()
+
+def _process_single_instruction(input_str, opt_scripts_only=False):
 	# Ideally, we would only generate the vocabulary list once...
 	gv.generate_vocab_list(lab_rules.sem)
 
@@ -128,24 +230,34 @@ def process_single_instruction(input_str, opt_scripts_only=False):
 
 	# Parse the sentence.
 	output = None
+	parsed = False
 	try:
-		tree = parse_input_str(input_str)
+		trees = parse_input_segments(input_str)
+		parsed = True
 		if args.spm:
-			handle_syntax_parser_mode(tree, sem_rule_set)
+			for tree in trees:
+				handle_syntax_parser_mode(tree, sem_rule_set)
 			# continue
 		else:
-			# Evaluate the parse tree.
-			decorated_tree = decorate_parse_tree(tree,
-												 sem_rule_set,
-												 set_productions_to_labels=False)
-			trace = eval_tree(decorated_tree,
-							  sem_rule_set,
-							  args.verbose)
-
-			output = trace[-1]['expr']
+			# Evaluate the parse tree of every segment, in order.
+			outputs = []
+			for tree in trees:
+				if instrumentation.enabled:
+					instrumentation.count('tree_nodes', count_tree_nodes(tree))
+				with instrumentation.timer('decorate_parse_tree'):
+					decorated_tree = decorate_parse_tree(tree,
+														 sem_rule_set,
+														 set_productions_to_labels=False)
+				with instrumentation.timer('eval_tree'):
+					trace = eval_tree(decorated_tree,
+									  sem_rule_set,
+									  args.verbose)
+				outputs.append(trace[-1]['expr'])
+
+			output = stitch_outputs(outputs)
 
 			if args.gui:
-				display_trace_gui(decorate_parse_tree(deepcopy(tree),
+				display_trace_gui(decorate_parse_tree(deepcopy(trees[-1]),
 													  sem_rule_set,
 													  set_productions_to_labels=True),
 								  sem_rule_set)
@@ -156,6 +268,8 @@ def process_single_instruction(input_str, opt_scripts_only=False):
 		traceback.print_exc() #TODO: Uncomment this line while debugging.
 		return "I don't understand."
 		# output = e
+	finally:
+		profiler.sentence(sem_rule_set, input_str, parsed)
 
 	if opt_scripts_only:
 		# Return only the bracketed representation
@@ -164,15 +278,56 @@ def process_single_instruction(input_str, opt_scripts_only=False):
 	# Project
 	return output
 
-def run_repl(sem_rule_set, batch_sentences=[], valid_output=[]):
+def new_partial_session():
+	"""A ParseSession for partial instructions, see process_partial_instruction."""
+	return ParseSession(lab_rules.sem)
+
+def process_partial_instruction(session, input_str):
+	"""
+	Parse the words of an instruction received so far, reusing the work done
+	for the previous call on the same session when the words extend it.
+
+	Returns:
+		dict: whether the words can still be completed to an instruction
+			('viable'), whether they already are one ('complete'), and the
+			categories that can come next ('expected')
+	"""
+	sem_rule_set = lab_rules.sem
+	if sem_rule_set.parser is None:
+		sem_rule_set.construct_parser()
+	# The words the grammar does not know are only added to the lexicon of
+	# the session, so that the words being typed are not added to the
+	# grammar shared by everyone (which would also mean a new parser).
+	try:
+		sem_rule_set.parser.grammar().check_coverage(input_str.split())
+		session.set_lexicon([])
+	except ValueError:
+		vocab = gv.get_unknown_vocab(input_str, sem_rule_set)
+		session.set_lexicon(sem_rule_set.lexicon_productions(vocab))
+	with instrumentation.timer('parse_partial'):
+		return session.update(input_str).status()
+
+def run_repl(sem_rule_set, batch_sentences=None, valid_output=None):
+	"""
+	Args:
+		sem_rule_set (SemanticRuleSet): the rules used to parse and evaluate
+		batch_sentences (iterator of str): sentences to evaluate instead of
+			prompting the user
+		valid_output (iterator of str): expected output for each evaluated
+			batch sentence
+
+	Returns:
+		int: the number of sentences whose output did not validate
+	"""
 	assert isinstance(sem_rule_set, SemanticRuleSet)
-	batch_mode = len(batch_sentences) != 0
-	output_validation_mode = len(valid_output) != 0
+	batch_mode = batch_sentences is not None
+	output_validation_mode = valid_output is not None
 
 	scratch = ScratchProject()
 	gv.generate_vocab_list(lab_rules.sem)
 
 	evaluation_history = []
+	failures = 0
 	while True:
 		# Read in a sentence.
 		input_str = read_sentence(batch_sentences if batch_mode else None)
@@ -227,12 +382,155 @@ def run_repl(sem_rule_set, batch_sentences=[], valid_output=[]):
 		print changes
 
 		if output_validation_mode:
-			validate_output(changes, valid_output[0])
-			del valid_output[0]
+			expected_output = next(valid_output, None)
+			if expected_output is None:
+				print "[VALIDATION] FAILURE: no expected output for '%s'" %(input_str)
+				failures += 1
+			elif not validate_output(changes, expected_output):
+				failures += 1
 
 		if args.show_database:
 			lab_rules.sem.learned.print_knowledge()
+	return failures
+
+
+
+def split_batch_sessions(batch_sentences, valid_output=None):
+	"""
+	Group a stream of batch sentences into sessions. Sessions are separated
+	by blank lines and do not share any state, so they can be evaluated in
+	parallel.
+
+	Args:
+		batch_sentences (iterator of str): the lines of the batch file
+		valid_output (iterator of str): the expected output for each
+			non-blank line of the batch file
+
+	Returns:
+		generator of (list of str, list of str): the sentences of each
+			session along with their expected output (None when not
+			validating)
+	"""
+	sentences, expected = [], []
+	for sentence in batch_sentences:
+		if not sentence:
+			if sentences:
+				yield (sentences, expected if valid_output is not None else None)
+			sentences, expected = [], []
+			continue
+		sentences.append(sentence)
+		if valid_output is not None:
+			expected.append(next(valid_output, None))
+	if sentences:
+		yield (sentences, expected if valid_output is not None else None)
+
+
+def evaluate_batch_session(session):
+	"""
+	Evaluate a single batch session. Meant to run in a process of its own,
+	which exits without running the exit handlers: the counts of the rule
+	profiler are saved here.
+
+	A session that raises is reported, along with the sentences it did not
+	get to evaluate, rather than stopping the other sessions.
+
+	Returns:
+		int: the number of sentences of the session that failed
+	"""
+	sentences, expected = session
+	remaining = iter(sentences)
+	try:
+		return run_repl(lab_rules.sem,
+						batch_sentences=remaining,
+						valid_output=iter(expected) if expected is not None else None)
+	except Exception:
+		traceback.print_exc()
+		# The sentence being evaluated had been read already.
+		unevaluated = sentences[len(sentences) - len(list(remaining)) - 1:]
+		print "[ERROR] The batch session failed; %d sentences were not evaluated" %(len(unevaluated))
+		if expected is not None:
+			for sentence in unevaluated:
+				print "[VALIDATION] FAILURE: '%s' was not evaluated" %(sentence)
+		return len(unevaluated)
+	finally:
+		profiler.save()
+
+
+def run_batch_session(session):
+	"""
+	Evaluate a single batch session.
+
+	Returns:
+		(str, int): everything the session printed, and the number of its
+			sentences that failed
+	"""
+	transcript = StringIO()
+	sys.stdout = transcript
+	try:
+		failures = evaluate_batch_session(session)
+	finally:
+		sys.stdout = sys.__stdout__
+	return transcript.getvalue(), failures
+
 
+def run_batch_sequentially(batch_sentences, valid_output):
+	"""
+	Evaluate the batch sessions one after the other, each in a forked
+	process so that, as with run_batch_in_parallel, it starts from the
+	grammar and project state that was loaded before any sentence was
+	evaluated. The output of every session is written as it is printed.
+
+	Returns:
+		int: the number of sessions that failed
+	"""
+	failed = 0
+	for session in split_batch_sessions(batch_sentences, valid_output):
+		sys.stdout.flush()
+		pid = os.fork()
+		if pid == 0:
+			status = 2
+			try:
+				status = 1 if evaluate_batch_session(session) else 0
+			except BaseException:
+				traceback.print_exc()
+			finally:
+				sys.stdout.flush()
+				os._exit(status)
+		_, status = os.waitpid(pid, 0)
+		if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+			continue
+		failed += 1
+		if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 1:
+			# The session did not get to report its failure.
+			print "[ERROR] The batch session starting with '%s' did not finish (status %d)" %(session[0][0], status)
+	return failed
+
+
+def run_batch_in_parallel(batch_sentences, valid_output, jobs):
+	"""
+	Evaluate the batch sessions across a pool of worker processes and write
+	their transcripts in input order.
+
+	Every session runs in a freshly forked worker so that it starts from the
+	grammar and project state that was loaded before any sentence was
+	evaluated.
+
+	Returns:
+		int: the number of sessions that failed
+	"""
+	failed = 0
+	pool = multiprocessing.Pool(processes=jobs, maxtasksperchild=1)
+	try:
+		sessions = split_batch_sessions(batch_sentences, valid_output)
+		for transcript, failures in pool.imap(run_batch_session, sessions):
+			sys.stdout.write(transcript)
+			sys.stdout.flush()
+			if failures:
+				failed += 1
+	finally:
+		pool.close()
+		pool.join()
+	return failed
 
 ##############################################################################
 
@@ -261,24 +559,86 @@ def parse_cli_args():
 	arg_parser.add_argument('--show_database',
 							action='store_true',
 							help='display the contents of the semantic database after each evaluation')
+	arg_parser.add_argument('--knowledge_db',
+							type=str,
+							default=None,
+							help='keep the facts learned from the sentences in the specified sqlite file rather than in memory.')
 	arg_parser.add_argument('--validate_output',
 							dest='validation_file',
 							type=str,
 							required=False,
 							help='check the specified input against expected output.')
+	arg_parser.add_argument('--jobs',
+							dest='jobs',
+							type=int,
+							default=1,
+							help="""
+								 number of worker processes used in batch mode.
+								 Blank lines in the batch file separate
+								 independent sessions, each evaluated from the
+								 state loaded at startup; with more than one job,
+								 sessions are evaluated in parallel.
+								 """)
+	arg_parser.add_argument('--segment_min_tokens',
+							type=int,
+							default=0,
+							help="""
+								 split utterances of at least this many words at
+								 their top-level coordinators and sequence adverbs
+								 and parse the commands separately (0, the
+								 default, never splits them).
+								 """)
+	arg_parser.add_argument('--max_edges',
+							type=int,
+							default=None,
+							help='give up parsing a sentence once its chart holds this many edges.')
+	arg_parser.add_argument('--max_parse_seconds',
+							type=float,
+							default=None,
+							help='give up parsing a sentence after this many seconds.')
+	arg_parser.add_argument('--max_trees',
+							type=int,
+							default=None,
+							help='extract at most this many parse trees per sentence.')
+	arg_parser.add_argument('--parser_backend',
+							choices=parser_backend_names(),
+							default='compiled',
+							help='the parser to parse sentences with (see scripts/benchmark_parsers.py).')
+	arg_parser.add_argument('--profile_rules',
+							dest='rule_profile',
+							type=str,
+							default=None,
+							help="""
+								 count how often every rule is used and the time
+								 spent in its semantics, and add the counts to the
+								 specified file (see scripts/rule_report.py).
+								 """)
+	arg_parser.add_argument('--no_spelling_correction',
+							action='store_true',
+							help='keep unknown words that are close to a word of the grammar as they are.')
 	return arg_parser.parse_args()
 
 
 def main():
 	print "> Loading the 6.863 Semantics REPL..."
 
-	batch_sentences=[]
+	if args.validation_file != None:
+		if args.batch_file == None:
+			print "[ERROR] Must be in batch mode to validate output."
+			return 1
+		elif args.spm:
+			print "[ERROR] Cannot validate output in syntax parser mode."
+			return 1
+
+	# Sentences and expected output are streamed from their files rather than
+	# read up front.
+	batch_file = None
+	batch_sentences = None
 	if args.batch_file != None:
 		try:
 			print "> Running in batch mode. Reading sentences from: " + args.batch_file
-			# Read in the list of sentences.
-			with open(args.batch_file, 'r') as f_bm:
-				batch_sentences = [x.strip() for x in f_bm]
+			batch_file = open(args.batch_file, 'r')
+			batch_sentences = (x.strip() for x in batch_file)
 		except IOError as e:
 			print "[ERROR] Could not open the file: %s"%(args.batch_file)
 			return
@@ -286,32 +646,55 @@ def main():
 		print "> Hello. To exit this program, enter <cr> at the prompt below."
 
 	# If validating output, read in the expected output.
-	valid_output = []
+	validation_file = None
+	valid_output = None
 	if args.validation_file != None:
-		if args.batch_file == None:
-			print "[ERROR] Must be in batch mode to validate output."
-			return
-		elif args.spm:
-			print "[ERROR] Cannot validate output in syntax parser mode."
-			return
 		try:
 			print "> Validating output against " + args.validation_file
-			with open(args.validation_file, 'r') as f_vo:
-				valid_output = [x.strip() for x in f_vo]
-				assert len(batch_sentences) == len(valid_output)
+			validation_file = open(args.validation_file, 'r')
+			valid_output = (x.strip() for x in validation_file if x.strip())
 		except IOError as e:
 			print "[ERROR] Could not open the file: %s"%(args.validation_file)
 
+	lab_rules.sem.parse_budget = ParseBudget(max_edges=args.max_edges,
+											 max_seconds=args.max_parse_seconds,
+											 max_trees=args.max_trees)
+
+	segmenter.min_tokens = args.segment_min_tokens or None
+	lab_rules.sem.parser_backend = args.parser_backend
+	corrector.enabled = not args.no_spelling_correction
+	if args.rule_profile:
+		profiler.enable(args.rule_profile)
+	if args.knowledge_db:
+		lab_rules.sem.learned = SemanticDatabase(args.knowledge_db)
+
 	# import my_rules
 	# my_rules.add_my_rules(lab_rules.sem)
 
-	# Start the Semantics REPL.
-	run_repl(lab_rules.sem,
-			 batch_sentences=batch_sentences,
-			 valid_output=valid_output)
+	try:
+		if batch_sentences is not None and args.jobs > 1:
+			failed = run_batch_in_parallel(batch_sentences, valid_output, args.jobs)
+		elif batch_sentences is not None:
+			failed = run_batch_sequentially(batch_sentences, valid_output)
+		else:
+			# Start the Semantics REPL.
+			failed = run_repl(lab_rules.sem,
+							  batch_sentences=batch_sentences,
+							  valid_output=valid_output)
+
+		if valid_output is not None:
+			extra_lines = sum(1 for _ in valid_output)
+			if extra_lines:
+				print "[VALIDATION] FAILURE: %d expected outputs have no matching sentence" %(extra_lines)
+				failed += 1
+	finally:
+		for f in (batch_file, validation_file):
+			if f is not None:
+				f.close()
 
 	# Exit the program.
 	print "> Goodbye."
+	return failed
 
 
 if __name__=='__main__':
@@ -321,6 +704,7 @@ if __name__=='__main__':
 	# else:
 	#default path to base_project_dir
 	args = parse_cli_args()
-	main()
+	if main():
+		sys.exit(1)
 
 
@@ -7,7 +7,7 @@ from lab3.semantic_rule_set import SemanticRuleSet
 from lab3.semantic_db import pretty_print_entry
 
 from nltk.corpus import wordnet as wn
-from text2num import text2int
+from text2num import parse_number
 
 sys.path.insert(0,'../server/flaskr')
 import random
@@ -127,11 +127,7 @@ def waitUntil(until_condition):
     return ["doWaitUntil", until_condition]
 
 def getNumber(unk):
-		try:
-			num = int(unk)
-		except:
-			num = text2int(unk)
-		return num
+		return parse_number(unk)
 
 def setVariable(var_name, value):
     #global_variables[var_name] = value
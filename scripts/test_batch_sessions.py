@@ -0,0 +1,74 @@
+# file overview: Test the evaluation of batch files by sessions
+#
+# Run from the scripts directory: python -m unittest test_batch_sessions
+import os
+import tempfile
+import unittest
+
+import semantic
+
+HELLO = "{'variables': {}, 'sounds': set([]), 'lists': {}, 'scripts': [['speakAndWait:', 'hello']]}"
+BYE = "{'variables': {}, 'sounds': set([]), 'lists': {}, 'scripts': [['speakAndWait:', 'bye']]}"
+
+class TestSplitBatchSessions(unittest.TestCase):
+	def test_sessions_and_expected_output(self):
+		lines = ['say hello', 'say bye', '', '', 'say hi']
+		sessions = list(semantic.split_batch_sessions(iter(lines), iter(['a', 'b', 'c'])))
+		self.assertEqual(sessions, [(['say hello', 'say bye'], ['a', 'b']),
+									(['say hi'], ['c'])])
+
+	def test_without_expected_output(self):
+		sessions = list(semantic.split_batch_sessions(iter(['say hello'])))
+		self.assertEqual(sessions, [(['say hello'], None)])
+
+class TestBatchFailures(unittest.TestCase):
+	"""A session that raises is reported along with the sentences it did not
+	evaluate, and the other sessions are evaluated all the same."""
+
+	LINES = ['say hello', '', 'say hello', 'boom', 'say bye', '', 'say bye']
+	EXPECTED = [HELLO, HELLO, 'not evaluated', 'not evaluated', BYE]
+
+	def setUp(self):
+		self.process_single_instruction = semantic.process_single_instruction
+		def process(input_str, opt_scripts_only=False):
+			if input_str == 'boom':
+				raise RuntimeError('boom')
+			return self.process_single_instruction(input_str, opt_scripts_only)
+		semantic.process_single_instruction = process
+		semantic.args.show_database = False
+
+	def tearDown(self):
+		semantic.process_single_instruction = self.process_single_instruction
+
+	def run_batch(self, run):
+		"""Run a batch function, and return its result and everything it
+		printed (the sessions print from processes of their own)."""
+		output = tempfile.TemporaryFile()
+		stdout = os.dup(1)
+		os.dup2(output.fileno(), 1)
+		try:
+			failed = run(iter(self.LINES), iter(self.EXPECTED))
+		finally:
+			os.dup2(stdout, 1)
+			os.close(stdout)
+		output.seek(0)
+		return failed, output.read()
+
+	def check(self, failed, transcript):
+		self.assertEqual(failed, 1)
+		self.assertTrue("[ERROR] The batch session failed; 2 sentences were not evaluated" in transcript)
+		self.assertTrue("[VALIDATION] FAILURE: 'boom' was not evaluated" in transcript)
+		self.assertTrue("[VALIDATION] FAILURE: 'say bye' was not evaluated" in transcript)
+		# The session after the failed one is evaluated and validates.
+		self.assertEqual(transcript.count('> say bye'), 1)
+		self.assertEqual(transcript.count('[VALIDATION] FAILURE'), 2)
+
+	def test_sequentially(self):
+		self.check(*self.run_batch(semantic.run_batch_sequentially))
+
+	def test_in_parallel(self):
+		self.check(*self.run_batch(
+			lambda sentences, expected: semantic.run_batch_in_parallel(sentences, expected, 2)))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,68 @@
+# file overview: Test the conversion of numbers written with digits or words
+#
+# Run from the scripts directory: python -m unittest test_text2num
+import unittest
+
+import text2num
+from text2num import is_number, parse_number, text2int
+
+class TestParseNumber(unittest.TestCase):
+	def test_digits(self):
+		self.assertEqual(parse_number('42'), 42)
+		self.assertEqual(parse_number('-7'), -7)
+		self.assertEqual(parse_number('2.5'), 2.5)
+		self.assertEqual(parse_number('.5'), 0.5)
+		self.assertEqual(parse_number('3rd'), 3)
+
+	def test_words(self):
+		self.assertEqual(parse_number('zero'), 0)
+		self.assertEqual(parse_number('forty two'), 42)
+		self.assertEqual(parse_number('forty-two'), 42)
+		self.assertEqual(parse_number('hundred'), 100)
+		self.assertEqual(parse_number('one hundred and five'), 105)
+		self.assertEqual(parse_number('two thousand three hundred'), 2300)
+		self.assertEqual(parse_number('one million two thousand'), 1002000)
+		self.assertEqual(parse_number('Twenty One'), 21)
+
+	def test_ordinals(self):
+		self.assertEqual(parse_number('first'), 1)
+		self.assertEqual(parse_number('twenty first'), 21)
+		self.assertEqual(parse_number('twelfth'), 12)
+		self.assertEqual(parse_number('hundredth'), 100)
+		# Only the last word may be an ordinal.
+		self.assertFalse(is_number('first hundred'))
+
+	def test_decimals(self):
+		self.assertEqual(parse_number('two point five'), 2.5)
+		self.assertEqual(parse_number('point two five'), 0.25)
+		self.assertEqual(parse_number('ten point zero one'), 10.01)
+		self.assertFalse(is_number('two point twenty'))
+
+	def test_not_numbers(self):
+		for text in ['hello', '', 'and', 'two apples', '3x']:
+			self.assertFalse(is_number(text), text)
+			self.assertRaises(ValueError, parse_number, text)
+
+	def test_text2int(self):
+		self.assertEqual(text2int('seven'), 7)
+		self.assertRaises(ValueError, text2int, 'two point five')
+
+	def test_cache(self):
+		text2num._cache.clear()
+		self.assertEqual(parse_number('ninety nine'), 99)
+		self.assertEqual(text2num._cache.get('ninety nine'), 99)
+		self.assertFalse(is_number('nothing'))
+		self.assertEqual(text2num._cache.get('nothing', 'missing'), None)
+
+class TestLRUCache(unittest.TestCase):
+	def test_least_recently_used_entries_are_dropped(self):
+		cache = text2num._LRUCache(2)
+		cache.put('a', 1)
+		cache.put('b', 2)
+		self.assertEqual(cache.get('a'), 1)
+		cache.put('c', 3)
+		self.assertEqual(cache.get('b'), None)
+		self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+if __name__ == '__main__':
+	unittest.main()
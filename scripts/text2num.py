@@ -1,35 +1,200 @@
-def text2int(textnum, numwords={}):
-  try:
-    return int(textnum)
-  except:
-    if not numwords:
-      units = [
-        "zero", "one", "two", "three", "four", "five", "six", "seven", "eight",
-        "nine", "ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen",
-        "sixteen", "seventeen", "eighteen", "nineteen",
-      ]
-
-      tens = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
-
-      scales = ["hundred", "thousand", "million", "billion", "trillion"]
-
-      numwords["and"] = (1, 0)
-      for idx, word in enumerate(units):    numwords[word] = (1, idx)
-      for idx, word in enumerate(tens):     numwords[word] = (1, idx * 10)
-      for idx, word in enumerate(scales):   numwords[word] = (10 ** (idx * 3 or 2), 0)
-
-    current = result = 0
-    for word in textnum.split():
-        if word not in numwords:
-          raise Exception("Illegal word: " + word)
-
-        scale, increment = numwords[word]
-        current = current * scale + increment
-        if scale > 100:
-            result += current
-            current = 0
-
-    return result + current
+"""
+Conversion of numbers written with digits or words ("42", "2.5", "3rd",
+"forty two", "two point five", "twenty first") to ints and floats.
+
+The word tables are built once when the module is imported and never
+modified afterwards. Results are memoized per phrase in a small LRU cache,
+so repeated literals are converted with a single dictionary lookup.
+"""
+from collections import OrderedDict
+import re
+import threading
+
+_UNITS = (
+  "zero", "one", "two", "three", "four", "five", "six", "seven", "eight",
+  "nine", "ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen",
+  "sixteen", "seventeen", "eighteen", "nineteen",
+)
+
+_TENS = ("", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy",
+         "eighty", "ninety")
+
+_SCALES = ("hundred", "thousand", "million", "billion", "trillion")
+
+# Ordinals that are not simply the cardinal followed by "th".
+_IRREGULAR_ORDINALS = {
+  "first": "one", "second": "two", "third": "three", "fifth": "five",
+  "eighth": "eight", "ninth": "nine", "twelfth": "twelve",
+}
+
+_DECIMAL_POINT = "point"
+
+_INTEGER_RE = re.compile(r'^[+-]?\d+$')
+_DECIMAL_RE = re.compile(r'^[+-]?(?:\d+\.\d*|\.\d+)$')
+_ORDINAL_RE = re.compile(r'^(\d+)(?:st|nd|rd|th)$')
+
+
+def _build_numwords():
+  """
+  Returns:
+    (dict, dict): maps each cardinal and each ordinal number word to its
+      (scale, increment) pair
+  """
+  numwords = {"and": (1, 0)}
+  for idx, word in enumerate(_UNITS):  numwords[word] = (1, idx)
+  for idx, word in enumerate(_TENS):   numwords[word] = (1, idx * 10)
+  for idx, word in enumerate(_SCALES): numwords[word] = (10 ** (idx * 3 or 2), 0)
+  del numwords[""]
+
+  ordinals = {}
+  for word, value in numwords.items():
+    if word == "and" or word in _IRREGULAR_ORDINALS.values():
+      continue
+    if word.endswith("y"):
+      ordinals[word[:-1] + "ieth"] = value
+    else:
+      ordinals[word + "th"] = value
+  for ordinal, cardinal in _IRREGULAR_ORDINALS.items():
+    ordinals[ordinal] = numwords[cardinal]
+  return numwords, ordinals
+
+_NUMWORDS, _ORDINALS = _build_numwords()
+
+
+class _LRUCache(object):
+
+  def __init__(self, maxsize):
+    self.maxsize = maxsize
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key, default=None):
+    with self._lock:
+      if key not in self._entries:
+        return default
+      value = self._entries.pop(key)
+      self._entries[key] = value
+      return value
+
+  def put(self, key, value):
+    with self._lock:
+      self._entries.pop(key, None)
+      self._entries[key] = value
+      if len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+_MISSING = object()
+_cache = _LRUCache(1024)
+
+
+def _parse_words(words):
+  """
+  Returns:
+    int: the value of the cardinal or ordinal number words, or None if they
+      do not spell a number
+  """
+  if not words or all(word == "and" for word in words):
+    return None
+  current = result = 0
+  for i, word in enumerate(words):
+    if word in _NUMWORDS:
+      scale, increment = _NUMWORDS[word]
+    elif word in _ORDINALS and i == len(words) - 1:
+      scale, increment = _ORDINALS[word]
+    else:
+      return None
+    if scale > 1 and current == 0:
+      # a scale on its own ("hundred") counts once
+      current = 1
+    current = current * scale + increment
+    if scale > 100:
+      result += current
+      current = 0
+  return result + current
+
+
+def _parse_digit_words(words):
+  """
+  Returns:
+    str: the digits spelled by words such as "one four", or None
+  """
+  digits = []
+  for word in words:
+    scale, increment = _NUMWORDS.get(word, (None, None))
+    if scale != 1 or not 0 <= increment <= 9 or word == "and":
+      return None
+    digits.append(str(increment))
+  return "".join(digits) or None
+
+
+def _parse(text):
+  text = text.strip().lower()
+  if _INTEGER_RE.match(text):
+    return int(text)
+  if _DECIMAL_RE.match(text):
+    return float(text)
+  match = _ORDINAL_RE.match(text)
+  if match:
+    return int(match.group(1))
+
+  words = text.replace("-", " ").split()
+  if _DECIMAL_POINT in words:
+    point = words.index(_DECIMAL_POINT)
+    whole = _parse_words(words[:point]) if point > 0 else 0
+    fraction = _parse_digit_words(words[point+1:])
+    if whole is None or fraction is None:
+      return None
+    return float("%d.%s" %(whole, fraction))
+  return _parse_words(words)
+
+
+def _lookup(text):
+  value = _cache.get(text, _MISSING)
+  if value is _MISSING:
+    value = _parse(text)
+    _cache.put(text, value)
+  return value
+
+
+def parse_number(text):
+  """
+  Convert a number written with digits or words to an int, or to a float
+  if it has a fractional part.
+
+  Args:
+    text (str): e.g. "7", "2.5", "3rd", "forty two", "two point five"
+
+  Returns:
+    int or float: the value of the number
+
+  Raises:
+    ValueError: if text is not a number
+  """
+  value = _lookup(text)
+  if value is None:
+    raise ValueError("Not a number: " + text)
+  return value
+
+
+def is_number(text):
+  return _lookup(text) is not None
+
+
+def text2int(textnum):
+  """
+  Convert a whole number written with digits or words to an int.
+
+  Raises:
+    ValueError: if textnum is not a whole number
+  """
+  value = parse_number(textnum)
+  if isinstance(value, float):
+    raise ValueError("Not a whole number: " + textnum)
+  return value
 
 def example_generateExpressionMap():
   blah = """add (.*) to (.*)
@@ -0,0 +1,135 @@
+"""
+Asynchronous launcher for the ScratchNLP server.
+
+    python async_server.py --port 5000
+    python async_server.py --port 5000 --io_threads 32 --max_connections 20000
+
+Connections are served by gevent greenlets, so a client that holds its
+connection open (between two polls of a project, or while typing an
+instruction) costs little more than its socket. The app itself runs in
+pools of threads, so neither parsing nor the blocking sqlite calls hold up
+the greenlets:
+
+- the requests that parse instructions (translate, script, update,
+  scratch_program and partial) run in the parse pool. It holds as many
+  threads as the admission control of the app runs and queues requests
+  (ADMISSION_MAX_ACTIVE + ADMISSION_MAX_QUEUE), so the fair queue and the
+  503 responses of the admission control still apply;
+- every other request (the projects, the allprojects listings, the sb2
+  exports, /metrics) runs in the I/O pool.
+
+Project updates are written by the write-behind queue of the app (see
+WRITE_BEHIND_DELAY), so they never wait for the database either. The
+routes and responses are those of the app.
+
+No module is monkey patched: the app keeps its threads and locks, and the
+greenlets only read requests and write responses.
+"""
+
+import argparse
+import re
+from io import BytesIO
+
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+from gevent.threadpool import ThreadPool
+
+from flaskr import create_app
+from prefork import warm_up
+
+# The paths of the requests that parse instructions.
+PARSE_PATHS = re.compile(r'^/(translate/|user/[^/]+/(project/[^/]+/(script|update)/'
+                         r'|scratch_program/|partial/))')
+
+# Number of parse threads when the admission control of the app is off.
+DEFAULT_PARSE_THREADS = 4
+
+
+class ThreadPoolApp(object):
+    """
+    WSGI app that runs another one in pools of threads, and hands its
+    response back to the greenlet serving the request.
+
+    Args:
+        app: the WSGI app to run
+        parse_pool (ThreadPool): the threads of the requests whose path
+            matches PARSE_PATHS
+        io_pool (ThreadPool): the threads of the other requests
+    """
+
+    def __init__(self, app, parse_pool, io_pool):
+        self.app = app
+        self.parse_pool = parse_pool
+        self.io_pool = io_pool
+
+    def __call__(self, environ, start_response):
+        # The request body is read from the socket of the greenlet, which
+        # cannot be used from another thread.
+        length = environ.get('CONTENT_LENGTH')
+        body = environ['wsgi.input'].read(int(length)) if length else b''
+        environ['wsgi.input'] = BytesIO(body)
+        pool = (self.parse_pool if PARSE_PATHS.match(environ.get('PATH_INFO', ''))
+                else self.io_pool)
+        status, headers, exc_info, chunks = pool.apply(self._run, (environ,))
+        start_response(status, headers, exc_info)
+        return chunks
+
+    def _run(self, environ):
+        """Run the app in a thread of a pool, and collect its response."""
+        response = []
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [status, headers, exc_info]
+            return chunks.append
+
+        result = self.app(environ, start_response)
+        try:
+            chunks.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response + [chunks]
+
+
+def parse_threads(app):
+    """The size of the parse pool, from the admission control of the app."""
+    if app.config['ADMISSION_MAX_ACTIVE'] is None:
+        return DEFAULT_PARSE_THREADS
+    return app.config['ADMISSION_MAX_ACTIVE'] + app.config['ADMISSION_MAX_QUEUE']
+
+
+def parse_cli_args():
+    arg_parser = argparse.ArgumentParser(description='Run the ScratchNLP server on gevent, with the app in pools of threads.')
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=5000)
+    arg_parser.add_argument('--parse_threads',
+                            type=int,
+                            default=None,
+                            help='threads parsing instructions (by default, as many as the admission control of the app lets in or queues).')
+    arg_parser.add_argument('--io_threads',
+                            type=int,
+                            default=16,
+                            help='threads serving the other requests.')
+    arg_parser.add_argument('--max_connections',
+                            type=int,
+                            default=10000,
+                            help='connections held open at the same time.')
+    return arg_parser.parse_args()
+
+
+def main():
+    args = parse_cli_args()
+    app = create_app()
+    warm_up()
+    wsgi_app = ThreadPoolApp(app,
+                             ThreadPool(args.parse_threads or parse_threads(app)),
+                             ThreadPool(args.io_threads))
+    server = WSGIServer((args.host, args.port), wsgi_app,
+                        spawn=Pool(args.max_connections))
+    print("[async] Serving on http://%s:%d"%(args.host, args.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
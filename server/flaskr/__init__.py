@@ -1,15 +1,29 @@
 from flask import Flask
+from flask import g
 from flask import request
+from flask import send_file
 from flask_cors import CORS, cross_origin
 
+import functools
 import os
 import sys
 import db
+import json
+import threading
 import time
 
 sys.path.insert(0,'../scripts/')
-from semantic import process_single_instruction
+from semantic import (process_single_instruction, new_partial_session,
+                      process_partial_instruction, segmenter)
 from scratch_project import ScratchProject
+from lab3.instrumentation import instrumentation
+from lab3.profiler import profiler
+from assets import peek_default_asset_store
+from project_cache import ProjectResponseCache, project_etag
+from admission import AdmissionController, Overloaded
+from lab3.parse_budget import ParseBudget
+from lab3.semantic_db import SemanticDatabase
+import semanticRules as lab_rules
 
 def create_app(test_config=None):
     # Create and configure the app
@@ -20,6 +34,47 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY='dev',
         DATABASE=os.path.join(app.instance_path, 'flaskr.sqlite'),
+        # Record per-stage timings and counters for every request and expose
+        # them through the /metrics endpoint.
+        INSTRUMENTATION=False,
+        # Limits on the work spent parsing a single instruction, so that one
+        # pathological sentence cannot hold up the server. None disables a
+        # limit.
+        PARSE_MAX_EDGES=200000,
+        PARSE_MAX_SECONDS=10.0,
+        PARSE_MAX_TREES=1000,
+        # The parser to parse instructions with, see
+        # scripts/benchmark_parsers.py to compare them.
+        PARSER_BACKEND='compiled',
+        # Instructions of at least this many words are split at their
+        # top-level coordinators and sequence adverbs and parsed one command
+        # at a time. None parses every instruction whole.
+        SEGMENT_MIN_TOKENS=None,
+        # Project json bodies at least this large are gzipped for clients
+        # that accept it.
+        GZIP_MIN_SIZE=1024,
+        # Number of rendered project versions kept in memory.
+        PROJECT_CACHE_SIZE=256,
+        # File to which the counts of the rules used by the instructions are
+        # added (see scripts/rule_report.py), or None to not count them.
+        RULE_PROFILE=None,
+        # sqlite file holding the facts learned from the instructions, or
+        # None to keep them in the memory of every process.
+        KNOWLEDGE_DB=None,
+        # Project updates are written to the database by a background
+        # thread, in batches, at most this many seconds after they are made,
+        # or as soon as WRITE_BEHIND_MAX_PENDING projects are waiting. None
+        # writes every update before the request returns.
+        WRITE_BEHIND_DELAY=0.5,
+        WRITE_BEHIND_MAX_PENDING=64,
+        # Number of requests that parse instructions at the same time; the
+        # others wait in a queue shared fairly between the users, and are
+        # answered with a 503 once ADMISSION_MAX_QUEUE requests are waiting
+        # or after waiting ADMISSION_MAX_WAIT seconds. None admits every
+        # request right away.
+        ADMISSION_MAX_ACTIVE=2,
+        ADMISSION_MAX_QUEUE=32,
+        ADMISSION_MAX_WAIT=10.0,
     )
 
     if test_config is None:
@@ -37,28 +92,148 @@ def create_app(test_config=None):
 
     # initialize the database
     db.init_db(app)
+    db.init_write_behind(app)
+
+    if app.config['INSTRUMENTATION']:
+        instrumentation.enable()
+    if app.config['RULE_PROFILE']:
+        profiler.enable(app.config['RULE_PROFILE'])
+    if app.config['KNOWLEDGE_DB']:
+        lab_rules.sem.learned = SemanticDatabase(app.config['KNOWLEDGE_DB'])
+
+    lab_rules.sem.parse_budget = ParseBudget(
+        max_edges=app.config['PARSE_MAX_EDGES'],
+        max_seconds=app.config['PARSE_MAX_SECONDS'],
+        max_trees=app.config['PARSE_MAX_TREES'])
+    if lab_rules.sem.parser_backend != app.config['PARSER_BACKEND']:
+        lab_rules.sem.parser_backend = app.config['PARSER_BACKEND']
+        lab_rules.sem.parser = None
+    segmenter.min_tokens = app.config['SEGMENT_MIN_TOKENS']
+
+    project_cache = ProjectResponseCache(app.config['PROJECT_CACHE_SIZE'])
+
+    admission = None
+    if app.config['ADMISSION_MAX_ACTIVE'] is not None:
+        admission = AdmissionController(
+            max_active=app.config['ADMISSION_MAX_ACTIVE'],
+            max_queue=app.config['ADMISSION_MAX_QUEUE'],
+            max_wait=app.config['ADMISSION_MAX_WAIT'])
+
+    # Make the requests that parse an instruction wait for their turn (see
+    # admission.py). Requests without a user name are queued by address.
+    def admitted(view):
+        @functools.wraps(view)
+        def admitted_view(*args, **kwargs):
+            if admission is None:
+                return view(*args, **kwargs)
+            waited = admission.admit(kwargs.get('user_name') or request.remote_addr)
+            instrumentation.add_time('admission_wait', waited)
+            start = time.time()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                admission.release(time.time() - start)
+        return admitted_view
+
+    @app.errorhandler(Overloaded)
+    def overloaded(error):
+        response = app.response_class(
+            json.dumps({'error': error.reason, 'retry_after': error.retry_after}),
+            status=503, mimetype='application/json')
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response
+
+    # The incremental parse of the instruction each user is typing, so that
+    # every new word only costs the work needed to extend the parse.
+    partial_sessions = {}
+    partial_sessions_lock = threading.Lock()
+
+    @app.before_request
+    def start_instrumentation_record():
+        if request.endpoint != 'metrics':
+            instrumentation.start_record(request.path)
+
+    @app.after_request
+    def note_response_status(response):
+        g.response_status = response.status_code
+        return response
+
+    # Run on teardown rather than after the request, so that the records of
+    # the requests that raise are finished too.
+    @app.teardown_request
+    def finish_instrumentation_record(exception):
+        if exception is not None:
+            instrumentation.finish_record(endpoint=request.endpoint, status=500,
+                                          error=repr(exception))
+        else:
+            instrumentation.finish_record(endpoint=request.endpoint,
+                                          status=g.get('response_status'))
+
+    # Report the instrumentation records collected so far along with
+    # aggregated timings per stage.
+    @app.route('/metrics')
+    def metrics():
+        report = {
+            'enabled': instrumentation.enabled,
+            'stages': instrumentation.summary(),
+            'records': instrumentation.records(),
+        }
+        asset_store = peek_default_asset_store()
+        if asset_store is not None:
+            report['assets'] = asset_store.stats()
+        if db.writer is not None:
+            report['write_behind'] = db.writer.stats()
+        if admission is not None:
+            report['admission'] = admission.stats()
+        return app.response_class(json.dumps(report),
+                                  mimetype='application/json')
 
     # This corresponds to a POST if it's the first instruction. If it's not, it
     # is a PUT. However, in actual use of the system, the client makes a get
     # request to the following URL (route) which then gets serviced by this code
     @app.route('/user/<user_name>/project/<project_name>/script/<raw_instruction>')
+    @admitted
     def process(user_name, project_name, raw_instruction):
          # "Inserted project into db" or 'Updated project'
-        print(_update_project(user_name, project_name, raw_instruction))
+        print(_update_project(user_name, project_name, raw_instruction)[0])
 
         # After updating the project, send the appropriate project state back to
         # client.
         return get_project(user_name, project_name)
 
+    # Like process, but only send back what the instruction changed. The
+    # client passes the version of the project it holds as base_version; if
+    # that is not the version the patch applies to, the full project is sent
+    # instead.
+    @app.route('/user/<user_name>/project/<project_name>/update/<raw_instruction>')
+    @admitted
+    def process_patch(user_name, project_name, raw_instruction):
+        message, project, patch = _update_project(user_name, project_name, raw_instruction)
+        print(message)
+        client_version = request.args.get('base_version', type=int)
+        if patch is None or (client_version is not None and
+                             client_version != patch['base_version']):
+            response = {'version': project.version,
+                        'project': json.loads(project.to_json())}
+        else:
+            response = patch
+        return app.response_class(json.dumps(response),
+                                  mimetype='application/json')
+
     def _update_project(user_name, project_name, raw_instruction):
         '''Args:
             project_name - name of project as stored in database
-            raw_instruction - the text representation of what the user said'''
+            raw_instruction - the text representation of what the user said
+        Returns:
+            (str, ScratchProject, dict): a status message, the updated project
+                and the patch describing the update (None if the instruction
+                was not understood)'''
         # Create or update a specific project with an instruction
         database = db.get_db()
 
-        project =  db.query_db('select * from projects where project_name = ? and author_id = ?',
-                [project_name, user_name], one=True)
+        project = db.get_project(project_name, user_name)
+        changes_to_add = process_single_instruction(raw_instruction)
+        patch = None
 
         if project is None:
             # No such project exists, create a new one
@@ -66,38 +241,51 @@ def create_app(test_config=None):
             project.name = project_name
             project.instructions = [raw_instruction]
             project.author = user_name
-            changes_to_add = process_single_instruction(raw_instruction)
-            project.update(changes_to_add)
+            if changes_to_add != "I don't understand.":
+                patch = project.update(changes_to_add)
             db.insert_into_db(project)
-            return "Inserted project into db"
+            return ("Inserted project into db", project, patch)
         else:
-            # TODO: properly read in the project object
-            project_object = ScratchProject(project)
-            # update the project_object appropriately...
-            changes_to_add = process_single_instruction(raw_instruction)
-            project_object.update(changes_to_add)
+            project.instructions.append(raw_instruction)
+            if changes_to_add != "I don't understand.":
+                patch = project.update(changes_to_add)
+            else:
+                # The instructions are stored all the same: the row is a new
+                # version (see write_behind.py).
+                project.version += 1
             # Update entry  for the projects
-            db.update(project_object)
-            return 'Updated project'
+            db.update(project)
+            return ('Updated project', project, patch)
 
     @app.route('/user/<user_name>/project/<project_name>')
     def get_project(user_name, project_name):
-        database = db.get_db()
-        project =  db.get_project(project_name, user_name)
+        # TODO: Rather than returning only the json that represents the project as expected by
+        # the scratch parser, how should we handle the information corresponding
+        # to the metadata of the project.
+        use_green_flag = request.args.get('useGreenFlag') == 'true'
+        return _get_project_helper(user_name, project_name, use_green_flag)
+
+    # Download the project as a Scratch 2.0 file that can be opened in the
+    # Scratch editor.
+    @app.route('/user/<user_name>/project/<project_name>/sb2')
+    def export_project(user_name, project_name):
+        project = db.get_project(project_name, user_name)
         if project is None:
-            # No such project exists, create a new one
             return 'No such project'
-        else:
-            # TODO: Rather than returning only the json that represents the project as expected by
-            # the scratch parser, how should we handle the information corresponding
-            # to the metadata of the project.
-            return str(project.to_json())
+        use_green_flag = request.args.get('useGreenFlag') == 'true'
+        sb2 = project.export_sb2(opt_use_green_flag=use_green_flag)
+        sb2.seek(0)
+        return send_file(sb2,
+                         mimetype='application/zip',
+                         as_attachment=True,
+                         attachment_filename=project_name + '.sb2')
 
     # TODO(quacht): Consider only returning
     # projects that are public.
     # This should return all projects stored in the database
     @app.route('/allprojects')
     def get_all_projects():
+        db.flush()
         database = db.get_db()
         user = {'id':'tina'}
         projects = db.query_db('select * from projects')
@@ -108,6 +296,7 @@ def create_app(test_config=None):
 
     @app.route('/user/<user_name>/allprojects')
     def get_all_projects_by(user_name):
+        db.flush()
         database = db.get_db()
         projects = db.query_db('select * from projects where author_id = ?', [user_name])
         # if len(projects) == 0:
@@ -117,23 +306,64 @@ def create_app(test_config=None):
 
     @app.route('/translate/<instruction>')
     @cross_origin()
+    @admitted
     def translate(instruction):
         result = process_single_instruction(instruction, False)
         return str(result)
 
+    # Report whether the instruction a user has typed or said so far can still
+    # be completed, and which categories of words may come next. Meant to be
+    # called after every word.
+    @app.route('/user/<user_name>/partial/<partial_instruction>')
+    @cross_origin()
+    @admitted
+    def parse_partial(user_name, partial_instruction):
+        with partial_sessions_lock:
+            if user_name not in partial_sessions:
+                partial_sessions[user_name] = (threading.Lock(),
+                                               new_partial_session())
+            lock, session = partial_sessions[user_name]
+        with lock:
+            status = process_partial_instruction(session, partial_instruction)
+        return app.response_class(json.dumps(status),
+                                  mimetype='application/json')
+
     # Get the project json for the user and project. If the use green flag
-    # option is set to true, then
+    # option is set to true, then every stack starts with a green flag hat
+    # block. The response carries an ETag derived from the project version
+    # (and the tables it is stored in): a client sending it back in
+    # If-None-Match gets a 304 if the project has not changed since. Rendered (and gzipped) bodies are cached per version.
     def _get_project_helper(user_name, project_name, opt_use_green_flag=False):
         database = db.get_db()
-        project =  db.get_project(project_name, user_name)
-        if project is None:
+        row = db.get_project_version(project_name, user_name)
+        if row is None:
             # No such project exists, create a new one
             return 'No such project'
+        project_id, version = row
+        etag = project_etag(db.tables_token, project_id, version, opt_use_green_flag)
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
         else:
-            return str(project.to_json(opt_use_green_flag))
+            rendered = project_cache.get(etag)
+            if rendered is None:
+                project = db.get_project(project_name, user_name)
+                # The project may have been updated since its version was read.
+                version = project.version
+                etag = project_etag(db.tables_token, project.id, version, opt_use_green_flag)
+                rendered = project_cache.put(etag, str(project.to_json(opt_use_green_flag)))
+            response = app.response_class(rendered.body)
+            if (len(rendered.body) >= app.config['GZIP_MIN_SIZE'] and
+                    'gzip' in request.accept_encodings):
+                response.set_data(rendered.gzipped())
+                response.headers['Content-Encoding'] = 'gzip'
+            response.headers['Vary'] = 'Accept-Encoding'
+        response.set_etag(etag)
+        response.headers['X-Project-Version'] = str(version)
+        return response
 
     @app.route('/user/<user_name>/scratch_program/<project_name>', methods=["POST"])
     @cross_origin(allow_headers=['Content-Type'], methods=["POST"], send_wildcard=True)
+    @admitted
     def generate_project_without_store(user_name, project_name):
         if request.method =="POST":
             print("get json")
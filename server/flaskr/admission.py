@@ -0,0 +1,129 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+class Overloaded(Exception):
+	"""Raised when a request is turned away; retry_after is the number of
+	seconds after which the client may try again."""
+	def __init__(self, reason, retry_after):
+		Exception.__init__(self, reason)
+		self.reason = reason
+		self.retry_after = retry_after
+
+class _Ticket(object):
+	def __init__(self, user):
+		self.user = user
+		self.admitted = False
+		self.queued_at = time.time()
+
+class AdmissionController(object):
+	"""
+	Bounds the number of requests parsing at the same time. Parsing is bound
+	by the CPU, so requests beyond max_active would only slow down the ones
+	already running: they wait in a queue instead, and are admitted as the
+	running ones finish.
+
+	Waiting requests are queued per user and admitted from the users in
+	turn, so that one user sending many requests does not hold up the
+	others. A request is turned away (Overloaded) when max_queue requests are
+	already waiting, or when it has waited max_wait seconds.
+
+	Args:
+		max_active (int): number of requests admitted at the same time
+		max_queue (int): number of requests that may wait
+		max_wait (float): longest time in seconds a request waits
+	"""
+	def __init__(self, max_active=2, max_queue=32, max_wait=10.0):
+		self.max_active = max_active
+		self.max_queue = max_queue
+		self.max_wait = max_wait
+		self._active = 0
+		self._queued = 0
+		# user -> deque of waiting tickets, in the order the users are served
+		self._queues = OrderedDict()
+		self._condition = threading.Condition()
+		# Recent service and queue times, in seconds.
+		self._service_times = deque(maxlen=100)
+		self._wait_times = deque(maxlen=1000)
+		self._stats = {'admitted': 0, 'queued': 0, 'rejected': 0,
+					   'timed_out': 0, 'max_queue_depth': 0}
+
+	def retry_after(self):
+		"""Seconds until the requests waiting now are likely to be served."""
+		if self._service_times:
+			service = sum(self._service_times) / len(self._service_times)
+		else:
+			service = 1.0
+		return int(math.ceil(service * (self._queued + 1) / self.max_active))
+
+	def admit(self, user):
+		"""
+		Wait until a request of the user may run.
+
+		Returns:
+			float: the time in seconds the request waited
+		"""
+		with self._condition:
+			if self._active < self.max_active and not self._queued:
+				self._active += 1
+				self._stats['admitted'] += 1
+				self._wait_times.append(0.0)
+				return 0.0
+			if self._queued >= self.max_queue:
+				self._stats['rejected'] += 1
+				raise Overloaded('too many requests are waiting', self.retry_after())
+			ticket = _Ticket(user)
+			self._queues.setdefault(user, deque()).append(ticket)
+			self._queued += 1
+			self._stats['queued'] += 1
+			self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'],
+												 self._queued)
+			deadline = ticket.queued_at + self.max_wait
+			while not ticket.admitted:
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					self._remove(ticket)
+					self._stats['timed_out'] += 1
+					raise Overloaded('the request waited too long', self.retry_after())
+				self._condition.wait(remaining)
+			waited = time.time() - ticket.queued_at
+			self._stats['admitted'] += 1
+			self._wait_times.append(waited)
+			return waited
+
+	def release(self, service_time=None):
+		"""Let the next waiting request run, once an admitted one is done."""
+		with self._condition:
+			if service_time is not None:
+				self._service_times.append(service_time)
+			self._active -= 1
+			while self._queues and self._active < self.max_active:
+				# The user first in turn goes to the end of the turn.
+				user, tickets = self._queues.popitem(last=False)
+				ticket = tickets.popleft()
+				if tickets:
+					self._queues[user] = tickets
+				self._queued -= 1
+				self._active += 1
+				ticket.admitted = True
+			self._condition.notify_all()
+
+	def _remove(self, ticket):
+		tickets = self._queues[ticket.user]
+		tickets.remove(ticket)
+		if not tickets:
+			del self._queues[ticket.user]
+		self._queued -= 1
+
+	def stats(self):
+		with self._condition:
+			stats = dict(self._stats)
+			stats['active'] = self._active
+			stats['queue_depth'] = self._queued
+			waits = sorted(self._wait_times)
+		if waits:
+			stats['mean_wait'] = sum(waits) / len(waits)
+			stats['p95_wait'] = waits[min(len(waits) - 1, int(0.95 * len(waits)))]
+			stats['max_wait'] = waits[-1]
+		return stats
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+
+# Directory holding the image and sound files of the base project and of the
+# sounds in the library.
+DEFAULT_ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	'..', '..', 'test_fixtures', 'generate_sb2_fixture_with_assets')
+
+ASSET_EXTENSIONS = ('png', 'svg', 'wav', 'jpg')
+
+def iter_asset_references(project):
+	"""
+	Yield every asset reference of a project dictionary, as a tuple
+	(kind, holder, id_key, md5_key): kind is 'image' or 'sound', and
+	holder[md5_key] is the md5 name of the asset while holder[id_key] is the
+	number of its file in the .sb2 archive.
+	"""
+	for obj in [project] + project.get('children', []):
+		if 'penLayerMD5' in obj:
+			yield ('image', obj, 'penLayerID', 'penLayerMD5')
+		for costume in obj.get('costumes', []):
+			yield ('image', costume, 'baseLayerID', 'baseLayerMD5')
+			if 'textLayerMD5' in costume:
+				yield ('image', costume, 'textLayerID', 'textLayerMD5')
+		for sound in obj.get('sounds', []):
+			yield ('sound', sound, 'soundID', 'md5')
+
+def _is_md5_name(file_name):
+	digest = file_name.rsplit('.', 1)[0]
+	return len(digest) == 32 and all(c in '0123456789abcdef' for c in digest)
+
+class _Asset(object):
+	__slots__ = ('path', 'data', 'mapping', 'hits', 'verified')
+
+	def __init__(self, path=None, data=None, verified=False):
+		self.path = path
+		self.data = data
+		self.mapping = None
+		self.hits = 0
+		self.verified = verified
+
+class AssetStore(object):
+	"""
+	Content-addressed store of project assets, keyed by the md5 name Scratch
+	uses to refer to them ("<md5 of the contents>.<extension>").
+
+	Asset files are memory-mapped read-only the first time they are asked
+	for, and the same mapping is handed to every later export, so the bytes
+	are read from disk at most once whatever the number of exports. The md5
+	of a file is only checked when it is first mapped. Files whose name is
+	not their md5 name are identified through the project.json stored next
+	to them, or else hashed when the directory is added.
+	"""
+	def __init__(self, asset_dirs=(), verify=True):
+		self.verify = verify
+		self._assets = {}
+		self._lock = threading.Lock()
+		for asset_dir in asset_dirs:
+			self.add_directory(asset_dir)
+
+	def add_directory(self, asset_dir):
+		"""Index every asset file of the directory."""
+		# A project.json saved alongside the assets (as in an unpacked .sb2)
+		# tells which md5 name each numbered file has.
+		md5_names = {}
+		manifest_path = os.path.join(asset_dir, 'project.json')
+		if os.path.exists(manifest_path):
+			with open(manifest_path) as f:
+				manifest = json.load(f)
+			for kind, holder, id_key, md5_key in iter_asset_references(manifest):
+				md5_name = holder[md5_key]
+				ext = md5_name.rsplit('.', 1)[-1]
+				md5_names['%d.%s'%(holder[id_key], ext)] = md5_name
+
+		for file_name in sorted(os.listdir(asset_dir)):
+			ext = file_name.rsplit('.', 1)[-1].lower()
+			if ext not in ASSET_EXTENSIONS:
+				continue
+			path = os.path.join(asset_dir, file_name)
+			if _is_md5_name(file_name):
+				self.add_file(path, file_name)
+			else:
+				self.add_file(path, md5_names.get(file_name))
+
+	def add_file(self, path, md5_name=None):
+		"""
+		Index an asset file under its md5 name. The file is hashed right
+		away if the name is not given.
+		"""
+		verified = False
+		if md5_name is None:
+			with open(path, 'rb') as f:
+				md5_name = hashlib.md5(f.read()).hexdigest() + '.' + path.rsplit('.', 1)[-1].lower()
+			verified = True
+		with self._lock:
+			if md5_name not in self._assets:
+				self._assets[md5_name] = _Asset(path=path, verified=verified)
+		return md5_name
+
+	def add(self, data, ext):
+		"""Store the bytes of an asset and return its md5 name."""
+		md5_name = hashlib.md5(data).hexdigest() + '.' + ext
+		with self._lock:
+			if md5_name not in self._assets:
+				self._assets[md5_name] = _Asset(data=data, verified=True)
+		return md5_name
+
+	def get(self, md5_name):
+		"""
+		Return the bytes of an asset as a read-only buffer (a str, or a
+		buffer over the mapped file), or None if the store does not hold a
+		valid copy of it.
+		"""
+		asset = self._assets.get(md5_name)
+		if asset is None:
+			return None
+		with self._lock:
+			if asset.data is None and asset.path is not None:
+				asset.mapping = self._map(asset.path)
+				asset.data = buffer(asset.mapping) if asset.mapping else ''
+				asset.path = None
+			if not asset.verified and asset.data is not None:
+				if self.verify and hashlib.md5(asset.data).hexdigest() != md5_name.rsplit('.', 1)[0]:
+					print("[WARNING] Asset %s does not match its md5"%(md5_name))
+					if asset.mapping is not None:
+						asset.mapping.close()
+					del self._assets[md5_name]
+					return None
+				asset.verified = True
+			asset.hits += 1
+			return asset.data
+
+	def _map(self, path):
+		with open(path, 'rb') as f:
+			if os.fstat(f.fileno()).st_size == 0:
+				return None
+			return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def hit_counts(self):
+		"""Return the number of times each asset has been handed out."""
+		with self._lock:
+			return dict((name, asset.hits) for name, asset in self._assets.items())
+
+	def stats(self):
+		with self._lock:
+			return dict((name, {
+					'hits': asset.hits,
+					'mapped': asset.mapping is not None,
+					'verified': asset.verified,
+					'size': len(asset.data) if asset.data is not None else os.path.getsize(asset.path),
+				}) for name, asset in self._assets.items())
+
+	def close(self):
+		"""Unmap every asset file."""
+		with self._lock:
+			for asset in self._assets.values():
+				if asset.mapping is not None:
+					asset.mapping.close()
+			self._assets.clear()
+
+	def __contains__(self, md5_name):
+		return md5_name in self._assets
+
+	def __len__(self):
+		return len(self._assets)
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_default_asset_store():
+	"""The store of the assets in DEFAULT_ASSET_DIR, indexed on first use and
+	shared by every export."""
+	global _default_store
+	with _default_store_lock:
+		if _default_store is None:
+			_default_store = AssetStore([DEFAULT_ASSET_DIR])
+	return _default_store
+
+def peek_default_asset_store():
+	"""The default store if it has been created, else None."""
+	return _default_store
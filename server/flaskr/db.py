@@ -3,9 +3,18 @@ from flask import g
 import uuid
 import sys
 from scratch_project import ScratchProject
+from write_behind import ProjectWriteBehind, project_row
 
 DATABASE = 'database.db'
 
+# Identifies the tables created by init_db, which drops the previous ones
+# (see project_cache.project_etag).
+tables_token = None
+
+# The queue through which project updates are written, or None to write them
+# before the request returns (see init_write_behind).
+writer = None
+
 def get_db():
 	db = getattr(g, '_database', None)
 
@@ -28,12 +37,30 @@ def query_db(query, args=(), one=False):
 	return (rv[0] if rv else None) if one else rv
 
 def init_db(app):
+	global tables_token
+	tables_token = uuid.uuid4().hex[:12]
 	with app.app_context():
 		db = get_db()
 		with app.open_resource('schema.sql', mode='r') as f:
 			db.cursor().executescript(f.read())
 		db.commit()
 
+def init_write_behind(app):
+	global writer
+	if writer is not None:
+		writer.close()
+	if app.config['WRITE_BEHIND_DELAY'] is None:
+		writer = None
+	else:
+		writer = ProjectWriteBehind(DATABASE,
+									max_delay=app.config['WRITE_BEHIND_DELAY'],
+									max_pending=app.config['WRITE_BEHIND_MAX_PENDING'])
+
+# Write the updates still waiting in the write-behind queue.
+def flush():
+	if writer is not None:
+		writer.flush()
+
 # Given a ScratchProject object, we either update an existing project entry or
 # create a new entry into the database
 def insert_into_db(project):
@@ -44,10 +71,12 @@ def insert_into_db(project):
 	project_name = project.name;
 	instructions = str(project.instructions)
 	project_json = project.to_json()
-	cur.execute("INSERT INTO projects (author_id,project_name,instructions,json) VALUES (?,?,?,?)", (author_id,project_name,instructions,project_json))
+	cur.execute("INSERT INTO projects (author_id,project_name,instructions,json,version) VALUES (?,?,?,?,?)", (author_id,project_name,instructions,project_json,project.version))
 	db.commit()
 
 def update(project):
+	if writer is not None and writer.put(project_row(project)):
+		return "Updated project"
 	db = get_db()
 	cur = db.cursor()
 	author_id = project.author
@@ -55,18 +84,28 @@ def update(project):
 	project_name = project.name;
 	instructions = str(project.instructions)
 	project_json = project.to_json()
-	cur.execute("REPLACE INTO projects (author_id,project_name,instructions,json) VALUES (?,?,?,?)", (author_id,project_name,instructions,project_json))
+	cur.execute("UPDATE projects SET instructions = ?, json = ?, version = ? WHERE author_id = ? AND project_name = ?", (instructions,project_json,project.version,author_id,project_name))
 	db.commit()
 	return "Updated project"
 
 # When I get a project, in what format do I want it
 def get_project(project_name, author_id):
 	scratch_project = None
-	db = get_db()
-	project = query_db('select * from projects where project_name = ? and author_id = ?',
-				[project_name, author_id], one=True)
+	project = writer.get(author_id, project_name) if writer is not None else None
+	if project is None:
+		project = query_db('select * from projects where project_name = ? and author_id = ?',
+					[project_name, author_id], one=True)
 	if project:
 		# Create a ScratchObject from the representation stored in the database.
 		print("This is what the database query returns to me")
 		scratch_project = ScratchProject(project)
 	return scratch_project
+
+# Get the (id, version) of a project without loading it, or None if there is
+# no such project.
+def get_project_version(project_name, author_id):
+	row = writer.get(author_id, project_name) if writer is not None else None
+	if row is not None:
+		return (row[0], row[6])
+	return query_db('select id, version from projects where project_name = ? and author_id = ?',
+				[project_name, author_id], one=True)
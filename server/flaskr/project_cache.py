@@ -0,0 +1,66 @@
+import gzip
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+def project_etag(tables_token, project_id, version, opt_use_green_flag=False):
+	"""The (unquoted) entity tag of a stored project: it changes with every
+	update. Project ids and versions start over when the tables are created
+	again, so the tag also holds the token of the tables (see db.init_db)."""
+	return '%s-%s-%d%s'%(tables_token, project_id, version,
+						 '-gf' if opt_use_green_flag else '')
+
+def gzip_bytes(data, compresslevel=6):
+	buf = BytesIO()
+	f = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=compresslevel, mtime=0)
+	try:
+		f.write(data)
+	finally:
+		f.close()
+	return buf.getvalue()
+
+class RenderedProject(object):
+	"""The json of one version of a project, and its gzipped form once it has
+	been asked for."""
+	def __init__(self, etag, body):
+		self.etag = etag
+		self.body = body
+		self._gzipped = None
+		self._lock = threading.Lock()
+
+	def gzipped(self):
+		with self._lock:
+			if self._gzipped is None:
+				self._gzipped = gzip_bytes(self.body)
+			return self._gzipped
+
+class ProjectResponseCache(object):
+	"""
+	Least recently used cache of rendered projects, keyed by entity tag. As
+	the tag changes with the project version, entries never go stale; older
+	versions simply fall out of the cache.
+	"""
+	def __init__(self, max_entries=256):
+		self.max_entries = max_entries
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, etag):
+		with self._lock:
+			rendered = self._entries.pop(etag, None)
+			if rendered is not None:
+				self._entries[etag] = rendered
+			return rendered
+
+	def put(self, etag, body):
+		rendered = RenderedProject(etag, body)
+		with self._lock:
+			self._entries.pop(etag, None)
+			self._entries[etag] = rendered
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+		return rendered
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
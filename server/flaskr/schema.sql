@@ -6,5 +6,7 @@ CREATE TABLE projects (
   created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   project_name TEXT NOT NULL,
   instructions TEXT NOT NULL,
-  json TEXT
+  json TEXT,
+  version INTEGER NOT NULL DEFAULT 0,
+  UNIQUE (author_id, project_name)
 );
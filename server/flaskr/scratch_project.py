@@ -1,12 +1,18 @@
+import ast
 import os
-from zipfile import ZipFile
+from io import BytesIO
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 import sys
 import json
 import time
 from scratch_project_base import ScratchProjectBase
 from sounds import get_sounds_in_set
+from assets import get_default_asset_store, iter_asset_references
 import copy
 
+sys.path.insert(0,'../software/')
+from lab3.instrumentation import instrumentation
+
 class ScratchProject(ScratchProjectBase):
 	def __init__(self, opt_db_info=None):
 		ScratchProjectBase.__init__(self)
@@ -26,17 +32,41 @@ class ScratchProject(ScratchProjectBase):
 			self.author = None
 			self.instructions = None
 			self.id = None
+			self.version = 0
 
 	def load_from_db(self, db_tuple):
 		self.id = db_tuple[0]
 		self.author = db_tuple[1]
 		self.created = db_tuple[2]
 		self.name = db_tuple[3]
-		self.instructions = db_tuple[4]
+		self.instructions = parse_instructions(db_tuple[4])
 		self.json = json.loads(db_tuple[5])
+		self.version = db_tuple[6] if len(db_tuple) > 6 else 0
+		self._restore_state_from_json()
+
+	def _restore_state_from_json(self):
+		"""Rebuild the variables, lists, sounds and script stacks from the
+		stored project json, the inverse of to_json."""
+		sprite1 = self.json["children"][0]
+		self.variables = dict((v["name"], v["value"]) for v in sprite1.get("variables", []))
+		self.lists = dict((l["listName"], l["contents"]) for l in sprite1.get("lists", []))
+		self.sounds = set(sound["soundName"] for sound in sprite1.get("sounds", []))
+		stacks = sprite1.get("scripts", [])
+		# to_json always stores the scripts of the current stack last.
+		self.stacks = stacks[:-1]
+		self.scripts = stacks[-1][2] if stacks else []
 
 	def update(self, changes):
-		"""Given changes to add, update representation of the Scratch Project."""
+		"""Given changes to add, update representation of the Scratch Project.
+
+		Returns:
+			dict: a patch describing what changed, see make_patch.
+		"""
+		old_variables = copy.deepcopy(self.variables)
+		old_lists = copy.deepcopy(self.lists)
+		old_sounds = set(self.sounds)
+		first_changed_stack = len(self.stacks)
+
 		for x in changes["sounds"]:
 			self.sounds.add(x)
 		for x in changes["variables"]:
@@ -45,19 +75,60 @@ class ScratchProject(ScratchProjectBase):
 			self.add_list(x, changes["lists"][x])
 
 		# remove any variables or lists or sounds that were deleted.
-		for var in self.variables:
+		for var in list(self.variables):
 			if var not in changes["variables"]:
 				del self.variables[var]
-		for var in self.lists:
+		for var in list(self.lists):
 			if var not in changes["lists"]:
 				del self.lists[var]
-		for var in self.sounds:
+		for var in list(self.sounds):
 			if var not in changes["sounds"]:
 				self.sounds.remove(var)
 
 		for script in changes["scripts"]:
 			self.add_script(script)
 
+		base_version = self.version
+		self.version += 1
+		return self.make_patch(base_version, old_variables, old_lists,
+							   old_sounds, first_changed_stack)
+
+	def make_patch(self, base_version, old_variables, old_lists, old_sounds,
+				   first_changed_stack):
+		"""
+		Describe the difference between an earlier state of the project and
+		its current state.
+
+		Returns:
+			dict: with the keys
+				base_version, version: the versions the patch goes from and to
+				scripts: {'from': i, 'stacks': [...]}, the stacks that replace
+					the sprite's scripts from index i onwards
+				variables, lists: {'set': {name: value}, 'removed': [name]}
+				sounds: {'added': [sound], 'removed': [name]}
+		"""
+		def diff(old, new):
+			return {
+				'set': dict((k, v) for k, v in new.items() if k not in old or old[k] != v),
+				'removed': [k for k in old if k not in new],
+			}
+
+		current_stacks = self.stacks + [[5, 128, self.scripts]]
+		return {
+			'base_version': base_version,
+			'version': self.version,
+			'scripts': {
+				'from': first_changed_stack,
+				'stacks': current_stacks[first_changed_stack:],
+			},
+			'variables': diff(old_variables, self.variables),
+			'lists': diff(old_lists, self.lists),
+			'sounds': {
+				'added': get_sounds_in_set(self.sounds - old_sounds),
+				'removed': list(old_sounds - self.sounds),
+			},
+		}
+
 	def add_variable(self,name, opt_value=0):
 		"""Create a variable initialized to 0"""
 		self.variables[name] = opt_value
@@ -104,6 +175,10 @@ class ScratchProject(ScratchProjectBase):
 		return new_dict
 
 	def to_json(self, opt_use_green_flag=False):
+		with instrumentation.timer('to_json'):
+			return self._to_json(opt_use_green_flag)
+
+	def _to_json(self, opt_use_green_flag=False):
 		sprite1 = self.json["children"][0]
 		sprite1["variables"] = []
 		for key, value in self.variables.items():
@@ -134,26 +209,83 @@ class ScratchProject(ScratchProjectBase):
 			dict_representation = self._copy_with_green_flag(self.json)
 		return json.dumps(dict_representation)
 
-	def save_project(self, path_to_output_dir):
-		raw_project_path = '/afs/athena.mit.edu/course/6/6.863/spring2018/cgw/teams/pistachio-conkers/final_project/scratchNLP/test_fixtures/generate_sb2_fixture_with_assets'
-		# write the project.json into a file
-		with open(os.path.join(raw_project_path, 'project.json'), 'w+') as f:
-			f.write(self.to_json())
-		# zip and rename the file
-		project_name = 'scratchNLPdemo'
-		current_dir = os.getcwd()
-		os.chdir(raw_project_path)
+	def export_sb2(self, fileobj=None, opt_use_green_flag=False, asset_store=None):
+		"""
+		Write the project as a Scratch 2.0 (.sb2) archive holding the
+		project.json and the assets it references.
+
+		Args:
+			fileobj: file-like object to write the archive to. If None, the
+				archive is built in memory.
+			asset_store (AssetStore): where to take the asset bytes from.
+				Defaults to the shared store of the assets shipped with the
+				base project.
+
+		Returns:
+			the file-like object holding the archive
+		"""
+		if fileobj is None:
+			fileobj = BytesIO()
+		if asset_store is None:
+			asset_store = get_default_asset_store()
+		project = json.loads(self.to_json(opt_use_green_flag))
+		assets = _number_assets(project)
 
-		zipfile_path = os.path.join(raw_project_path, project_name + '.zip')
-		os.system('zip -r ' + zipfile_path + ' ./*')
+		archive = ZipFile(fileobj, 'w', ZIP_DEFLATED)
+		try:
+			archive.writestr('project.json', json.dumps(project))
+			for file_name, md5_name in assets:
+				data = asset_store.get(md5_name)
+				if data is None:
+					print("[WARNING] Missing asset " + md5_name)
+					continue
+				# Images and sounds are already compressed.
+				archive.writestr(file_name, data, ZIP_STORED)
+		finally:
+			archive.close()
+		return fileobj
 
+	def save_project(self, path_to_output_dir, project_name='scratchNLPdemo'):
+		"""Write the project to <path_to_output_dir>/<project_name>.sb2 and
+		return the path of the file."""
 		# if path the specified output directory doesn't exist yet, create the
 		# folder accordingly.
 		if not os.path.exists(path_to_output_dir):
 				os.makedirs(path_to_output_dir)
 		sb2_path = os.path.join(path_to_output_dir, project_name + '.sb2')
-		print('sb2_path is ' + sb2_path)
+		with open(sb2_path, 'wb') as f:
+			self.export_sb2(f)
+		return sb2_path
+
+def parse_instructions(stored_instructions):
+	"""The database stores the list of instructions as its str()."""
+	try:
+		instructions = ast.literal_eval(stored_instructions)
+	except (ValueError, SyntaxError):
+		return [stored_instructions]
+	if not isinstance(instructions, list):
+		return [stored_instructions]
+	return instructions
+
+def _number_assets(project):
+	"""
+	Give every distinct asset referenced by the project an ID, as .sb2 files
+	name their assets "<ID>.<extension>", and update the references in the
+	project dictionary to match. Images and sounds are numbered separately.
+
+	Returns:
+		list of (str, str): the file name and md5 name of every asset
+	"""
+	ids = {'image': {}, 'sound': {}}
+	assets = []
 
-		os.system('mv ' + zipfile_path + ' ' + sb2_path)
-		os.chdir(current_dir)
+	def number(kind, md5_name):
+		if md5_name not in ids[kind]:
+			ids[kind][md5_name] = len(ids[kind])
+			ext = md5_name.rsplit('.', 1)[-1]
+			assets.append(('%d.%s'%(ids[kind][md5_name], ext), md5_name))
+		return ids[kind][md5_name]
 
+	for kind, holder, id_key, md5_key in iter_asset_references(project):
+		holder[id_key] = number(kind, holder[md5_key])
+	return assets
@@ -3720,14 +3720,21 @@ sounds = [{
 	        ]
 	    }]
 
+_sound_map = None
+
 def get_sound_map():
-	counter = 0
-	soundmap = {}
-	for sound in sounds:
-		sound["soundID"] = counter
-		soundmap[sound["soundName"]] = sound
-		counter += 1
-	return soundmap
+	"""Map every sound name to its sound. The map is built on first use and
+	shared by every later call (the sounds never change)."""
+	global _sound_map
+	if _sound_map is None:
+		counter = 0
+		soundmap = {}
+		for sound in sounds:
+			sound["soundID"] = counter
+			soundmap[sound["soundName"]] = sound
+			counter += 1
+		_sound_map = soundmap
+	return _sound_map
 
 def get_sounds():
 	counter = 0
@@ -3737,8 +3744,12 @@ def get_sounds():
 	return sounds
 
 def get_sounds_in_set(soundNames):
+	"""The sounds of the catalog with the given names. Names that are not in
+	the catalog (the grammar takes sound names from the instructions) have no
+	sound data, and are left out."""
 	filteredList = []
 	soundmap = get_sound_map()
 	for name in soundNames:
-		filteredList.append(soundmap[name])
+		if name in soundmap:
+			filteredList.append(soundmap[name])
 	return filteredList
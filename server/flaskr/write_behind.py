@@ -0,0 +1,204 @@
+import atexit
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+def project_row(project):
+	"""The row of the projects table holding a ScratchProject, as returned by
+	'select * from projects'."""
+	return (project.id, project.author, project.created, project.name,
+			str(project.instructions), project.to_json(), project.version)
+
+class ProjectWriteBehind(object):
+	"""
+	Queue of the project updates waiting to be written to the database.
+
+	An update is queued along with the row it writes and the request returns
+	right away; a background thread writes the queued rows in one transaction
+	at most max_delay seconds after the oldest of them was queued, or as soon
+	as max_pending projects are waiting. Updates of the same project that are
+	queued before it is written are coalesced into the last one.
+
+	Until a row is written, get() returns it in place of the one in the
+	database, so that a process reads the updates it made. Other processes
+	using the same database only see them once they are written, so
+	processes that update the same projects should not use a write-behind
+	queue: an update based on an older version than the one another process
+	has written in the meantime is not written, and is counted as a conflict
+	(and reported on stderr) instead.
+
+	Args:
+		database (str): the sqlite file of the projects
+		max_delay (float): longest time in seconds an update waits before it
+			is written, which bounds the updates lost if the process dies
+		max_pending (int): number of waiting projects at which they are
+			written without waiting for max_delay
+	"""
+	def __init__(self, database, max_delay=0.5, max_pending=64):
+		self.database = database
+		self.max_delay = max_delay
+		self.max_pending = max_pending
+		# (author_id, project_name) -> (row, time it was first queued)
+		self._pending = OrderedDict()
+		# The rows being written, still returned by get() until they are.
+		self._writing = {}
+		self._condition = threading.Condition()
+		self._thread = None
+		self._pid = None
+		self._closed = False
+		self._flush_requested = False
+		self._stats = {'queued': 0, 'coalesced': 0, 'written': 0,
+					   'conflicts': 0, 'batches': 0, 'errors': 0, 'max_lag': 0.0}
+
+	def _start(self):
+		# Threads do not survive a fork: every process that queues an update
+		# starts its own writer.
+		if self._pid != os.getpid():
+			self._pending.clear()
+			self._writing.clear()
+			self._pid = os.getpid()
+			self._closed = False
+			self._thread = threading.Thread(target=self._run,
+											name='project-write-behind')
+			self._thread.daemon = True
+			self._thread.start()
+			atexit.register(self.close)
+
+	def put(self, row):
+		"""
+		Queue the row of a project that is already in the database.
+
+		Returns:
+			bool: False if the writer has been closed, and the row is to be
+				written by the caller
+		"""
+		key = (row[1], row[3])
+		with self._condition:
+			self._start()
+			if self._closed:
+				return False
+			self._stats['queued'] += 1
+			if key in self._pending:
+				self._stats['coalesced'] += 1
+				queued_at = self._pending[key][1]
+			else:
+				queued_at = time.time()
+			self._pending[key] = (row, queued_at)
+			if len(self._pending) in (1, self.max_pending):
+				self._condition.notify_all()
+			return True
+
+	def get(self, author_id, project_name):
+		"""The row of a project waiting to be written, or None."""
+		key = (author_id, project_name)
+		with self._condition:
+			if self._pid != os.getpid():
+				return None
+			entry = self._pending.get(key)
+			if entry is not None:
+				return entry[0]
+			return self._writing.get(key)
+
+	def flush(self):
+		"""Write every waiting update, and wait until it is written."""
+		with self._condition:
+			if self._pid != os.getpid():
+				return
+			while (self._pending or self._writing) and self._thread.is_alive():
+				self._flush_requested = True
+				self._condition.notify_all()
+				self._condition.wait(0.1)
+
+	def close(self):
+		"""Write every waiting update and stop the writer."""
+		with self._condition:
+			if self._pid != os.getpid() or self._closed:
+				return
+			self._closed = True
+			self._condition.notify_all()
+		self._thread.join()
+
+	def stats(self):
+		with self._condition:
+			stats = dict(self._stats)
+			stats['pending'] = len(self._pending) + len(self._writing)
+		return stats
+
+	def _next_batch(self):
+		"""Wait until the waiting rows are due, and take them."""
+		with self._condition:
+			while True:
+				if self._pending:
+					oldest = next(iter(self._pending.values()))[1]
+					wait = oldest + self.max_delay - time.time()
+					if (wait <= 0 or self._closed or self._flush_requested or
+							len(self._pending) >= self.max_pending):
+						break
+				elif self._closed:
+					return None
+				else:
+					wait = None
+				self._condition.wait(wait)
+			self._flush_requested = False
+			batch, self._pending = self._pending, OrderedDict()
+			self._writing = dict((key, entry[0]) for key, entry in batch.items())
+			return batch
+
+	def _run(self):
+		connection = sqlite3.connect(self.database, timeout=30)
+		try:
+			while True:
+				batch = self._next_batch()
+				if batch is None:
+					return
+				conflicts = []
+				try:
+					with connection:
+						for key, (row, _) in batch.items():
+							cursor = connection.execute(
+								# A newer version written by another process is
+								# kept.
+								"UPDATE projects SET instructions = ?, json = ?, version = ? WHERE author_id = ? AND project_name = ? AND version < ?",
+								(row[4], row[5], row[6], row[1], row[3], row[6]))
+							if cursor.rowcount == 0:
+								conflicts.append((key, row[6]))
+				except Exception:
+					traceback.print_exc(file=sys.stderr)
+					with self._condition:
+						self._stats['errors'] += 1
+						if self._closed:
+							sys.stderr.write("[write-behind] Lost the updates of %d projects\n"
+											 %(len(batch)))
+							self._writing = {}
+							self._condition.notify_all()
+							return
+						# Write the rows again with the next batch, unless
+						# the project has been updated since.
+						for key, entry in batch.items():
+							if key not in self._pending:
+								self._pending[key] = entry
+						self._writing = {}
+						self._condition.notify_all()
+					# Do not retry a failing database in a tight loop.
+					time.sleep(self.max_delay)
+					continue
+				for (author_id, project_name), version in conflicts:
+					sys.stderr.write("[write-behind] Version %d of the project %s of %s "
+									 "was not written: the database holds a newer one "
+									 "or none\n"%(version, project_name, author_id))
+				now = time.time()
+				with self._condition:
+					self._stats['written'] += len(batch) - len(conflicts)
+					self._stats['conflicts'] += len(conflicts)
+					self._stats['batches'] += 1
+					self._stats['max_lag'] = max(
+						[self._stats['max_lag']] +
+						[now - queued_at for _, queued_at in batch.values()])
+					self._writing = {}
+					self._condition.notify_all()
+		finally:
+			connection.close()
@@ -0,0 +1,265 @@
+"""
+Preforking launcher for the ScratchNLP server.
+
+    python prefork.py --workers 4 --port 5000
+
+The master process builds the state the workers share (the grammar and
+its parser, the WordNet synonyms pulled in by the rules, the sound catalog
+and the asset index), then forks the workers. Each worker serves requests
+on the listening socket of the master, so the pages holding the shared
+state are copied only when a worker writes to them. The grammar and its
+parser are only shared until a worker parses an instruction with a word the
+grammar does not know: the word is added to the grammar of that worker,
+which then builds a parser of its own. (Partial instructions do not change
+the grammar, see lab3/parse_session.py.)
+
+The cyclic garbage collector writes to the header of every object it
+visits, which would copy the whole shared heap into every worker on the
+first full collection. On Python 3.7 and later the shared objects are
+moved out of its reach with gc.freeze(). On older versions (Python 2)
+the collections that visit the oldest generation (where every object alive
+before the fork ends up) are made very rare instead. New objects are still
+collected by the younger generations, but garbage cycles that outlive them
+are then almost never freed, so the workers leak them: on these versions
+workers are replaced after DEFAULT_MAX_REQUESTS requests unless
+--max_requests says otherwise.
+
+Workers that exit are replaced. --max_requests makes every worker exit
+after serving that many requests, which bounds the memory a worker can
+drift into. Each worker has its own copy of the state that requests
+change (the words added to the grammar, the partial parse sessions).
+"""
+
+import argparse
+import errno
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+from flaskr import create_app
+from flaskr import db as project_db
+from flaskr.assets import get_default_asset_store
+from flaskr.sounds import get_sound_map
+from lab3.profiler import profiler
+import semanticRules as lab_rules
+import generate_vocab as gv
+import semantic
+
+# A worker that exits sooner than this after it started is considered to
+# have crashed, and is only replaced after a delay.
+MIN_WORKER_LIFETIME = 1.0
+RESPAWN_DELAY = 1.0
+
+# Threshold of the oldest generation of the garbage collector once the
+# shared heap has been built, on Pythons without gc.freeze.
+OLDEST_GENERATION_THRESHOLD = 1000000
+
+# Number of requests after which a worker is replaced by default on
+# Pythons without gc.freeze, where it leaks the garbage cycles that reach
+# the oldest generation.
+DEFAULT_MAX_REQUESTS = 1000
+
+
+def _exit_worker(signum, frame):
+    sys.exit(0)
+
+
+def warm_up():
+    """Build the state the workers share."""
+    start = time.time()
+    sem_rule_set = lab_rules.sem
+    gv.generate_vocab_list(sem_rule_set)
+    sem_rule_set.construct_parser()
+    if semantic.segmenter.min_tokens is not None:
+        semantic.segmenter.index()
+    get_sound_map()
+    get_default_asset_store()
+    print("[prefork] Built the shared state in %.2fs"%(time.time() - start))
+
+
+def freeze_heap():
+    """Keep the garbage collector from touching the objects built so far."""
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    else:
+        threshold0, threshold1, _ = gc.get_threshold()
+        gc.set_threshold(threshold0, threshold1, OLDEST_GENERATION_THRESHOLD)
+
+
+def private_memory_kb(pid):
+    """
+    The memory of a process that is not shared with any other, in kB, or
+    None where /proc/<pid>/smaps is not available.
+    """
+    total = 0
+    try:
+        with open('/proc/%d/smaps'%(pid)) as f:
+            for line in f:
+                if line.startswith(('Private_Dirty:', 'Private_Clean:')):
+                    total += int(line.split()[1])
+    except IOError:
+        return None
+    return total
+
+
+class PreforkServer(object):
+    """
+    Args:
+        app (Flask): the application the workers serve
+        host (str), port (int): where to listen
+        workers (int): the number of worker processes
+        max_requests (int): number of requests after which a worker is
+            replaced, or None to keep workers for as long as they run
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=5000, workers=2,
+                 max_requests=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.max_requests = max_requests
+        self.socket = None
+        self.workers = {}
+        self.stopping = False
+
+    def bind(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(128)
+
+    def run(self):
+        if self.socket is None:
+            self.bind()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGUSR1, self._report_memory)
+        print("[prefork] Serving on http://%s:%d with %d workers"
+              %(self.host, self.port, self.num_workers))
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    break
+                raise
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            if time.time() - started < MIN_WORKER_LIFETIME:
+                print("[prefork] Worker %d exited right after it started "
+                      "(status %d)"%(pid, status))
+                time.sleep(RESPAWN_DELAY)
+            self.spawn_worker()
+        self.socket.close()
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.time()
+            return pid
+        # In the worker. os._exit skips the exit handlers, so the counts
+        # of the rule profiler and the waiting project updates are saved
+        # here.
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, _exit_worker)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+            self.serve()
+        except SystemExit:
+            pass
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            status = 1
+        finally:
+            try:
+                project_db.flush()
+                profiler.save()
+            finally:
+                os._exit(status)
+
+    def serve(self):
+        server = make_server(self.host, self.port, self.app,
+                             fd=self.socket.fileno())
+        if self.max_requests is None:
+            server.serve_forever()
+            return
+        for _ in range(self.max_requests):
+            server.handle_request()
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def _report_memory(self, signum, frame):
+        for pid in [os.getpid()] + sorted(self.workers):
+            print("[prefork] %s %d: %s kB private"
+                  %('master' if pid == os.getpid() else 'worker', pid,
+                    private_memory_kb(pid)))
+
+
+def parse_cli_args():
+    arg_parser = argparse.ArgumentParser(description='Run the ScratchNLP server with preforked workers.')
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=5000)
+    arg_parser.add_argument('--workers',
+                            type=int,
+                            default=2,
+                            help='number of worker processes.')
+    arg_parser.add_argument('--max_requests',
+                            type=int,
+                            default=None,
+                            help="""
+                                 replace a worker after it has served this
+                                 many requests (0 keeps workers for as long
+                                 as they run). By default workers are kept,
+                                 except on Pythons without gc.freeze, where
+                                 they are replaced after %d requests.
+                                 """%(DEFAULT_MAX_REQUESTS))
+    return arg_parser.parse_args()
+
+
+def max_requests(arg):
+    """The number of requests after which a worker is replaced, or None."""
+    if arg is None:
+        return None if hasattr(gc, 'freeze') else DEFAULT_MAX_REQUESTS
+    return arg or None
+
+
+def main():
+    args = parse_cli_args()
+    app = create_app()
+    # The write-behind queue only lets the process that made an update read
+    # it before it is written, and the workers share the projects: write
+    # every update before the request returns.
+    app.config['WRITE_BEHIND_DELAY'] = None
+    project_db.init_write_behind(app)
+    server = PreforkServer(app, args.host, args.port, args.workers,
+                           max_requests(args.max_requests))
+    # Bind before building the shared state, so that a port already in use
+    # is reported right away.
+    server.bind()
+    warm_up()
+    freeze_heap()
+    server.run()
+
+
+if __name__ == '__main__':
+    main()
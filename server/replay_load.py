@@ -0,0 +1,311 @@
+"""
+Replay the instructions stored in a projects database against the API, and
+report the latency of every endpoint.
+
+    python replay_load.py database.db
+    python replay_load.py database.db --concurrency 8 --rate 20
+    python replay_load.py old.sqlite --url http://127.0.0.1:5000 --repeat 3
+    python replay_load.py database.db --set ADMISSION_MAX_ACTIVE=4
+
+Every project of the database is replayed as a session: its instructions
+are sent in order (through the update endpoint by default), under a user
+and a project of their own, and the project is fetched once they have all
+been sent. --concurrency sessions are replayed at the same time, and
+--rate bounds the number of requests sent per second over all of them.
+
+Without --url, the requests are served by an app created in this process
+through the Flask test client; --set overrides its config options. That app
+stores its projects in a scratch database (a temporary file unless
+--scratch_db is given), so the database replayed from is left as it is.
+With --url, the requests are sent to a running server.
+"""
+
+import argparse
+import ast
+import bisect
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib
+import urllib2
+
+from flaskr.scratch_project import parse_instructions
+
+# Upper bounds of the buckets of the latency histograms, in milliseconds.
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+def load_sessions(path, limit=None):
+    """
+    Returns:
+        list of (str, str, list of str): the author, name and instructions
+            of every project of the database
+    """
+    connection = sqlite3.connect(path)
+    try:
+        rows = connection.execute('select author_id, project_name, instructions '
+                                  'from projects order by id').fetchall()
+    finally:
+        connection.close()
+    sessions = [(author, name, parse_instructions(instructions))
+                for author, name, instructions in rows]
+    return sessions[:limit] if limit is not None else sessions
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(fraction * len(sorted_values)))]
+
+
+class LatencyReport(object):
+    """Latencies and status codes of the requests, per endpoint."""
+
+    def __init__(self):
+        self._latencies = {}
+        self._statuses = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, status, seconds):
+        with self._lock:
+            self._latencies.setdefault(endpoint, []).append(seconds)
+            statuses = self._statuses.setdefault(endpoint, {})
+            statuses[status] = statuses.get(status, 0) + 1
+
+    def num_requests(self):
+        with self._lock:
+            return sum(len(l) for l in self._latencies.values())
+
+    def show(self, elapsed):
+        total = self.num_requests()
+        print("> %d requests in %.2fs (%.1f requests/s)"
+              %(total, elapsed, total / elapsed if elapsed else 0.0))
+        for endpoint in sorted(self._latencies):
+            latencies = sorted(self._latencies[endpoint])
+            statuses = self._statuses[endpoint]
+            print("\n== %s: %d requests, statuses %s"
+                  %(endpoint, len(latencies),
+                    ', '.join(['%s: %d'%(s, n) for s, n in sorted(statuses.items())])))
+            print("  mean %.1fms  p50 %.1fms  p90 %.1fms  p99 %.1fms  max %.1fms"
+                  %(1000 * sum(latencies) / len(latencies),
+                    1000 * percentile(latencies, 0.5),
+                    1000 * percentile(latencies, 0.9),
+                    1000 * percentile(latencies, 0.99),
+                    1000 * latencies[-1]))
+            counts = [0] * (len(BUCKETS_MS) + 1)
+            for seconds in latencies:
+                counts[bisect.bisect_left(BUCKETS_MS, 1000 * seconds)] += 1
+            widest = max(counts)
+            for i, count in enumerate(counts):
+                if not count:
+                    continue
+                label = ('<= %dms'%(BUCKETS_MS[i]) if i < len(BUCKETS_MS)
+                         else '>  %dms'%(BUCKETS_MS[-1]))
+                print("  %10s %7d %s"%(label, count, '#' * int(40.0 * count / widest + 0.5)))
+
+
+class RateLimiter(object):
+    """Spaces out the requests of all the threads to a given rate."""
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.time()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            send_at = max(self._next, now)
+            self._next = send_at + self.interval
+        if send_at > now:
+            time.sleep(send_at - now)
+
+
+def test_client_sender(app):
+    """Send requests to an app of this process."""
+    local = threading.local()
+
+    def send(path):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        response = local.client.get(path)
+        response.close()
+        return response.status_code
+    return send
+
+
+def http_sender(base_url, timeout):
+    """Send requests to a running server."""
+    def send(path):
+        try:
+            response = urllib2.urlopen(base_url.rstrip('/') + path,
+                                       timeout=timeout)
+            response.read()
+            return response.getcode()
+        except urllib2.HTTPError as e:
+            return e.code
+        except (urllib2.URLError, IOError):
+            return 'error'
+    return send
+
+
+def replay_session(send, report, limiter, endpoint, user, project, instructions):
+    def quote(s):
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        return urllib.quote(s, safe='')
+    project_path = '/user/%s/project/%s'%(quote(user), quote(project))
+    requests = []
+    for instruction in instructions:
+        if endpoint == 'translate':
+            requests.append(('translate', '/translate/%s'%(quote(instruction))))
+        else:
+            requests.append((endpoint, '%s/%s/%s'%(project_path, endpoint,
+                                                   quote(instruction))))
+    if endpoint != 'translate':
+        requests.append(('project', project_path))
+    for name, path in requests:
+        limiter.wait()
+        start = time.time()
+        status = send(path)
+        report.add(name, status, time.time() - start)
+
+
+def run(sessions, send, endpoint, concurrency, rate):
+    report = LatencyReport()
+    limiter = RateLimiter(rate)
+    queue = list(reversed(sessions))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                session = queue.pop()
+            replay_session(send, report, limiter, endpoint, *session)
+
+    start = time.time()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        # join() with a timeout, so that ^C stops the replay.
+        while thread.is_alive():
+            thread.join(0.5)
+    return report, time.time() - start
+
+
+def parse_config_value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def create_local_app(config, scratch_db):
+    """An app of this process, storing its projects in scratch_db."""
+    from flaskr import create_app
+    from flaskr import db as project_db
+    project_db.DATABASE = scratch_db
+    return create_app(config)
+
+
+def parse_cli_args():
+    arg_parser = argparse.ArgumentParser(description='Replay the instructions of a projects database against the ScratchNLP API.')
+    arg_parser.add_argument('database',
+                            help='the database.db or flaskr.sqlite file to take the instructions from.')
+    arg_parser.add_argument('--url',
+                            default=None,
+                            help='send the requests to the server at this url rather than to an app of this process.')
+    arg_parser.add_argument('--endpoint',
+                            choices=['update', 'script', 'translate'],
+                            default='update',
+                            help='the endpoint the instructions are sent to.')
+    arg_parser.add_argument('--concurrency',
+                            type=int,
+                            default=4,
+                            help='number of projects replayed at the same time.')
+    arg_parser.add_argument('--rate',
+                            type=float,
+                            default=None,
+                            help='most requests sent per second, over all the projects.')
+    arg_parser.add_argument('--repeat',
+                            type=int,
+                            default=1,
+                            help='replay every project this many times, as different users.')
+    arg_parser.add_argument('--limit',
+                            type=int,
+                            default=None,
+                            help='replay only the first projects of the database.')
+    arg_parser.add_argument('--timeout',
+                            type=float,
+                            default=60.0,
+                            help='seconds to wait for a response of the server.')
+    arg_parser.add_argument('--set',
+                            dest='config',
+                            action='append',
+                            default=[],
+                            metavar='OPTION=VALUE',
+                            help='set a config option of the app of this process (e.g. ADMISSION_MAX_ACTIVE=4).')
+    arg_parser.add_argument('--scratch_db',
+                            default=None,
+                            help='the database the app of this process stores its projects in.')
+    arg_parser.add_argument('--verbose',
+                            action='store_true',
+                            help='keep the output of the app of this process.')
+    return arg_parser.parse_args()
+
+
+def main():
+    args = parse_cli_args()
+    # Read the instructions before an app of this process recreates its
+    # tables, in case it is the same file.
+    sessions = load_sessions(args.database, args.limit)
+    replayed = []
+    for i in range(args.repeat):
+        for author, name, instructions in sessions:
+            replayed.append(('replay%d-%s'%(i, author), name, instructions))
+    print("> Replaying %d projects, %d instructions"
+          %(len(replayed), sum(len(s[2]) for s in replayed)))
+
+    if args.url:
+        send = http_sender(args.url, args.timeout)
+    else:
+        config = {}
+        for option in args.config:
+            key, _, value = option.partition('=')
+            config[key] = parse_config_value(value)
+        scratch_db = args.scratch_db
+        if scratch_db is None:
+            handle, scratch_db = tempfile.mkstemp(suffix='.db')
+            os.close(handle)
+        app = create_local_app(config, scratch_db)
+        send = test_client_sender(app)
+
+    stdout = sys.stdout
+    if not args.url and not args.verbose:
+        # The app prints every instruction it parses.
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        report, elapsed = run(replayed, send, args.endpoint,
+                              args.concurrency, args.rate)
+    finally:
+        sys.stdout = stdout
+    report.show(elapsed)
+    if not args.url and args.scratch_db is None:
+        from flaskr import db as project_db
+        if project_db.writer is not None:
+            project_db.writer.close()
+        os.remove(scratch_db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# file overview: Test the admission control of the requests that parse
+#
+# Run from the server directory: python -m unittest test_admission
+import threading
+import time
+import unittest
+
+from flaskr.admission import AdmissionController, Overloaded
+
+class TestAdmissionController(unittest.TestCase):
+	def wait_until(self, condition, timeout=5.0):
+		deadline = time.time() + timeout
+		while not condition():
+			self.assertTrue(time.time() < deadline, 'timed out')
+			time.sleep(0.005)
+
+	def queue(self, controller, user, admitted):
+		"""Queue a request of the user, admitted in a thread of its own."""
+		def run():
+			controller.admit(user)
+			admitted.append(user)
+		depth = controller.stats()['queue_depth']
+		thread = threading.Thread(target=run)
+		thread.daemon = True
+		thread.start()
+		self.wait_until(lambda: controller.stats()['queue_depth'] > depth)
+		return thread
+
+	def test_admitted_right_away(self):
+		controller = AdmissionController(max_active=2)
+		self.assertEqual(controller.admit('a'), 0.0)
+		self.assertEqual(controller.admit('b'), 0.0)
+		stats = controller.stats()
+		self.assertEqual((stats['active'], stats['queue_depth']), (2, 0))
+
+	def test_users_are_served_in_turn(self):
+		controller = AdmissionController(max_active=1)
+		controller.admit('a')
+		admitted = []
+		threads = [self.queue(controller, user, admitted)
+				   for user in ['a', 'a', 'a', 'b', 'c']]
+		for i in range(len(threads)):
+			controller.release(0.01)
+			self.wait_until(lambda: len(admitted) > i)
+		for thread in threads:
+			thread.join()
+		# One request of each user before the next request of the first.
+		self.assertEqual(admitted, ['a', 'b', 'c', 'a', 'a'])
+		self.assertEqual(controller.stats()['max_queue_depth'], 5)
+
+	def test_full_queue_is_rejected(self):
+		controller = AdmissionController(max_active=1, max_queue=1)
+		controller.admit('a')
+		admitted = []
+		waiting = self.queue(controller, 'b', admitted)
+		with self.assertRaises(Overloaded) as raised:
+			controller.admit('c')
+		self.assertTrue(raised.exception.retry_after >= 1)
+		self.assertEqual(controller.stats()['rejected'], 1)
+		controller.release()
+		waiting.join()
+		self.assertEqual(admitted, ['b'])
+
+	def test_waiting_too_long(self):
+		controller = AdmissionController(max_active=1, max_wait=0.05)
+		controller.admit('a')
+		with self.assertRaises(Overloaded) as raised:
+			controller.admit('b')
+		self.assertEqual(raised.exception.reason, 'the request waited too long')
+		stats = controller.stats()
+		self.assertEqual((stats['timed_out'], stats['queue_depth']), (1, 0))
+		# The request that timed out does not take the next turn.
+		controller.release()
+		self.assertEqual(controller.admit('c'), 0.0)
+
+if __name__ == '__main__':
+	unittest.main()
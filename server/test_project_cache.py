@@ -0,0 +1,75 @@
+# file overview: Test the ETags and the cache of the rendered projects
+#
+# Run from the server directory: python -m unittest test_project_cache
+import gzip
+import os
+import tempfile
+import unittest
+from io import BytesIO
+
+from flaskr import create_app
+from flaskr import db as project_db
+from flaskr.project_cache import ProjectResponseCache, gzip_bytes
+
+class TestProjectResponseCache(unittest.TestCase):
+	def test_least_recently_used_entries_are_dropped(self):
+		cache = ProjectResponseCache(max_entries=2)
+		cache.put('a', 'A')
+		cache.put('b', 'B')
+		self.assertEqual(cache.get('a').body, 'A')
+		cache.put('c', 'C')
+		self.assertEqual(cache.get('b'), None)
+		self.assertEqual(cache.get('a').body, 'A')
+		self.assertEqual(cache.get('c').body, 'C')
+
+	def test_gzipped_body(self):
+		rendered = ProjectResponseCache().put('a', '{"x": 1}' * 100)
+		gzipped = rendered.gzipped()
+		self.assertTrue(gzipped is rendered.gzipped())
+		self.assertEqual(gzip.GzipFile(fileobj=BytesIO(gzipped)).read(),
+						 rendered.body)
+		# The gzipped bytes do not depend on when they are made.
+		self.assertEqual(gzip_bytes(rendered.body), gzipped)
+
+class TestProjectETags(unittest.TestCase):
+	def setUp(self):
+		handle, self.database = tempfile.mkstemp(suffix='.db')
+		os.close(handle)
+		self.default_database = project_db.DATABASE
+		project_db.DATABASE = self.database
+
+	def tearDown(self):
+		project_db.DATABASE = self.default_database
+		os.remove(self.database)
+
+	def client(self):
+		app = create_app({'TESTING': True, 'WRITE_BEHIND_DELAY': None})
+		return app.test_client()
+
+	def test_not_modified(self):
+		client = self.client()
+		client.get('/user/tina/project/p/script/say hello')
+		response = client.get('/user/tina/project/p')
+		etag = response.headers['ETag']
+		self.assertEqual(response.headers['X-Project-Version'], '1')
+		response = client.get('/user/tina/project/p', headers={'If-None-Match': etag})
+		self.assertEqual(response.status_code, 304)
+		client.get('/user/tina/project/p/script/say bye')
+		response = client.get('/user/tina/project/p', headers={'If-None-Match': etag})
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response.headers['ETag'], etag)
+
+	def test_tables_created_again(self):
+		# The tables are created again when the server starts, and the
+		# projects they hold get the same ids and versions as before.
+		client = self.client()
+		client.get('/user/tina/project/p/script/say hello')
+		etag = client.get('/user/tina/project/p').headers['ETag']
+		client = self.client()
+		client.get('/user/tina/project/p/script/say goodbye')
+		response = client.get('/user/tina/project/p', headers={'If-None-Match': etag})
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue('goodbye' in response.data)
+
+if __name__ == '__main__':
+	unittest.main()
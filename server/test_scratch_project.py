@@ -0,0 +1,55 @@
+# file overview: Test the patches returned by project updates
+#
+# Run from the server directory: python -m unittest test_scratch_project
+import json
+import unittest
+
+from flaskr.scratch_project import ScratchProject
+
+def changes(scripts, variables=None, lists=None, sounds=()):
+	return {'scripts': scripts, 'variables': variables or {},
+			'lists': lists or {}, 'sounds': set(sounds)}
+
+class TestProjectPatch(unittest.TestCase):
+	def setUp(self):
+		self.project = ScratchProject()
+
+	def test_versions(self):
+		patch = self.project.update(changes([['say:', 'hi']]))
+		self.assertEqual((patch['base_version'], patch['version']), (0, 1))
+		patch = self.project.update(changes([['say:', 'bye']]))
+		self.assertEqual((patch['base_version'], patch['version']), (1, 2))
+		self.assertEqual(self.project.version, 2)
+
+	def test_scripts_variables_and_lists(self):
+		self.project.update(changes([['say:', 'hi']], variables={'x': 0},
+									lists={'l': []}))
+		patch = self.project.update(changes([['setVar:to:', 'x', 5]],
+											variables={'x': 5}))
+		self.assertEqual(patch['variables'], {'set': {'x': 5}, 'removed': []})
+		self.assertEqual(patch['lists'], {'set': {}, 'removed': ['l']})
+		self.assertEqual(patch['scripts']['from'], 0)
+		self.assertEqual(patch['scripts']['stacks'],
+						 [[5, 128, [['say:', 'hi'], ['setVar:to:', 'x', 5]]]])
+
+	def test_sound_of_the_catalog(self):
+		patch = self.project.update(changes([['doPlaySoundAndWait', 'Meow']],
+											sounds=['Meow']))
+		added = patch['sounds']['added']
+		self.assertEqual([sound['soundName'] for sound in added], ['Meow'])
+		self.assertTrue('md5' in added[0])
+		patch = self.project.update(changes([]))
+		self.assertEqual(patch['sounds'], {'added': [], 'removed': ['Meow']})
+
+	def test_sound_not_in_the_catalog(self):
+		# Sound names are taken from the instructions, so they need not be
+		# in the catalog.
+		patch = self.project.update(changes([['doPlaySoundAndWait', 'Bang']],
+											sounds=['Bang']))
+		self.assertEqual(patch['sounds'], {'added': [], 'removed': []})
+		self.assertEqual(self.project.sounds, set(['Bang']))
+		sprite = json.loads(self.project.to_json())['children'][0]
+		self.assertEqual(sprite['sounds'], [])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,112 @@
+# file overview: Test the write-behind queue of the project updates
+#
+# Run from the server directory: python -m unittest test_write_behind
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from flaskr import create_app
+from flaskr import db as project_db
+from flaskr.scratch_project import parse_instructions
+from flaskr.write_behind import ProjectWriteBehind
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+					  'flaskr', 'schema.sql')
+
+def scratch_database():
+	handle, path = tempfile.mkstemp(suffix='.db')
+	os.close(handle)
+	connection = sqlite3.connect(path)
+	with open(SCHEMA) as f:
+		connection.executescript(f.read())
+	connection.close()
+	return path
+
+class TestProjectWriteBehind(unittest.TestCase):
+	def setUp(self):
+		self.database = scratch_database()
+		self.connection = sqlite3.connect(self.database)
+		self.connection.execute("INSERT INTO projects (id, author_id, project_name, instructions, json, version) VALUES (1, 'tina', 'p', '[]', '{}', 5)")
+		self.connection.commit()
+		self.writer = ProjectWriteBehind(self.database, max_delay=60.0)
+
+	def tearDown(self):
+		self.writer.close()
+		self.connection.close()
+		os.remove(self.database)
+
+	def row(self, version, instructions):
+		return (1, 'tina', None, 'p', str(instructions), '{}', version)
+
+	def stored(self):
+		return self.connection.execute(
+			'select version, instructions from projects').fetchone()
+
+	def test_newer_version_is_written(self):
+		self.assertTrue(self.writer.put(self.row(6, ['say hi'])))
+		self.writer.flush()
+		self.assertEqual(self.stored(), (6, "['say hi']"))
+		stats = self.writer.stats()
+		self.assertEqual(stats['written'], 1)
+		self.assertEqual(stats['conflicts'], 0)
+
+	def test_updates_are_coalesced(self):
+		self.writer.put(self.row(6, ['say hi']))
+		self.writer.put(self.row(7, ['say hi', 'say bye']))
+		self.assertEqual(self.writer.get('tina', 'p')[6], 7)
+		self.writer.flush()
+		self.assertEqual(self.stored(), (7, "['say hi', 'say bye']"))
+		stats = self.writer.stats()
+		self.assertEqual((stats['queued'], stats['coalesced'], stats['written']),
+						 (2, 1, 1))
+
+	def test_older_version_is_a_conflict(self):
+		self.writer.put(self.row(5, ['say hi']))
+		self.writer.flush()
+		self.assertEqual(self.stored(), (5, '[]'))
+		stats = self.writer.stats()
+		self.assertEqual(stats['written'], 0)
+		self.assertEqual(stats['conflicts'], 1)
+
+	def test_closed_writer_refuses_updates(self):
+		self.writer.put(self.row(6, ['say hi']))
+		self.writer.close()
+		self.assertEqual(self.stored(), (6, "['say hi']"))
+		self.assertFalse(self.writer.put(self.row(7, ['say bye'])))
+
+class TestProjectUpdates(unittest.TestCase):
+	def setUp(self):
+		self.database = scratch_database()
+		self.default_database = project_db.DATABASE
+		project_db.DATABASE = self.database
+		self.app = create_app({'TESTING': True, 'WRITE_BEHIND_DELAY': 60.0})
+		self.client = self.app.test_client()
+
+	def tearDown(self):
+		if project_db.writer is not None:
+			project_db.writer.close()
+			project_db.writer = None
+		project_db.DATABASE = self.default_database
+		os.remove(self.database)
+
+	def stored_instructions(self):
+		connection = sqlite3.connect(self.database)
+		try:
+			row = connection.execute('select instructions from projects').fetchone()
+		finally:
+			connection.close()
+		return parse_instructions(row[0])
+
+	def test_instructions_not_understood_are_stored(self):
+		instructions = ['broadcast hello', 'wait 2 seconds', 'xyzzy plugh']
+		for instruction in instructions:
+			response = self.client.get('/user/tina/project/p/update/' + instruction)
+			self.assertEqual(response.status_code, 200)
+			# Let each update be written before the next one.
+			project_db.flush()
+		self.assertEqual(self.stored_instructions(), instructions)
+		self.assertEqual(project_db.writer.stats()['conflicts'], 0)
+
+if __name__ == '__main__':
+	unittest.main()
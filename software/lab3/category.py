@@ -11,6 +11,7 @@
 # For license information, see LICENSE.TXT
 from nltk.sem import logic
 from cfg import *
+from cfg import Nonterminal
 
 from featurelite import *
 from copy import deepcopy
@@ -24,6 +25,13 @@ def makevar(varname):
     """
     return Variable(varname[1:])
 
+# The interned categories, by class and string representation, and the
+# categories parsed so far, by class and string. Both only grow with the
+# distinct categories of the grammar: quoted terminals, which come from the
+# words of the utterances, are not cached.
+_interned_categories = {}
+_parsed_categories = {}
+
 class Category(Nonterminal, FeatureI):
     """
     A C{Category} is a wrapper for feature dictionaries, intended for use in
@@ -53,7 +61,13 @@ class Category(Nonterminal, FeatureI):
     Because Categories can contain any kind of object, they do not try to
     keep control over what their inner objects do. If you freeze a Category
     but mutate its inner objects, undefined behavior will occur.
+
+    Categories parsed from strings are frozen and X{interned}: parsing the
+    same category twice gives the same object, so the productions of a
+    grammar share their categories, and two interned categories are equal
+    only if they are the same object.
     """
+    __slots__ = ('_features', '_frozen', '_memostr', '_interned')
 
     headname = 'head'
 
@@ -63,6 +77,7 @@ class Category(Nonterminal, FeatureI):
         self._hash = None
         self._frozen = False
         self._memostr = None
+        self._interned = False
 
     def __cmp__(self, other):
         return cmp(repr(self), repr(other))
@@ -87,7 +102,9 @@ class Category(Nonterminal, FeatureI):
         not a nested Category).
         @rtype: C{bool}
         """
+        if self is other: return True
         if not other.__class__ == self.__class__: return False
+        if self._interned and other._interned: return False
         return self._features == other._features
 
     def __ne__(self, other):
@@ -117,6 +134,37 @@ class Category(Nonterminal, FeatureI):
         """
         return self._frozen
 
+    def intern(self):
+        """
+        Freeze this Category, and look it up in the table of interned
+        categories.
+
+        @return: The interned C{Category} equal to C{self}; C{self} if it
+        is the first of its kind.
+        """
+        self.freeze()
+        key = (self.__class__, self._memostr)
+        interned = _interned_categories.setdefault(key, self)
+        if interned is self:
+            self._interned = True
+        elif interned._features != self._features:
+            # Different features with the same string representation.
+            return self
+        return interned
+
+    def __getstate__(self):
+        state = {}
+        for name in Category.__slots__ + Nonterminal.__slots__:
+            if hasattr(self, name): state[name] = getattr(self, name)
+        state.update(getattr(self, '__dict__', {}))
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        # A copy is not the interned instance of its features.
+        self._interned = False
+
     def get(self, key):
         return self._features.get(key)
 
@@ -270,10 +318,18 @@ class Category(Nonterminal, FeatureI):
 
     @classmethod
     def parse(cls, s):
-        parsed, position = cls._parse(s, 0)
-        if position != len(s):
-            raise ValueError('end of string', position)
-        return cls(parsed)
+        """
+        @return: The interned C{Category} written as C{s}.
+        """
+        key = (cls, s)
+        category = _parsed_categories.get(key)
+        if category is None:
+            parsed, position = cls._parse(s, 0)
+            if position != len(s):
+                raise ValueError('end of string', position)
+            category = _parsed_categories.setdefault(key,
+                                                     cls(parsed).intern())
+        return category
 
     @classmethod
     def inner_parse(cls, s, position, reentrances={}):
@@ -512,6 +568,8 @@ class GrammarCategory(Category):
     that is finite and has an omitted noun phrase inside it.
     """
 
+    __slots__ = ()
+
     headname = 'pos'
     yaml_tag = '!parse.GrammarCategory'
 
@@ -552,7 +610,20 @@ class GrammarCategory(Category):
 
     @staticmethod
     def parse(s, position=0):
-        return GrammarCategory.inner_parse(s, position)[0]
+        """
+        @return: The interned C{GrammarCategory} written as C{s}, or the
+        terminal if C{s} is quoted.
+        """
+        if position != 0:
+            return GrammarCategory.inner_parse(s, position)[0]
+        key = (GrammarCategory, s)
+        category = _parsed_categories.get(key)
+        if category is None:
+            category = GrammarCategory.inner_parse(s, position)[0]
+            if not isinstance(category, Category):
+                return category
+            category = _parsed_categories.setdefault(key, category.intern())
+        return category
 
     @classmethod
     def inner_parse(cls, s, position, reentrances=None):
@@ -597,6 +668,8 @@ class C(GrammarCategory):
         self._features[self.semanticTypeName] = semanticType
         self._str = self._getStr()
         self._hash = hash(self._str)
+        self._memostr = None
+        self._interned = False
 
         """
         Live dangerously: we're theoretically immutable,
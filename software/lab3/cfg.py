@@ -92,6 +92,8 @@ class Nonterminal(object):
     @ivar _symbol: The node value corresponding to this
         C{Nonterminal}.  This value must be immutable and hashable. 
     """
+    __slots__ = ('_symbol', '_hash')
+
     def __init__(self, symbol):
         """
         Construct a new non-terminal from the given symbol.
@@ -142,6 +144,12 @@ class Nonterminal(object):
     def __hash__(self):
         return self._hash
 
+    def __getstate__(self):
+        return (self._symbol, self._hash)
+
+    def __setstate__(self, state):
+        self._symbol, self._hash = state
+
     def __repr__(self):
         """
         @return: A string representation for this C{Nonterminal}.
@@ -216,6 +224,7 @@ class Production(object):
     @type _rhs: C{tuple} of (C{Nonterminal} and (terminal))
     @ivar _rhs: The right-hand side of the production.
     """
+    __slots__ = ('_lhs', '_rhs', '_hash')
 
     def __init__(self, lhs, rhs):
         """
@@ -273,7 +282,9 @@ class Production(object):
         @return: true if this C{Production} is equal to C{other}.
         @rtype: C{boolean}
         """
+        if self is other: return True
         return (isinstance(other, self.__class__) and
+                self._hash == other._hash and
                 self._lhs == other._lhs and
                 self._rhs == other._rhs)
                  
@@ -291,6 +302,12 @@ class Production(object):
         """
         return self._hash
 
+    def __getstate__(self):
+        return (self._lhs, self._rhs, self._hash)
+
+    def __setstate__(self, state):
+        self._lhs, self._rhs, self._hash = state
+
 
 class Grammar(object):
     """
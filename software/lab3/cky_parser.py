@@ -0,0 +1,224 @@
+"""
+CKY parsing of a compiled grammar.
+
+The productions of the compiled grammar (see grammar_compiler) are put in
+binary form: a right-hand side longer than two symbols is split from the
+left, with an intermediate symbol for every prefix (prefixes shared by
+several productions share their symbol), and a word in a right-hand side
+of two or more symbols is given a preterminal of its own. Unary
+productions are applied to every cell until nothing new can be added.
+
+The chart is a packed forest: every cell maps each symbol that spans it to
+the ways it was built, so a symbol is built once per span however many
+trees it is part of. The chart gives its trees as a ParseForest in which
+the intermediate symbols and preterminals are spliced out, so they are the
+trees of the original grammar.
+"""
+
+from collections import defaultdict
+
+from nltk.grammar import is_nonterminal
+from nltk.tree import Tree
+
+from forest import ForestNode, ParseForest
+from grammar_compiler import GrammarNotCompilable
+from parse_budget import BudgetMeter
+
+
+class CKYGrammar(object):
+    """
+    The binary form of a compiled grammar.
+
+    Args:
+        compiled (CompiledGrammar): the grammar to put in binary form
+    """
+
+    def __init__(self, compiled):
+        cfg = compiled.cfg
+        self.start = cfg.start().symbol()
+        self.labels = dict(compiled.labels)
+        # word -> symbols; symbol -> symbols; left -> right -> symbols
+        self.lexical = defaultdict(list)
+        self.unary = defaultdict(list)
+        self.binary = defaultdict(lambda: defaultdict(list))
+        # Symbols that are not in the original grammar: their nodes are
+        # replaced by their children in the trees.
+        self.spliced = set()
+        self._next_symbol = max(self.labels) + 1 if self.labels else 0
+        self._intermediates = {}
+        self._preterminals = {}
+
+        # The rule set may hold the same production more than once, which
+        # must not give a symbol the same derivation twice.
+        seen = set()
+        for prod in cfg.productions():
+            if prod in seen:
+                continue
+            seen.add(prod)
+            lhs = prod.lhs().symbol()
+            rhs = prod.rhs()
+            if len(rhs) == 0:
+                raise GrammarNotCompilable("CKY parsing does not handle "
+                                           "empty productions: %s" %(prod))
+            if len(rhs) == 1:
+                if is_nonterminal(rhs[0]):
+                    self.unary[rhs[0].symbol()].append(lhs)
+                else:
+                    self.lexical[rhs[0]].append(lhs)
+                continue
+            symbols = [self._symbol(s) for s in rhs]
+            left = symbols[0]
+            for i in range(1, len(symbols) - 1):
+                left = self._intermediate(tuple(symbols[:i+1]), left,
+                                          symbols[i])
+            self.binary[left][symbols[-1]].append(lhs)
+
+    def _new_symbol(self):
+        symbol = self._next_symbol
+        self._next_symbol += 1
+        self.spliced.add(symbol)
+        return symbol
+
+    def _symbol(self, item):
+        if is_nonterminal(item):
+            return item.symbol()
+        if item not in self._preterminals:
+            symbol = self._preterminals[item] = self._new_symbol()
+            self.lexical[item].append(symbol)
+        return self._preterminals[item]
+
+    def _intermediate(self, prefix, left, right):
+        if prefix not in self._intermediates:
+            symbol = self._intermediates[prefix] = self._new_symbol()
+            self.binary[left][right].append(symbol)
+        return self._intermediates[prefix]
+
+
+class CKYChart(object):
+    """
+    The packed forest of a sentence. cells[i, j] maps every symbol spanning
+    the words i to j to the list of the ways it was built:
+        ('word', w) from the word w,
+        ('unary', b) from the symbol b over the same span,
+        ('binary', k, b, c) from b over i..k and c over k..j.
+    """
+
+    def __init__(self, grammar, tokens, budget=None):
+        self._grammar = grammar
+        self._tokens = tuple(tokens)
+        self._meter = BudgetMeter(budget)
+        self.cells = defaultdict(dict)
+
+    def num_leaves(self):
+        return len(self._tokens)
+
+    def leaves(self):
+        return list(self._tokens)
+
+    def num_edges(self):
+        return self._meter.num_edges
+
+    def _add(self, cell, symbol, how):
+        self._meter.add_edge()
+        if symbol in cell:
+            cell[symbol].append(how)
+            return False
+        cell[symbol] = [how]
+        return True
+
+    def check_deadline(self):
+        self._meter.check_deadline()
+
+    def fill(self):
+        grammar = self._grammar
+        n = len(self._tokens)
+        for i, word in enumerate(self._tokens):
+            cell = self.cells[i, i+1]
+            for symbol in grammar.lexical.get(word, ()):
+                self._add(cell, symbol, ('word', word))
+            self._close(cell, list(cell))
+        for span in range(2, n + 1):
+            for i in range(n - span + 1):
+                j = i + span
+                cell = self.cells[i, j]
+                for k in range(i + 1, j):
+                    right = self.cells.get((k, j))
+                    if not right:
+                        continue
+                    for b in self.cells.get((i, k), ()):
+                        by_right = grammar.binary.get(b)
+                        if not by_right:
+                            continue
+                        for c in right:
+                            for a in by_right.get(c, ()):
+                                self._add(cell, a, ('binary', k, b, c))
+                self._close(cell, list(cell))
+        return self
+
+    def _close(self, cell, agenda):
+        """Apply the unary productions to a cell."""
+        unary = self._grammar.unary
+        while agenda:
+            b = agenda.pop()
+            for a in unary.get(b, ()):
+                if self._add(cell, a, ('unary', b)):
+                    agenda.append(a)
+
+    def forest(self, root=None, label=None):
+        """
+        The ParseForest of the trees of the whole sentence, for the start
+        symbol. The intermediate symbols and preterminals of the binary
+        grammar are transparent nodes.
+        """
+        grammar = self._grammar
+        nodes = {}
+
+        def node_for(symbol, i, j):
+            key = (symbol, i, j)
+            node = nodes.get(key)
+            if node is None:
+                node = nodes[key] = ForestNode(
+                    grammar.labels.get(symbol), i, j,
+                    transparent=symbol in grammar.spliced)
+                for how in self.cells[i, j][symbol]:
+                    if how[0] == 'word':
+                        node.add((how[1],))
+                    elif how[0] == 'unary':
+                        node.add((node_for(how[1], i, j),))
+                    else:
+                        k, b, c = how[1:]
+                        node.add((node_for(b, i, k), node_for(c, k, j)))
+            return node
+
+        n = len(self._tokens)
+        if grammar.start not in self.cells.get((0, n), ()):
+            return ParseForest()
+        return ParseForest([node_for(grammar.start, 0, n)])
+
+    def parses(self, root=None, tree_class=Tree):
+        """The trees of the whole sentence, for the start symbol."""
+        return self.forest(root).trees()
+
+
+class CKYParser(object):
+    """
+    Parses with the binary form of a compiled grammar, and presents the
+    same interface as FeatureEarleyChartParser.
+
+    Args:
+        compiled (CompiledGrammar): the grammar to parse with
+        budget (ParseBudget or callable): the limits of every parse, or a
+            function returning the limits in effect
+    """
+
+    def __init__(self, compiled, budget=None):
+        self._compiled = compiled
+        self._grammar = CKYGrammar(compiled)
+        self._budget = budget
+
+    def grammar(self):
+        return self._compiled.feature_grammar
+
+    def chart_parse(self, tokens, trace=None):
+        budget = self._budget() if callable(self._budget) else self._budget
+        return CKYChart(self._grammar, tokens, budget).fill()
@@ -83,6 +83,8 @@ def isMapping(obj):
     return isinstance(obj, dict) or isinstance(obj, FeatureI)
 
 class FeatureI(object):
+    __slots__ = ()
+
     def __init__(self):
         raise TypeError, "FeatureI is an abstract interface"
 
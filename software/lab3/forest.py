@@ -0,0 +1,251 @@
+"""
+Packed parse forests.
+
+The trees of an ambiguous sentence share most of their subtrees, and their
+number grows exponentially with the length of the sentence. A ParseForest
+holds one node per category and span, with the list of the distinct ways
+(alternatives) to build it from nodes of smaller spans. The number of
+trees and the tree of minimal height are computed on the forest, in time
+linear in its size; trees are only built when they are asked for.
+
+Charts build their forest with forest(root), see build_chart_forest.
+"""
+
+import itertools
+
+from nltk.parse.chart import LeafEdge
+from nltk.tree import Tree
+
+
+class ForestNode(object):
+    """
+    A category over a span of the sentence, and the alternatives to build
+    it: tuples whose items are ForestNodes or words.
+
+    A transparent node is not part of the trees: its children take its
+    place among the children of its parent (the intermediate symbols of a
+    binarized grammar).
+    """
+    __slots__ = ('label', 'start', 'end', 'alternatives', 'transparent',
+                 '_alternative_set', '_count', '_height')
+
+    def __init__(self, label, start, end, transparent=False):
+        self.label = label
+        self.start = start
+        self.end = end
+        self.transparent = transparent
+        self.alternatives = []
+        self._alternative_set = set()
+        self._count = None
+        self._height = None
+
+    def add(self, children):
+        children = tuple(children)
+        if children not in self._alternative_set:
+            self._alternative_set.add(children)
+            self.alternatives.append(children)
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '<ForestNode %s[%d:%d] %d alternatives>' %(
+            self.label, self.start, self.end, len(self.alternatives))
+
+
+_IN_PROGRESS = object()
+_INFINITY = float('inf')
+
+
+class ParseForest(object):
+    """
+    The packed trees of a sentence.
+
+    Args:
+        roots (list of ForestNode): the nodes of the start category over
+            the whole sentence
+    """
+
+    def __init__(self, roots=()):
+        self.roots = list(roots)
+
+    def count(self):
+        """The number of distinct trees."""
+        return sum(_count(root) for root in self.roots)
+
+    def __len__(self):
+        return self.count()
+
+    def min_height(self):
+        """The height of the shortest tree, or None if there is no tree."""
+        heights = [_height(root) for root in self.roots]
+        height = min(heights) if heights else _INFINITY
+        return None if height == _INFINITY else height
+
+    def best_tree(self):
+        """
+        The first tree of minimal height, in the order of trees(), or None
+        if there is no tree.
+        """
+        height = self.min_height()
+        if height is None:
+            return None
+        for root in self.roots:
+            if _height(root) == height:
+                return _first_tree(root, height)[0]
+
+    def trees(self, limit=None):
+        """
+        Generate every tree, in the order of the alternatives, or only the
+        first limit trees. The trees after the limit are not built.
+        """
+        memo = {}
+        produced = 0
+        for root in self.roots:
+            for parts in _parts(root, memo, limit):
+                if limit is not None and produced >= limit:
+                    return
+                produced += 1
+                yield parts[0]
+
+
+# The counts and heights of cyclic derivations (through unary productions
+# over the same span) are left out, as they would be infinite: such
+# derivations yield no tree, as with nltk's Chart.trees.
+
+def _count(node):
+    if node._count is _IN_PROGRESS:
+        return 0
+    if node._count is None:
+        node._count = _IN_PROGRESS
+        total = 0
+        for children in node.alternatives:
+            product = 1
+            for child in children:
+                if isinstance(child, ForestNode):
+                    product *= _count(child)
+                    if product == 0:
+                        break
+            total += product
+        node._count = total
+    return node._count
+
+
+def _height(node):
+    """
+    The height of the shortest tree of a node (as Tree.height(), where a
+    word counts as 1). A transparent node adds no level.
+    """
+    if node._height is _IN_PROGRESS:
+        return _INFINITY
+    if node._height is None:
+        node._height = _IN_PROGRESS
+        best = _INFINITY
+        for children in node.alternatives:
+            best = min(best, _alternative_height(children))
+        node._height = best + (0 if node.transparent else 1)
+    return node._height
+
+
+def _alternative_height(children):
+    height = 0
+    for child in children:
+        if isinstance(child, ForestNode):
+            height = max(height, _height(child))
+        else:
+            height = max(height, 1)
+    return height
+
+
+def _first_tree(node, limit):
+    """
+    The first tree of a node whose height is at most limit, as the list of
+    nodes it contributes to its parent.
+    """
+    if not node.transparent:
+        limit -= 1
+    for children in node.alternatives:
+        if _alternative_height(children) > limit:
+            continue
+        parts = []
+        for child in children:
+            if isinstance(child, ForestNode):
+                parts.extend(_first_tree(child, limit))
+            else:
+                parts.append(child)
+        if node.transparent:
+            return parts
+        return [Tree(node.label, parts)]
+
+
+def _parts(node, memo, limit=None):
+    """
+    Every tree of a node (or its first limit trees), each as the list of
+    nodes it contributes to its parent: one tree, or the children of a
+    transparent node. Each of the first limit combinations of the children
+    only uses their first limit trees, so those are all that is built.
+    """
+    if node in memo:
+        return memo[node]
+    memo[node] = []
+    derivations = []
+    for children in node.alternatives:
+        if limit is not None and len(derivations) >= limit:
+            break
+        choices = [_parts(child, memo, limit) if isinstance(child, ForestNode)
+                   else [[child]] for child in children]
+        for combination in itertools.product(*choices):
+            derivations.append([item for part in combination
+                                for item in part])
+            if limit is not None and len(derivations) >= limit:
+                break
+    if node.transparent:
+        parts = derivations
+    else:
+        parts = [[Tree(node.label, children)] for children in derivations]
+    memo[node] = parts
+    return parts
+
+
+def build_chart_forest(chart, root_edges, label=None):
+    """
+    Build the forest of an nltk chart from its complete edges.
+
+    Args:
+        chart (Chart): the chart of the sentence
+        root_edges (list of EdgeI): the complete edges of the start
+            category over the whole sentence
+        label (callable): maps the symbol of a category to the label of
+            its nodes; defaults to the symbol itself
+
+    Returns:
+        ParseForest
+    """
+    nodes = {}
+    built = set()
+
+    def node_for(edge):
+        symbol = edge.lhs().symbol()
+        key = (symbol, edge.start(), edge.end())
+        node = nodes.get(key)
+        if node is None:
+            node = nodes[key] = ForestNode(
+                label(symbol) if label else symbol, edge.start(), edge.end())
+        if edge not in built:
+            built.add(edge)
+            for cpl in chart.child_pointer_lists(edge):
+                node.add(chart.leaf(child.start())
+                         if isinstance(child, LeafEdge) else node_for(child)
+                         for child in cpl)
+        return node
+
+    roots = []
+    for edge in root_edges:
+        node = node_for(edge)
+        if node not in roots:
+            roots.append(node)
+    return ParseForest(roots)
@@ -0,0 +1,196 @@
+"""
+Compilation of a feature grammar into an equivalent plain context-free
+grammar.
+
+FeatureEarleyChartParser unifies feature structures every time it predicts
+or completes an edge, although the categories of our grammar are (nearly)
+all atomic. When the categories of a grammar only carry ground feature
+values, every category is replaced by an integer symbol, and every
+production by the productions over the categories it can unify with. The
+result is parsed by the plain EarleyChartParser, and the trees are labelled
+with the original categories again, so they are the same trees the feature
+parser would return.
+
+Grammars that bind variables, or nest feature structures, really need
+unification: compile_feature_grammar raises GrammarNotCompilable for them
+and they are parsed with the feature parser.
+"""
+
+import itertools
+
+from nltk.featstruct import FeatStruct, Variable
+from nltk.grammar import CFG, Nonterminal, Production, is_nonterminal
+from nltk.parse.earleychart import EarleyChartParser
+from nltk.tree import Tree
+
+from grammar_filter import LexicalFilter
+
+# Productions whose categories unify with more left-hand sides than this
+# (once multiplied over the right-hand side) are not expanded.
+MAX_EXPANSIONS = 64
+
+
+class GrammarNotCompilable(Exception):
+    pass
+
+
+def _ground_features(category):
+    """
+    The features of a category as a frozenset of (name, value) pairs.
+    """
+    if not isinstance(category, FeatStruct):
+        return frozenset([('*type*', category.symbol())])
+    items = []
+    for name, value in category.items():
+        if isinstance(value, (Variable, FeatStruct)):
+            raise GrammarNotCompilable(
+                "category %s needs unification" %(category))
+        items.append((str(name), value))
+    return frozenset(items)
+
+
+def _compatible(features, other):
+    """Whether two categories with ground features unify."""
+    values = dict(features)
+    for name, value in other:
+        if name in values and values[name] != value:
+            return False
+    return True
+
+
+class CompiledGrammar(object):
+    """
+    The plain context-free grammar equivalent to a feature grammar.
+
+    Attributes:
+        feature_grammar (FeatureGrammar): the grammar that was compiled
+        cfg (CFG): its compiled form, over integer symbols
+        labels (dict): the label, in trees of the feature grammar, of the
+            category each integer symbol stands for
+    """
+
+    def __init__(self, feature_grammar, cfg, labels):
+        self.feature_grammar = feature_grammar
+        self.cfg = cfg
+        self.labels = labels
+
+    def relabel(self, tree):
+        """
+        Give the nodes of a tree of the compiled grammar the categories of
+        the feature grammar.
+        """
+        if not isinstance(tree, Tree):
+            return tree
+        return Tree(self.labels[tree.label()],
+                    [self.relabel(child) for child in tree])
+
+
+def compile_feature_grammar(feature_grammar):
+    """
+    Returns:
+        CompiledGrammar: the plain context-free form of the grammar
+
+    Raises:
+        GrammarNotCompilable: if the grammar needs unification
+    """
+    # One integer symbol for every distinct left-hand side.
+    symbols = {}
+    labels = {}
+    for prod in feature_grammar.productions():
+        features = _ground_features(prod.lhs())
+        if features not in symbols:
+            symbols[features] = len(symbols)
+            # Chart trees are labelled with the symbol of the category.
+            labels[symbols[features]] = prod.lhs().symbol()
+
+    compatible = {}
+    def expansions(category):
+        features = _ground_features(category)
+        if features not in compatible:
+            compatible[features] = [Nonterminal(symbol)
+                                    for lhs, symbol in sorted(
+                                        symbols.items(), key=lambda x: x[1])
+                                    if _compatible(features, lhs)]
+        return compatible[features]
+
+    start = expansions(feature_grammar.start())
+    if len(start) != 1:
+        raise GrammarNotCompilable("the start category unifies with %d "
+                                   "categories" %(len(start)))
+
+    productions = []
+    for prod in feature_grammar.productions():
+        lhs = Nonterminal(symbols[_ground_features(prod.lhs())])
+        choices = []
+        for symbol in prod.rhs():
+            if is_nonterminal(symbol):
+                choices.append(expansions(symbol))
+            else:
+                choices.append([symbol])
+        num_expansions = 1
+        for options in choices:
+            num_expansions *= len(options)
+        if num_expansions > MAX_EXPANSIONS:
+            raise GrammarNotCompilable("%s expands to %d productions"
+                                       %(prod, num_expansions))
+        # A production with a category nothing rewrites to expands to
+        # nothing, as it can never be completed.
+        for rhs in itertools.product(*choices):
+            productions.append(Production(lhs, rhs))
+
+    cfg = CFG(start[0], productions, calculate_leftcorners=False)
+    return CompiledGrammar(feature_grammar, cfg, labels)
+
+
+class CompiledChart(object):
+    """
+    The chart of a compiled parse, whose trees are labelled with the
+    categories of the feature grammar.
+    """
+
+    def __init__(self, chart, compiled):
+        self._chart = chart
+        self._compiled = compiled
+
+    def parses(self, root, tree_class=Tree):
+        for tree in self._chart.parses(self._compiled.cfg.start()):
+            yield self._compiled.relabel(tree)
+
+    def forest(self, root, label=None):
+        return self._chart.forest(self._compiled.cfg.start(),
+                                  self._compiled.labels.get)
+
+    def __getattr__(self, name):
+        return getattr(self._chart, name)
+
+
+class CompiledFeatureParser(object):
+    """
+    Parses with the compiled form of a feature grammar, and presents the
+    same interface as FeatureEarleyChartParser.
+
+    Args:
+        compiled (CompiledGrammar): the grammar to parse with
+        chart_class: the class of the charts to parse into, a subclass of
+            IncrementalChart
+        filter_lexicon (bool): whether to parse every sentence with only
+            the productions its words can use (see LexicalFilter)
+    """
+
+    def __init__(self, compiled, chart_class, filter_lexicon=True):
+        self._compiled = compiled
+        self._chart_class = chart_class
+        self._filter = LexicalFilter(compiled.cfg) if filter_lexicon else None
+        self._parser = EarleyChartParser(compiled.cfg,
+                                         chart_class=chart_class)
+
+    def grammar(self):
+        return self._compiled.feature_grammar
+
+    def chart_parse(self, tokens, trace=None):
+        parser = self._parser
+        if self._filter is not None:
+            parser = EarleyChartParser(self._filter.restrict(tokens),
+                                       chart_class=self._chart_class)
+        chart = parser.chart_parse(tokens, trace)
+        return CompiledChart(chart, self._compiled)
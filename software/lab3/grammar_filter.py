@@ -0,0 +1,98 @@
+"""
+Per-sentence restriction of a grammar to the productions its words can use.
+
+Most productions of the grammar are lexical (Word, Unk, VARIABLE_NAME and
+the synonyms of every command), and the Earley predictor considers all of
+them at every position of every sentence. Before a parse, LexicalFilter
+works bottom-up from the words of the sentence: a production is kept only
+if every terminal of its right-hand side is one of the words, and every
+category of its right-hand side is the left-hand side of a production that
+is kept. The productions left out can never be part of a parse of the
+sentence, so parsing with the restricted grammar gives the same trees.
+"""
+
+from collections import OrderedDict, defaultdict
+import threading
+
+from nltk.grammar import CFG
+
+# Number of restricted grammars kept, keyed by the set of words they were
+# restricted to: a sentence, its segments and a retry share them.
+_CACHE_SIZE = 32
+
+
+class LexicalFilter(object):
+    """
+    Restricts a CFG to the productions usable with a given set of words.
+
+    Args:
+        grammar (CFG): the grammar to restrict
+    """
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self._productions = grammar.productions()
+        # For every production, the number of distinct symbols of its
+        # right-hand side that must be usable for it to be usable, and
+        # for every symbol, the productions waiting for it.
+        self._needs = []
+        self._waiting = defaultdict(list)
+        self._always = []
+        for i, prod in enumerate(self._productions):
+            symbols = set(prod.rhs())
+            self._needs.append(len(symbols))
+            for symbol in symbols:
+                self._waiting[symbol].append(i)
+            if not symbols:
+                self._always.append(i)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def usable(self, words):
+        """
+        Returns:
+            list of bool: whether each production of the grammar can be used
+                in a sentence made of the given words
+        """
+        needs = list(self._needs)
+        usable = [False] * len(needs)
+        ready = list(self._always)
+        for word in set(words):
+            for i in self._waiting.get(word, ()):
+                needs[i] -= 1
+                if needs[i] == 0:
+                    ready.append(i)
+        usable_lhs = set()
+        while ready:
+            i = ready.pop()
+            usable[i] = True
+            lhs = self._productions[i].lhs()
+            if lhs in usable_lhs:
+                continue
+            usable_lhs.add(lhs)
+            for j in self._waiting.get(lhs, ()):
+                needs[j] -= 1
+                if needs[j] == 0:
+                    ready.append(j)
+        return usable
+
+    def restrict(self, words):
+        """
+        Returns:
+            CFG: the grammar with only the productions usable with the given
+                words, in their original order
+        """
+        key = frozenset(words)
+        with self._lock:
+            grammar = self._cache.pop(key, None)
+        if grammar is None:
+            usable = self.usable(key)
+            grammar = CFG(self.grammar.start(),
+                          [prod for prod, ok in zip(self._productions, usable)
+                           if ok],
+                          calculate_leftcorners=False)
+        with self._lock:
+            self._cache[key] = grammar
+            if len(self._cache) > _CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return grammar
@@ -0,0 +1,173 @@
+"""
+Lightweight timers and counters for the instruction processing pipeline.
+
+Each processed instruction produces one record: a dictionary holding the
+label of the request, the wall-clock time spent in every named stage and
+any counters (number of productions, chart edges, trees, ...) reported
+while the record was open. Finished records are kept in a bounded buffer
+and handed to any registered listeners.
+
+When instrumentation is disabled, timer() returns a shared no-op context
+manager and count() returns immediately, so the hooks can stay in place
+on the hot path.
+"""
+
+from collections import deque
+import threading
+import time
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer(object):
+    def __init__(self, instrumentation, stage):
+        self.instrumentation = instrumentation
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.instrumentation.add_time(self.stage, time.time() - self.start)
+        return False
+
+
+class Instrumentation(object):
+
+    def __init__(self, enabled=False, max_records=1000):
+        self.enabled = enabled
+        self._records = deque(maxlen=max_records)
+        self._listeners = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+
+    def enable(self):
+        self.enabled = True
+
+
+    def disable(self):
+        self.enabled = False
+
+
+    def add_listener(self, listener):
+        """
+        Register a callable that receives every finished record.
+        """
+        self._listeners.append(listener)
+
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+
+    def current_record(self):
+        return getattr(self._local, 'record', None)
+
+
+    def start_record(self, label):
+        """
+        Open a record for the current thread. Stages and counters reported
+        until finish_record() is called are attached to it.
+        """
+        if not self.enabled:
+            return None
+        record = {'label': label,
+                  'started': time.time(),
+                  'stages': {},
+                  'counts': {}}
+        self._local.record = record
+        return record
+
+
+    def finish_record(self, **extra):
+        """
+        Close the record of the current thread and publish it.
+        """
+        record = self.current_record()
+        if record is None:
+            return None
+        self._local.record = None
+        record['total'] = time.time() - record['started']
+        record.update(extra)
+        with self._lock:
+            self._records.append(record)
+        for listener in self._listeners:
+            listener(record)
+        return record
+
+
+    def timer(self, stage):
+        """
+        Context manager that adds the time spent in its body to the given
+        stage of the current record.
+        """
+        if not self.enabled or self.current_record() is None:
+            return _NULL_TIMER
+        return _StageTimer(self, stage)
+
+
+    def add_time(self, stage, seconds):
+        record = self.current_record()
+        if record is None:
+            return
+        record['stages'][stage] = record['stages'].get(stage, 0.0) + seconds
+
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        record = self.current_record()
+        if record is None:
+            return
+        record['counts'][name] = record['counts'].get(name, 0) + value
+
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+
+    def summary(self):
+        """
+        Aggregate the buffered records per stage.
+
+        Returns:
+            dict: maps each stage name to its number of samples and the
+                total, mean and maximum time spent in it.
+        """
+        stages = {}
+        for record in self.records():
+            for stage, seconds in record['stages'].items():
+                entry = stages.setdefault(stage, {'samples': 0,
+                                                  'total': 0.0,
+                                                  'max': 0.0})
+                entry['samples'] += 1
+                entry['total'] += seconds
+                entry['max'] = max(entry['max'], seconds)
+        for entry in stages.values():
+            entry['mean'] = entry['total'] / entry['samples']
+        return stages
+
+
+def count_tree_nodes(tree):
+    return len(tree.treepositions())
+
+
+# Shared instance used by the parser, the REPL and the Flask app.
+instrumentation = Instrumentation()
@@ -17,6 +17,7 @@ import cfg
 from lab3.utils import is_leaf_node, node_to_str_rule_repr, walk_tree
 from semantic_rule_set import SemanticRuleSet
 from category import C
+from profiler import profiler
 
 ################################################################################
 
@@ -307,7 +308,7 @@ def evaluate_node(node, sem_rule_set):
             args.append(str(child))
         else:
             args.append(child.expr)
-    expr = apply(func, args)
+    expr = profiler.action(node.matched_production, func, args)
     return expr
 
 
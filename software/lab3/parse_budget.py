@@ -0,0 +1,188 @@
+"""
+Limits on the amount of work a single parse may do.
+
+A ParseBudget caps the number of chart edges, the wall-clock time and the
+number of trees extracted for one sentence. The chart raises
+ParseBudgetExceeded as soon as a limit is hit, and SemanticRuleSet turns
+it into a ParseResult that records which limit stopped the parse.
+"""
+
+import time
+
+from nltk.featstruct import TYPE, unify
+from nltk.parse.earleychart import IncrementalChart, FeatureIncrementalChart
+from nltk.parse.featurechart import FeatureTreeEdge
+
+from forest import build_chart_forest
+
+# How many new edges may be added between two checks of the clock.
+_CLOCK_CHECK_INTERVAL = 64
+
+
+class ParseBudget(object):
+    """
+    Limits for a single parse. A limit of None means unlimited.
+    """
+
+    def __init__(self, max_edges=None, max_seconds=None, max_trees=None):
+        self.max_edges = max_edges
+        self.max_seconds = max_seconds
+        self.max_trees = max_trees
+
+    def deadline(self):
+        if self.max_seconds is None:
+            return None
+        return time.time() + self.max_seconds
+
+    def __repr__(self):
+        return ("<ParseBudget max_edges=%r max_seconds=%r max_trees=%r>"
+                %(self.max_edges, self.max_seconds, self.max_trees))
+
+
+class BudgetMeter(object):
+    """
+    Counts the edges a chart adds, and raises ParseBudgetExceeded once
+    there are more than its budget allows or the parse has run out of time.
+    The charts of every parser backend report their edges to one.
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget or ParseBudget()
+        self.num_edges = 0
+        self.reset_deadline()
+
+    def reset_deadline(self):
+        self.deadline = self.budget.deadline()
+
+    def add_edge(self):
+        self.num_edges += 1
+        budget = self.budget
+        if (budget.max_edges is not None and
+                self.num_edges > budget.max_edges):
+            raise ParseBudgetExceeded('edges', budget.max_edges,
+                                      self.num_edges)
+        if (self.deadline is not None and
+                self.num_edges % _CLOCK_CHECK_INTERVAL == 0):
+            self.check_deadline()
+
+    def check_deadline(self):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise ParseBudgetExceeded('seconds', self.budget.max_seconds,
+                                      time.time() - self.deadline +
+                                      self.budget.max_seconds)
+
+
+class ParseBudgetExceeded(Exception):
+    """
+    Raised when a parse hits one of the limits of its ParseBudget.
+    """
+
+    def __init__(self, limit, maximum, value):
+        Exception.__init__(self, limit, maximum, value)
+        self.limit = limit
+        self.maximum = maximum
+        self.value = value
+
+    def __str__(self):
+        return ("parse budget exceeded: %s %r > %r"
+                %(self.limit, self.value, self.maximum))
+
+    def as_dict(self):
+        return {'budget_exceeded': self.limit,
+                'maximum': self.maximum,
+                'value': self.value}
+
+
+class ParseResult(object):
+    """
+    The trees found for a sentence, as a sequence of trees.
+
+    The trees are held in a ParseForest and only built when they are
+    iterated over or indexed; len() and best() do not need them.
+    budget_exceeded holds the ParseBudgetExceeded that cut the parse short,
+    or None if the parse ran to completion. When the sentence has more trees
+    than the tree limit allows, the result only holds the first max_trees
+    trees of the forest; for the other limits the result is empty.
+    """
+
+    def __init__(self, trees=(), budget_exceeded=None, forest=None,
+                 max_trees=None):
+        self.forest = forest
+        self._trees = list(trees) if forest is None else None
+        self.budget_exceeded = budget_exceeded
+        self.max_trees = max_trees
+
+    def _capped(self):
+        return (self.max_trees is not None and
+                self.forest.count() > self.max_trees)
+
+    def _list(self):
+        if self._trees is None:
+            self._trees = list(self.forest.trees(self.max_trees))
+        return self._trees
+
+    def __len__(self):
+        if self._trees is None:
+            if self._capped():
+                return self.max_trees
+            return self.forest.count()
+        return len(self._trees)
+
+    def __getitem__(self, index):
+        return self._list()[index]
+
+    def __iter__(self):
+        return iter(self._list())
+
+    def best(self):
+        """
+        The first tree of minimal height among the trees kept, or None if
+        there is no tree.
+        """
+        if self.forest is not None and not self._capped():
+            return self.forest.best_tree()
+        self._list()
+        if not self._trees:
+            return None
+        heights = [tree.height() for tree in self._trees]
+        return self._trees[heights.index(min(heights))]
+
+
+class BudgetedIncrementalChart(IncrementalChart):
+    """
+    An IncrementalChart that stops the parse once it holds more edges, or
+    has been running for longer, than its budget allows.
+    """
+
+    def __init__(self, tokens, budget=None):
+        self._meter = BudgetMeter(budget)
+        IncrementalChart.__init__(self, tokens)
+
+    def _append_edge(self, edge):
+        IncrementalChart._append_edge(self, edge)
+        self._meter.add_edge()
+
+    def check_deadline(self):
+        self._meter.check_deadline()
+
+    def forest(self, root, label=None):
+        """The ParseForest of the trees whose root category is root."""
+        return build_chart_forest(
+            self, [edge for edge in self.select(start=0, end=self._num_leaves,
+                                                lhs=root)
+                   if edge.is_complete()], label)
+
+
+class BudgetedFeatureIncrementalChart(BudgetedIncrementalChart,
+                                      FeatureIncrementalChart):
+    """
+    The FeatureIncrementalChart counterpart of BudgetedIncrementalChart.
+    """
+
+    def forest(self, root, label=None):
+        # The roots are the edges FeatureChart.parses takes trees from.
+        return build_chart_forest(
+            self, [edge for edge in self.select(start=0, end=self._num_leaves)
+                   if isinstance(edge, FeatureTreeEdge) and
+                   edge.is_complete() and edge.lhs()[TYPE] == root[TYPE] and
+                   unify(edge.lhs(), root, rename_vars=True)], label)
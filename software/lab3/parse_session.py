@@ -0,0 +1,252 @@
+"""
+Incremental parsing of an instruction as it is being typed or spoken.
+
+A ParseSession keeps the Earley chart of the words received so far and
+extends it one word at a time, instead of parsing the whole prefix again
+for every new word. After each word it can tell whether the prefix can
+still be completed to a sentence of the grammar, and which categories the
+grammar expects next.
+
+The words of the instruction that the grammar does not know are added to a
+lexicon of the session only, on top of the grammar of the parser: the
+grammar shared by every session and by the full parses is left as it is.
+
+The chart is rebuilt from scratch when the grammar changes (a new parser is
+built after every change to the rule set), when words are added to the
+lexicon of the session, or when the new input is not an extension of the
+previous one (a word was corrected).
+"""
+
+from nltk.featstruct import TYPE
+from nltk.grammar import is_nonterminal
+from nltk.parse.chart import LeafEdge
+from nltk.parse.earleychart import (FeatureCompleterRule, FeatureScannerRule,
+                                    FeaturePredictorRule)
+from nltk.parse.featurechart import FeatureTopDownInitRule
+
+from parse_budget import BudgetedFeatureIncrementalChart
+
+
+class ExtendableFeatureChart(BudgetedFeatureIncrementalChart):
+    """
+    A chart whose sentence can be extended with new words after it has
+    been filled.
+    """
+
+    def append_leaf(self, token):
+        """
+        Add a word at the end of the sentence, along with its leaf edge.
+
+        Returns:
+            LeafEdge: the edge of the new word
+        """
+        self._tokens += (token,)
+        self._num_leaves += 1
+        self._edgelists += ([],)
+        for restr_keys, index in self._indexes.items():
+            self._indexes[restr_keys] = index + ({},)
+        edge = LeafEdge(token, self._num_leaves - 1)
+        self.insert(edge, ())
+        return edge
+
+    def reset_deadline(self):
+        # The time limit of the budget applies to each call, not to the
+        # whole life of the session.
+        self._meter.reset_deadline()
+
+
+def _label(symbol):
+    if is_nonterminal(symbol):
+        symbol = symbol.symbol()
+        if isinstance(symbol, dict):
+            return str(symbol.get(TYPE, symbol))
+    return str(symbol)
+
+
+class LexiconOverlay(object):
+    """
+    A grammar along with lexical productions of its own, which are not added
+    to the grammar.
+
+    Args:
+        grammar (FeatureGrammar): the grammar to extend
+        productions (list of Production): the lexical productions to add
+    """
+
+    def __init__(self, grammar, productions):
+        self._grammar = grammar
+        self._productions = productions
+
+
+    def productions(self, lhs=None, rhs=None, empty=False):
+        prods = self._grammar.productions(lhs, rhs, empty)
+        extra = [prod for prod in self._productions
+                 if (lhs is None or _label(prod.lhs()) == _label(lhs)) and
+                 (rhs is None or prod.rhs()[0] == rhs) and not empty]
+        return prods + extra if extra else prods
+
+
+    def __getattr__(self, name):
+        return getattr(self._grammar, name)
+
+
+class ParseSession(object):
+    """
+    The parse of a partial instruction.
+
+    Args:
+        sem_rule_set (SemanticRuleSet): the rules to parse with
+    """
+
+    def __init__(self, sem_rule_set):
+        self.sem = sem_rule_set
+        self.tokens = []
+        self._parser = None
+        self._grammar = None
+        self._chart = None
+        # The lexical productions of the words of the instruction that the
+        # grammar does not know.
+        self._lexicon = []
+        self._lexicon_set = set()
+        # The number of words that have been fed to the chart and then
+        # processed; only differs from len(tokens) while a word is added.
+        self._done = 0
+
+
+    def reset(self):
+        """Start again from the empty prefix, with the current grammar."""
+        if self.sem.parser is None:
+            self.sem.construct_parser()
+        self._parser = self.sem.parser
+        self._grammar = LexiconOverlay(self._parser.grammar(), self._lexicon)
+        self.tokens = []
+        self._chart = ExtendableFeatureChart([], self.sem.parse_budget)
+        list(FeatureTopDownInitRule().apply(self._chart, self._grammar))
+        self._run_agenda(0, list(self._chart.select(end=0)),
+                         self._rules())
+        self._done = 0
+
+
+    def set_lexicon(self, productions):
+        """
+        Make the lexicon of the session hold the given lexical productions.
+
+        Args:
+            productions (list of Production): productions of the feature
+                grammar of the parser, see SemanticRuleSet.lexicon_productions
+        """
+        if set(productions) != self._lexicon_set:
+            self._lexicon = list(productions)
+            self._lexicon_set = set(productions)
+            # The words already fed may have other categories now.
+            self._chart = None
+
+
+    def update(self, text):
+        """
+        Make the session hold the parse of the given partial instruction,
+        reusing the current chart if the text extends its prefix.
+
+        Args:
+            text (str or list of str): the instruction typed so far
+        """
+        if isinstance(text, basestring):
+            tokens = [token.strip() for token in text.split()]
+        else:
+            tokens = list(text)
+        if (self._chart is None or self._parser is not self.sem.parser or
+                self._done != len(self.tokens) or
+                tokens[:len(self.tokens)] != self.tokens):
+            self.reset()
+        self._chart.reset_deadline()
+        for token in tokens[len(self.tokens):]:
+            self.feed(token)
+        return self
+
+
+    def feed(self, token):
+        """Add a word at the end of the prefix."""
+        if self._chart is None or self._parser is not self.sem.parser:
+            self.update(self.tokens)
+        chart = self._chart
+        n = len(self.tokens)
+        self.tokens.append(token)
+        chart.append_leaf(token)
+
+        # Productions that start with a word were not predicted at the end
+        # of the prefix, since the word was not known yet. Predict again
+        # for every edge that ends there.
+        predictor = FeaturePredictorRule()
+        self._run_agenda(n, list(chart.select(end=n)), [predictor])
+        self._run_agenda(n + 1, list(chart.select(end=n + 1)),
+                         self._rules())
+        self._done = len(self.tokens)
+
+
+    def _rules(self):
+        # The predictor caches what it has done for a given chart, which no
+        # longer holds once the chart is extended: use fresh rules.
+        return [FeatureCompleterRule(), FeatureScannerRule(),
+                FeaturePredictorRule()]
+
+
+    def _run_agenda(self, end, agenda, rules):
+        grammar = self._grammar
+        while agenda:
+            edge = agenda.pop()
+            for rule in rules:
+                for new_edge in rule.apply(self._chart, grammar, edge):
+                    if new_edge.end() == end:
+                        agenda.append(new_edge)
+
+
+    def _edges_at_end(self):
+        return [edge for edge in self._chart.select(end=len(self.tokens))
+                if not isinstance(edge, LeafEdge)]
+
+
+    def viable(self):
+        """Whether the prefix is the start of a sentence of the grammar."""
+        if self._chart is None:
+            self.reset()
+        # Every edge that ends after the last word was either built from
+        # it, or predicted from such an edge.
+        return len(self._edges_at_end()) > 0
+
+
+    def complete(self):
+        """Whether the prefix is itself a sentence of the grammar."""
+        if self._chart is None:
+            self.reset()
+        start = self._grammar.start()
+        return self._chart.forest(start).count() > 0
+
+
+    def expected_categories(self):
+        """
+        Returns:
+            list of str: the categories that can follow the prefix
+        """
+        if self._chart is None:
+            self.reset()
+        expected = set()
+        for edge in self._edges_at_end():
+            if not edge.is_complete():
+                expected.add(_label(edge.nextsym()))
+        return sorted(expected)
+
+
+    def trees(self):
+        """The trees of the prefix, if it is a complete sentence."""
+        if self._chart is None:
+            self.reset()
+        return self.sem.extract_trees(self._chart)
+
+
+    def status(self):
+        return {
+            'tokens': list(self.tokens),
+            'viable': self.viable(),
+            'complete': self.complete(),
+            'expected': self.expected_categories(),
+        }
@@ -0,0 +1,59 @@
+"""
+The parsers SemanticRuleSet can parse with, by name.
+
+A backend is a function that takes the rule set and its feature grammar,
+and returns a parser with the interface of FeatureEarleyChartParser that
+SemanticRuleSet relies on:
+
+    parser.grammar() is the feature grammar,
+    parser.chart_parse(tokens) returns a chart whose parses(start) are the
+    trees of the sentence, and which has num_edges() and check_deadline().
+
+Backends that parse the compiled form of the grammar raise
+GrammarNotCompilable when the grammar needs unification.
+"""
+
+from collections import OrderedDict
+
+from nltk import parse
+
+from cky_parser import CKYParser
+from grammar_compiler import compile_feature_grammar, CompiledFeatureParser
+
+_backends = OrderedDict()
+
+
+def register_parser_backend(name, factory):
+    _backends[name] = factory
+
+
+def parser_backend_names():
+    return list(_backends)
+
+
+def create_parser(name, sem_rule_set, feature_grammar):
+    if name not in _backends:
+        raise ValueError("Unknown parser backend %r, expected one of %s"
+                         %(name, ', '.join(_backends)))
+    return _backends[name](sem_rule_set, feature_grammar)
+
+
+def _earley(sem_rule_set, feature_grammar):
+    return parse.FeatureEarleyChartParser(feature_grammar,
+                                          chart_class=sem_rule_set.new_chart)
+
+
+def _compiled(sem_rule_set, feature_grammar):
+    return CompiledFeatureParser(compile_feature_grammar(feature_grammar),
+                                 chart_class=sem_rule_set.new_cfg_chart,
+                                 filter_lexicon=sem_rule_set.filter_lexicon)
+
+
+def _cky(sem_rule_set, feature_grammar):
+    return CKYParser(compile_feature_grammar(feature_grammar),
+                     budget=lambda: sem_rule_set.parse_budget)
+
+
+register_parser_backend('earley', _earley)
+register_parser_backend('compiled', _compiled)
+register_parser_backend('cky', _cky)
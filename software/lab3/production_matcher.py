@@ -8,6 +8,7 @@ from nltk.featstruct import Feature
 from category import Category
 from lab3.utils import is_leaf_node, walk_tree, node_to_str_repr
 from lambda_interpreter import lambdastr
+from profiler import profiler
 
 def match_terminal(terminal, term):
     if type(terminal) is str:
@@ -151,6 +152,8 @@ def decorate_parse_tree(tree, sem_rule_set, set_productions_to_labels=False):
 
             prod_rules.append((node, matching_rules))
         node.matched_production = matching_rules[0]
+        if not set_productions_to_labels:
+            profiler.hit(node.matched_production)
         if set_productions_to_labels:
             node.set_label(node_to_str_repr(node))
 
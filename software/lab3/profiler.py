@@ -0,0 +1,220 @@
+"""
+Counts of how the productions of the grammar are used.
+
+When enabled, the profiler counts the productions matched to the nodes of
+every evaluated parse tree, the time spent in the semantic rule of every
+production and the errors it raises, and for every sentence that fails to
+parse, the categories the grammar expected at the word where the parse
+broke down.
+
+The counts are kept in memory and added to the profile file on save(), so
+that the profile covers every run (and every process) that used the same
+file. Use scripts/rule_report.py to rank the productions of the profile.
+"""
+
+import atexit
+import errno
+import json
+import os
+import threading
+import time
+
+from parse_budget import ParseBudgetExceeded
+from parse_session import ParseSession
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def _new_profile():
+    return {'sentences': 0,
+            'failed_sentences': 0,
+            # production -> {'hits', 'seconds', 'errors'}
+            'productions': {},
+            # category -> number of failed sentences that broke down where
+            # the category was expected
+            'expected_at_failure': {},
+            # word -> number of failed sentences that broke down at it
+            'failed_at_word': {}}
+
+
+def merge_profiles(total, profile):
+    """Add the counts of a profile to those of another one, in place."""
+    total['sentences'] += profile['sentences']
+    total['failed_sentences'] += profile['failed_sentences']
+    for rule, counts in profile['productions'].items():
+        entry = total['productions'].setdefault(
+            rule, {'hits': 0, 'seconds': 0.0, 'errors': 0})
+        for name, value in counts.items():
+            entry[name] = entry.get(name, 0) + value
+    for key in ('expected_at_failure', 'failed_at_word'):
+        for name, value in profile[key].items():
+            total[key][name] = total[key].get(name, 0) + value
+    return total
+
+
+def load_profile(path):
+    """The profile saved in a file, or an empty one if there is none."""
+    try:
+        with open(path) as f:
+            return merge_profiles(_new_profile(), json.load(f))
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return _new_profile()
+
+
+def failure_point(sem_rule_set, tokens):
+    """
+    Find where a sentence stops being the start of a sentence of the
+    grammar.
+
+    Returns:
+        (str, list of str): the word at which the parse broke down (None if
+            the sentence is only incomplete), and the categories expected
+            right before it
+    """
+    session = ParseSession(sem_rule_set)
+    session.reset()
+    expected = session.expected_categories()
+    for token in tokens:
+        session.feed(token)
+        if not session.viable():
+            return token, expected
+        expected = session.expected_categories()
+    return None, expected
+
+
+class RuleProfiler(object):
+    """
+    Args:
+        enabled (bool): whether to count anything
+        path (str): the file the counts are added to on save(), if any
+        save_every (int): number of sentences after which the counts are
+            saved
+    """
+
+    def __init__(self, enabled=False, path=None, save_every=50):
+        self.enabled = enabled
+        self.path = path
+        self.save_every = save_every
+        self._pending = _new_profile()
+        self._lock = threading.Lock()
+        self._registered = False
+
+
+    def enable(self, path=None):
+        self.enabled = True
+        if path is not None:
+            self.path = path
+        if self.path is not None and not self._registered:
+            atexit.register(self.save)
+            self._registered = True
+
+
+    def disable(self):
+        self.enabled = False
+
+
+    def _entry(self, production):
+        return self._pending['productions'].setdefault(
+            str(production), {'hits': 0, 'seconds': 0.0, 'errors': 0})
+
+
+    def hit(self, production):
+        """Count a production matched to a node of a parse tree."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entry(production)['hits'] += 1
+
+
+    def action(self, production, func, args):
+        """
+        Apply the semantic rule of a production, counting the time it takes
+        and the errors it raises.
+        """
+        if not self.enabled:
+            return apply(func, args)
+        start = time.time()
+        try:
+            return apply(func, args)
+        except Exception:
+            with self._lock:
+                self._entry(production)['errors'] += 1
+            raise
+        finally:
+            seconds = time.time() - start
+            with self._lock:
+                self._entry(production)['seconds'] += seconds
+
+
+    def sentence(self, sem_rule_set, sentence, parsed):
+        """
+        Count a sentence. For a sentence that did not parse, find where the
+        parse broke down.
+        """
+        if not self.enabled:
+            return
+        word, expected = None, []
+        if not parsed:
+            try:
+                word, expected = failure_point(sem_rule_set, sentence.split())
+            except ParseBudgetExceeded:
+                pass
+        with self._lock:
+            pending = self._pending
+            pending['sentences'] += 1
+            if not parsed:
+                pending['failed_sentences'] += 1
+                if word is not None:
+                    pending['failed_at_word'][word] = (
+                        pending['failed_at_word'].get(word, 0) + 1)
+                for category in expected:
+                    pending['expected_at_failure'][category] = (
+                        pending['expected_at_failure'].get(category, 0) + 1)
+            save = (self.path is not None and
+                    pending['sentences'] >= self.save_every)
+        if save:
+            self.save()
+
+
+    def profile(self):
+        """The counts of the profile file along with those not saved yet."""
+        with self._lock:
+            pending = merge_profiles(_new_profile(), self._pending)
+        if self.path is None:
+            return pending
+        return merge_profiles(load_profile(self.path), pending)
+
+
+    def save(self):
+        """Add the counts made since the last save to the profile file."""
+        if self.path is None:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, _new_profile()
+        if not pending['sentences'] and not pending['productions']:
+            return
+        # Several processes may share the file: hold a lock on it while
+        # merging, and replace it in one step.
+        with open(self.path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            total = merge_profiles(load_profile(self.path), pending)
+            temporary = '%s.%d.tmp' %(self.path, os.getpid())
+            with open(temporary, 'w') as f:
+                json.dump(total, f, indent=1, sort_keys=True)
+            os.rename(temporary, self.path)
+
+
+    def reset(self):
+        with self._lock:
+            self._pending = _new_profile()
+
+
+# Shared instance used by the tree decoration, the evaluation, the REPL
+# and the Flask app.
+profiler = RuleProfiler()
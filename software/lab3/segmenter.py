@@ -0,0 +1,312 @@
+"""
+Splitting of long multi-command utterances into separately parsed segments.
+
+An utterance such as "play the meow sound and wait 2 seconds and then say
+hello" is an action list: its commands are joined by the AL -> AP And AL
+rule or introduced by a sequence adverb (AL -> SequentialCommand ->
+SequenceAdverb AL). Earley parsing is at least cubic in the length of the
+sentence, so such utterances are much cheaper to parse one command at a
+time. The action list of the whole utterance is the concatenation of the
+action lists of its commands.
+
+The split is only made where the grammar says it is safe:
+
+  * A guard category is derived from every production that embeds an
+    action list (if ... thats it, repeat ... until, when ...) or a
+    category that can absorb a coordinator (a word phrase that may contain
+    "and"). It is the closed-class category of the production whose words
+    are the least common in the rest of the grammar. If a word of any guard category occurs
+    in the utterance, the utterance is parsed whole.
+  * A coordinator is not split on when the word that follows it can start
+    the category a production expects right after the coordinator (as in
+    "broadcast hello and wait").
+  * Every segment must parse on its own, otherwise the utterance is parsed
+    whole.
+"""
+
+from collections import defaultdict
+
+import cfg
+
+
+def _is_nonterminal(symbol):
+    return isinstance(symbol, cfg.Nonterminal)
+
+
+class GrammarIndex(object):
+    """
+    The facts about a list of productions that the segmenter needs, keyed
+    by the string form of the categories.
+    """
+
+    def __init__(self, productions, open_categories=()):
+        self.productions = productions
+        self.by_lhs = defaultdict(list)
+        for prod in productions:
+            self.by_lhs[str(prod.lhs())].append(prod)
+        self.first = self._first_sets()
+        self.open = self._open_categories(set(open_categories))
+        # number of productions in which each word can start a symbol
+        self.word_uses = defaultdict(int)
+        for prod in productions:
+            words = set()
+            for symbol in prod.rhs():
+                if _is_nonterminal(symbol):
+                    words |= self.first[str(symbol)]
+            for word in words:
+                self.word_uses[word] += 1
+
+
+    def _first_sets(self):
+        """
+        Compute the words each category can start with.
+        """
+        first = defaultdict(set)
+        changed = True
+        while changed:
+            changed = False
+            for prod in self.productions:
+                rhs = prod.rhs()
+                if len(rhs) == 0:
+                    continue
+                lhs = str(prod.lhs())
+                if _is_nonterminal(rhs[0]):
+                    words = first[str(rhs[0])]
+                else:
+                    words = set([rhs[0]])
+                if not words <= first[lhs]:
+                    first[lhs] |= words
+                    changed = True
+        return first
+
+
+    def _open_categories(self, open_categories):
+        """
+        Extend the categories whose words depend on the utterance (names,
+        unknown words, ...) to every category that can start with one of
+        them.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for prod in self.productions:
+                rhs = prod.rhs()
+                lhs = str(prod.lhs())
+                if (lhs not in open_categories and len(rhs) > 0 and
+                        _is_nonterminal(rhs[0]) and
+                        str(rhs[0]) in open_categories):
+                    open_categories.add(lhs)
+                    changed = True
+        return open_categories
+
+
+    def rarest_closed_category(self, symbols, exclude):
+        """
+        Of the given symbols, return the closed-class category that is the
+        most specific to them: the one whose most common word starts a
+        symbol in the fewest productions, then the one that can start with
+        the fewest words. Returns None if there is no such category.
+        """
+        best = None
+        for symbol in symbols:
+            if not _is_nonterminal(symbol):
+                continue
+            name = str(symbol)
+            if name in exclude or name in self.open or not self.first[name]:
+                continue
+            words = self.first[name]
+            rank = (max(self.word_uses[w] for w in words), len(words))
+            if best is None or rank < best[0]:
+                best = (rank, name)
+        return best and best[1]
+
+
+class Segmenter(object):
+    """
+    Splits utterances into segments that can be parsed independently.
+
+    Args:
+        sem_rule_set (SemanticRuleSet): the rules used to parse the segments
+        min_tokens (int): utterances shorter than this are never split, or
+            None to never split utterances
+        open_categories (iterable of str): categories whose words are
+            extracted from the utterance itself
+        action_list (str): the category of a list of actions
+        coordinator (str): the category of the word joining two actions
+        sequence_adverb (str): the category of the words that start a new
+            action in a sequence
+    """
+
+    def __init__(self, sem_rule_set, min_tokens=None, open_categories=(),
+                 action_list='AL', coordinator='And',
+                 sequence_adverb='SequenceAdverb'):
+        self.sem = sem_rule_set
+        self.min_tokens = min_tokens
+        self.open_categories = set(open_categories)
+        self.action_list = action_list
+        self.coordinator = coordinator
+        self.sequence_adverb = sequence_adverb
+        self._num_productions = None
+        self._index = None
+        self._guards = None
+
+
+    def index(self):
+        # Productions are only ever appended to the rule set, so the number
+        # of productions identifies the grammar the cached facts describe.
+        if self._num_productions != len(self.sem.productions):
+            self._index = GrammarIndex(list(self.sem.productions),
+                                       self.open_categories)
+            self._guards = self._find_guards(self._index)
+            self._num_productions = len(self.sem.productions)
+        return self._index
+
+
+    def _pass_through_categories(self, index):
+        """
+        The categories whose productions only wrap an action list in another
+        action list: the action list itself, the categories it rewrites to
+        on its own (SequentialCommand, OrderedCommand) and the categories
+        that rewrite to it on their own (S, Start).
+        """
+        categories = set([self.action_list])
+        for prod in index.by_lhs[self.action_list]:
+            rhs = prod.rhs()
+            if len(rhs) == 1 and _is_nonterminal(rhs[0]):
+                categories.add(str(rhs[0]))
+        changed = True
+        while changed:
+            changed = False
+            for prod in index.productions:
+                rhs = prod.rhs()
+                lhs = str(prod.lhs())
+                if (lhs not in categories and len(rhs) == 1 and
+                        _is_nonterminal(rhs[0]) and str(rhs[0]) in categories):
+                    categories.add(lhs)
+                    changed = True
+        return categories
+
+
+    def _find_guards(self, index):
+        """
+        Returns:
+            (set of str, list of (set of str, set of str)): the words that
+                prevent an utterance from being split, and the words before
+                which a coordinator is not a split point, each along with
+                the words that must occur earlier in the utterance for the
+                rule to apply (None if the rule always applies)
+        """
+        coordinator_words = index.first[self.coordinator]
+        pass_through = self._pass_through_categories(index)
+
+        # Categories that can span a coordinator: the action list, and any
+        # category with a recursive production over words that include one
+        # (a word phrase, once "and" has been seen as a word). Productions
+        # that name the coordinator explicitly are handled further down.
+        spanning = set([self.action_list])
+        for prod in index.productions:
+            lhs = str(prod.lhs())
+            rhs = [str(s) for s in prod.rhs() if _is_nonterminal(s)]
+            if lhs in rhs and any(index.first[s] & coordinator_words
+                                  for s in rhs
+                                  if s not in (lhs, self.coordinator)):
+                spanning.add(lhs)
+
+        guard_words = set()
+        no_split_before = []
+        worklist = list(spanning)
+        while worklist:
+            category = worklist.pop()
+            for prod in index.productions:
+                lhs = str(prod.lhs())
+                names = [str(s) for s in prod.rhs()]
+                if category not in names or lhs in pass_through:
+                    continue
+                exclude = spanning | set([lhs, self.coordinator])
+                guard = index.rarest_closed_category(prod.rhs(), exclude)
+                if guard is not None:
+                    guard_words |= index.first[guard]
+                elif lhs not in spanning:
+                    spanning.add(lhs)
+                    worklist.append(lhs)
+
+        for prod in index.productions:
+            lhs = str(prod.lhs())
+            if lhs in pass_through:
+                continue
+            rhs = prod.rhs()
+            names = [str(s) for s in rhs]
+            for i, name in enumerate(names[:-1]):
+                if name != self.coordinator:
+                    continue
+                following = names[i+1]
+                exclude = set([lhs, following, self.coordinator,
+                               self.action_list])
+                guard = index.rarest_closed_category(rhs[:i], exclude)
+                if following not in index.open and index.first[following]:
+                    # e.g. "broadcast hello and wait": only a coordinator
+                    # preceded by "broadcast" is kept before "wait".
+                    trigger = index.first[guard] if guard else None
+                    no_split_before.append((trigger,
+                                            index.first[following]))
+                elif guard is not None:
+                    guard_words |= index.first[guard]
+        return guard_words, no_split_before
+
+
+    def split(self, sentence):
+        """
+        Split a sentence at its top-level coordinators and sequence adverbs.
+
+        Returns:
+            list of str: the segments of the sentence, or a list holding
+                only the sentence if it should not be split
+        """
+        tokens = sentence.split()
+        if self.min_tokens is None or len(tokens) < self.min_tokens:
+            return [sentence]
+        index = self.index()
+        guard_words, no_split_before = self._guards
+        if any(token in guard_words for token in tokens):
+            return [sentence]
+
+        coordinator_words = index.first[self.coordinator]
+        adverb_words = index.first[self.sequence_adverb]
+        segments = [[]]
+        for i, token in enumerate(tokens):
+            last = i == len(tokens) - 1
+            if (token in coordinator_words and segments[-1] and not last and
+                    not self._keeps_coordinator(tokens, i, no_split_before)):
+                segments.append([])
+                continue
+            if token in adverb_words and segments[-1] and not last:
+                segments.append([])
+            segments[-1].append(token)
+        if len(segments) < 2 or not all(segments):
+            return [sentence]
+        return [' '.join(segment) for segment in segments]
+
+
+    def _keeps_coordinator(self, tokens, i, no_split_before):
+        for trigger, following in no_split_before:
+            if tokens[i+1] in following and (
+                    trigger is None or
+                    any(token in trigger for token in tokens[:i])):
+                return True
+        return False
+
+
+    def parse(self, sentence):
+        """
+        Parse a sentence one segment at a time.
+
+        Returns:
+            list of ParseResult: the trees of every segment, in order, or
+                the trees of the whole sentence if it could not be split
+        """
+        segments = self.split(sentence)
+        if len(segments) > 1:
+            results = [self.sem.parse_sentence(s) for s in segments]
+            if all(len(trees) > 0 for trees in results):
+                return results
+        return [self.sem.parse_sentence(sentence)]
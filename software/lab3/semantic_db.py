@@ -1,5 +1,7 @@
 
+import os
 import sqlite3
+import threading
 
 from category import Variable
 import featurelite
@@ -43,58 +45,142 @@ def extract_feature_dict(event_struct):
             'locative': extract_feature('locative', event_struct)}
 
 
+# The columns of the knowledge table, in the order they are stored and
+# printed.
+COLUMNS = ('action', 'agent', 'patient', 'beneficiary', 'tense', 'locative')
+
+
 class SemanticDatabase(object):
-    def __init__(self):
-        self.db = sqlite3.connect(":memory:")
-        self.db.row_factory = sqlite3.Row
-        c = self.db.cursor()
-        c.execute("CREATE TABLE knowledge (action VARCHAR, agent VARCHAR, patient VARCHAR, beneficiary VARCHAR, tense VARCHAR, locative VARCHAR)")
-    
-    
-    def add_fact(self, event_struct):
+    """
+    The facts learned from the utterances, as rows of a sqlite table with
+    one column per role of the event (NULL for the roles it leaves out).
+
+    The table holds every fact once: adding a fact that is already known
+    does nothing. Queries are looked up through an index on (action, agent,
+    patient), the roles nearly every question binds.
+
+    Args:
+        path (str): the file the facts are kept in, so that they persist
+            across runs and are not bounded by memory, or None to keep them
+            in memory only
+    """
+
+    _INSERT = "INSERT OR IGNORE INTO knowledge (%s) VALUES (%s)"%(
+        ', '.join(COLUMNS), ', '.join(['?'] * len(COLUMNS)))
+
+
+    def __init__(self, path=None):
+        self.path = path
+        self._db = None
+        self._pid = None
+        # sqlite connections are shared by the request threads of the
+        # server.
+        self._lock = threading.RLock()
+        # The text of the queries, by the roles they bind, so that sqlite
+        # finds them in its cache of prepared statements.
+        self._queries = {}
+
+
+    @property
+    def db(self):
+        # A connection to a file cannot be used across a fork: every
+        # process opens its own, the first time it needs one. An in-memory
+        # database is private to the process, and is copied along with it.
+        if self._db is None or (self.path and self._pid != os.getpid()):
+            self._db = self._connect()
+            self._pid = os.getpid()
+        return self._db
+
+
+    def _connect(self):
+        db = sqlite3.connect(self.path or ":memory:", timeout=30,
+                             check_same_thread=False, cached_statements=256)
+        db.row_factory = sqlite3.Row
+        if self.path:
+            # Readers of a file shared by several processes do not wait for
+            # its writers.
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS knowledge (%s)"
+                   %(', '.join(["%s VARCHAR"%(k) for k in COLUMNS])))
+        db.execute("CREATE INDEX IF NOT EXISTS knowledge_event "
+                   "ON knowledge (action, agent, patient)")
+        # NULLs are distinct from each other in a UNIQUE index, so missing
+        # roles are indexed as empty strings (which no role prints as).
+        db.execute("CREATE UNIQUE INDEX IF NOT EXISTS knowledge_fact "
+                   "ON knowledge (%s)"
+                   %(', '.join(["IFNULL(%s, '')"%(k) for k in COLUMNS])))
+        db.commit()
+        return db
+
+
+    def _query(self, kind, *keys):
+        query = self._queries.get((kind, keys))
+        if query is None:
+            bound = keys[-1]
+            condition = " WHERE " + " and ".join([k + "=?" for k in bound]) if bound else ""
+            if kind == 'count':
+                query = "SELECT COUNT(*) FROM knowledge" + condition
+            else:
+                query = "SELECT DISTINCT %s FROM knowledge%s"%(keys[0], condition)
+            self._queries[(kind, keys)] = query
+        return query
+
+
+    def _row(self, event_struct):
         fd = extract_feature_dict(event_struct)
-        non_null_keys = [k for k, v in fd.iteritems() if v[1] != 'NULL']
-        query = "INSERT INTO knowledge (%s) VALUES (%s)"%(', '.join(non_null_keys),
-                                                          ', '.join(['?']*len(non_null_keys)))
-        vals = tuple([fd[k][1] for k in non_null_keys])
-        c = self.db.cursor()
-        c.execute(query, vals)
+        return tuple([fd[k][1] if fd[k][1] != 'NULL' else None
+                      for k in COLUMNS])
+
+
+    def add_fact(self, event_struct):
+        """
+        Returns:
+            bool: whether the fact was not known yet
+        """
+        with self._lock:
+            c = self.db.execute(self._INSERT, self._row(event_struct))
+            self.db.commit()
+            return c.rowcount > 0
+
+
+    def add_facts(self, event_structs):
+        """Add many facts in one transaction."""
+        with self._lock:
+            self.db.executemany(self._INSERT,
+                                [self._row(e) for e in event_structs])
+            self.db.commit()
 
 
     def print_knowledge(self):
-        c = self.db.cursor()
-        c.execute("SELECT * FROM knowledge")
-        # Do not print duplicate entries.
-        es = set()
-        for row in c.fetchall():
-            e = "[" + ", ".join(["%s=%s"%(k,row[k]) for k in row.keys()]) + "]"
-            if e not in es:
-                es.add(e)
-                print e
+        with self._lock:
+            rows = self.db.execute("SELECT %s FROM knowledge ORDER BY rowid"
+                                   %(', '.join(COLUMNS))).fetchall()
+        for row in rows:
+            print "[" + ", ".join(["%s=%s"%(k,row[k]) for k in row.keys()]) + "]"
 
 
     def yesno_query(self, event_struct):
         fd = extract_feature_dict(event_struct)
-        non_null_keys = [k for k, v in fd.iteritems() if v[1] != 'NULL']
-        query = "SELECT COUNT(*) FROM knowledge WHERE %s"%(" and ".join([x + "=?" for x in non_null_keys]))
+        non_null_keys = tuple([k for k in COLUMNS if fd[k][1] != 'NULL'])
         vals = tuple([fd[k][1] for k in non_null_keys])
-        c = self.db.cursor()
-        c.execute(query, vals)
-        num_instances = c.fetchone()[0]
+        with self._lock:
+            c = self.db.execute(self._query('count', non_null_keys), vals)
+            num_instances = c.fetchone()[0]
         return num_instances > 0
 
 
     def wh_query(self, event_struct):
         fd = extract_feature_dict(event_struct)
-        non_null_keys = [k for k, v in fd.iteritems() if v[1] != 'NULL']
+        non_null_keys = [k for k in COLUMNS if fd[k][1] != 'NULL']
         wh_keys = [k for k in non_null_keys if fd[k][1].startswith('?')]
-        non_wh_keys = [k for k in non_null_keys if not fd[k][1].startswith('?')]
+        non_wh_keys = tuple([k for k in non_null_keys
+                             if not fd[k][1].startswith('?')])
 
-        c = self.db.cursor()
         if len(wh_keys) == 1:
-            condition = ' and '.join([k+'=?' for k in non_wh_keys])
-            query = "SELECT %s FROM knowledge WHERE %s"%(wh_keys[0], condition)
             vals = tuple([fd[k][1] for k in non_wh_keys])
-            c.execute(query, vals)
-            return set(row[0] for row in c if row[0] is not None)
+            with self._lock:
+                c = self.db.execute(
+                    self._query('select', wh_keys[0], non_wh_keys), vals)
+                return set(row[0] for row in c if row[0] is not None)
         return []
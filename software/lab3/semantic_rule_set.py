@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 
 import nltk
-from nltk import grammar, parse
+from nltk import grammar
 import sys
 from category import Category, GrammarCategory
 import cfg
 from semantic_db import SemanticDatabase
+from instrumentation import instrumentation
+from parse_budget import (ParseBudget, ParseBudgetExceeded, ParseResult,
+                          BudgetedIncrementalChart,
+                          BudgetedFeatureIncrementalChart)
+from grammar_compiler import GrammarNotCompilable
+from parser_backends import create_parser
 
 class SemanticRuleSet:
 
@@ -14,10 +20,33 @@ class SemanticRuleSet:
         self.lexicon = []
         self.syn_sem_dict = {}
         self.productions = []
+        # The productions and the words of their right-hand sides, to add
+        # every production once and to look up words without going
+        # through the productions.
+        self.production_set = set()
+        self.terminals = set()
+        self._parsed_rules = {}
         self.learned = SemanticDatabase()
+        self.parse_budget = ParseBudget()
+        # The name of the parser to use, see parser_backends. Backends that
+        # parse the plain context-free form of the grammar fall back to
+        # 'earley' when the grammar needs unification.
+        self.parser_backend = 'compiled'
+        # Leave out, for every sentence, the productions its words cannot
+        # use. Only applies to the 'compiled' backend.
+        self.filter_lexicon = True
 
 
     def parse_rule(self, text):
+        # Rules are parsed once; productions are immutable, so the same
+        # one can be shared.
+        rule = self._parsed_rules.get(text)
+        if rule is None:
+            rule = self._parsed_rules[text] = self._parse_rule(text)
+        return rule
+
+
+    def _parse_rule(self, text):
         # Remove the start and end quotes
         tokens = text.split()
         if (len(tokens) > 3 and "'" in text):
@@ -39,37 +68,92 @@ class SemanticRuleSet:
 
 
     def add_match(self, syntactic_rule, semantic_rule):
-        self.parser = None
         if isinstance(syntactic_rule, str):
             syntactic_rule = self.parse_rule(syntactic_rule)
         self.syn_sem_dict[syntactic_rule] = semantic_rule
 
 
-    def add_rule(self, syntactic_rule, semantic_rule):
+    def add_production(self, production):
+        """
+        Add a production to the grammar, unless it is already there. The
+        parser is only rebuilt when the grammar changes.
+
+        Returns:
+            bool: whether the production is new
+        """
+        if production in self.production_set:
+            return False
         self.parser = None
+        self.production_set.add(production)
+        self.productions.append(production)
+        for symbol in production.rhs():
+            if not isinstance(symbol, cfg.Nonterminal):
+                self.terminals.add(symbol)
+        return True
+
+
+    def add_rule(self, syntactic_rule, semantic_rule):
         # Cast syntactic_rule to a string so that we can properly handle unicode
         # characters and strings.
         syntactic_rule = str(syntactic_rule)
         syntactic_rule = self.parse_rule(syntactic_rule)
         self.add_match(syntactic_rule, semantic_rule)
-        self.productions.append(syntactic_rule)
+        self.add_production(syntactic_rule)
 
 
     def add_lexicon_rule(self, lhs, words, func):
+        """
+        Add the production lhs -> 'word' for every word, all with the same
+        semantic rule. The productions are built directly, without writing
+        and parsing a rule for every word.
+
+        Args:
+            lhs (str): the category of the words
+            words (iterable of str): the words
+            func (function): the semantic rule of the productions
+        """
+        lhs = GrammarCategory.parse(str(lhs))
         for w in words:
-            self.add_rule("%s -> '%s'"%(lhs, w), func)
+            prod = cfg.Production(lhs, [str(w)])
+            self.syn_sem_dict[prod] = func
+            self.add_production(prod)
+
+
+    def lexicon_productions(self, vocab):
+        """
+        The productions the parser would be built with if the words of a
+        vocabulary were added to the grammar, without adding them. Words
+        already in the grammar with the same category are left out.
+
+        Args:
+            vocab (dict): map of each category to a list of words
+
+        Returns:
+            list of nltk.grammar.Production: the feature grammar productions
+                of the new words
+        """
+        prods = []
+        for lhs in vocab:
+            category = GrammarCategory.parse(str(lhs))
+            for w in vocab[lhs]:
+                prod = cfg.Production(category, [str(w)])
+                if prod not in self.production_set:
+                    prods.append(prod)
+        if not prods:
+            return []
+        return grammar.FeatureGrammar.fromstring(
+            '\n'.join(map(str, prods))).productions()
 
 
     def add_lexicon(self, preterminal, terminals):
-        self.parser = None
         if isinstance(preterminal, str):
             preterminal = Category.parse(preterminal)
             if not isinstance(preterminal, cfg.Nonterminal):
                 preterminal = cfg.Nonterminal(preterminal)
         for terminal in terminals:
             prod = cfg.Production(preterminal, [terminal])
-            self.lexicon.append(prod)
-            self.productions.append(prod)
+            if self.add_production(prod):
+                self.lexicon.append(prod)
 
 
     def validate_production_rules(self, productions):
@@ -88,20 +172,59 @@ class SemanticRuleSet:
 
     def construct_parser(self):
         g = self.construct_feature_grammar()
-        self.parser = parse.FeatureEarleyChartParser(g)
+        try:
+            self.parser = create_parser(self.parser_backend, self, g)
+        except GrammarNotCompilable as e:
+            print "[WARNING] Parsing with unification: " + str(e)
+            self.parser = create_parser('earley', self, g)
+
+
+    def new_chart(self, tokens):
+        # Called by the parser at the start of every parse, so the budget
+        # in effect (and its clock) is the one current at that time.
+        return BudgetedFeatureIncrementalChart(tokens, self.parse_budget)
+
+
+    def new_cfg_chart(self, tokens):
+        return BudgetedIncrementalChart(tokens, self.parse_budget)
 
 
     def parse_sentence(self, sentence):
         if self.parser == None:
-            self.construct_parser()
+            with instrumentation.timer('construct_parser'):
+                self.construct_parser()
+        instrumentation.count('productions', len(self.productions))
         tokens = [token.strip() for token in sentence.split()]
         try:
-            trees = self.parser.parse(tokens)
-            # deduplicate trees, hashing by string value
-            trees = {str(t):t for t in trees}.values()
-            return trees
+            with instrumentation.timer('parse'):
+                chart = self.parser.chart_parse(tokens)
+                trees = self.extract_trees(chart)
+            instrumentation.count('chart_edges', chart.num_edges())
+            instrumentation.count('trees', len(trees))
+        except ParseBudgetExceeded as e:
+            trees = ParseResult([], budget_exceeded=e)
         except:
-            return []
+            return ParseResult()
+        if trees.budget_exceeded is not None:
+            instrumentation.count('budget_exceeded')
+        return trees
+
+
+    def extract_trees(self, chart):
+        """
+        Collect the distinct trees of a chart, as a packed forest. The tree
+        limit of the parse budget is checked against the number of trees,
+        which does not require building them; past the limit, only the
+        first max_trees trees are kept.
+        """
+        forest = chart.forest(self.parser.grammar().start())
+        max_trees = self.parse_budget.max_trees
+        exceeded = None
+        num_trees = forest.count()
+        if max_trees is not None and num_trees > max_trees:
+            exceeded = ParseBudgetExceeded('trees', max_trees, num_trees)
+        return ParseResult(forest=forest, budget_exceeded=exceeded,
+                           max_trees=max_trees)
 
 
     def add_verb(self, form, root, past, present, ppart=None):
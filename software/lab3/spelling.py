@@ -0,0 +1,212 @@
+"""
+Correction of misspelled keywords.
+
+A word of an utterance that the grammar does not know is added to it as an
+unknown word (Unk), which can stand for many categories: a misspelled
+keyword ("brodcast") makes the sentence fail to parse, or parse in many
+ways. A KeywordCorrector takes an unknown word for a keyword of the grammar
+when the keyword is within a small edit distance of it, and no other
+keyword is as close.
+
+The keywords are held in a BK-tree, which finds the words within a given
+distance of a word without comparing it to every keyword.
+"""
+
+import cfg
+
+
+def edit_distance(a, b):
+    """
+    The number of insertions, deletions, substitutions and transpositions
+    of adjacent characters that turn a into b (optimal string alignment).
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    previous = None
+    row = range(len(b) + 1)
+    for i in range(1, len(a) + 1):
+        before, previous, row = previous, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i-1] == b[j-1] else 1
+            row[j] = min(previous[j] + 1, row[j-1] + 1, previous[j-1] + cost)
+            if (i > 1 and j > 1 and a[i-1] == b[j-2] and
+                    a[i-2] == b[j-1]):
+                row[j] = min(row[j], before[j-2] + 1)
+    return row[-1]
+
+
+class BKTree(object):
+    """
+    A Burkhard-Keller tree of words, under edit_distance. The children of a
+    node are keyed by their distance to it; by the triangle inequality, only
+    the children whose key is within max_distance of the distance between
+    the node and the query can hold a match.
+    """
+
+    def __init__(self, words=()):
+        self._root = None
+        self._size = 0
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, word):
+        if self._root is None:
+            self._root = (word, {})
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            distance = edit_distance(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                self._size += 1
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """
+        Returns:
+            list of (int, str): the words within max_distance of word, with
+                their distance, closest first
+        """
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_word, children = stack.pop()
+            distance = edit_distance(word, node_word)
+            if distance <= max_distance:
+                found.append((distance, node_word))
+            for key in range(distance - max_distance,
+                             distance + max_distance + 1):
+                child = children.get(key)
+                if child is not None:
+                    stack.append(child)
+        found.sort()
+        return found
+
+
+class KeywordCorrector(object):
+    """
+    Maps the unknown words of an utterance to the keywords of a rule set.
+
+    The keywords are the words of the productions whose category is not
+    open (taken from the utterances, such as names and unknown words). A
+    word is corrected when it has at least min_length characters, the
+    closest keyword is at most max_distance(word) edits away, no other
+    keyword is as close, and 1 - distance / len(word) is at least
+    min_confidence. Words that is_word accepts (words of the language, such
+    as "hello", one edit away from "cello") are taken as they are.
+
+    Args:
+        sem_rule_set (SemanticRuleSet): the rules whose words are known
+        open_categories (iterable of str): categories whose words are not
+            keywords
+        min_length (int): shorter words are never corrected
+        min_confidence (float): see above
+        is_word (callable): whether a word is meant as it is written
+    """
+
+    def __init__(self, sem_rule_set, open_categories=(), min_length=4,
+                 min_confidence=0.75, is_word=None):
+        self.sem = sem_rule_set
+        self.open_categories = set(open_categories)
+        self.min_length = min_length
+        self.min_confidence = min_confidence
+        self.is_word = is_word
+        self.enabled = True
+        # The number of productions whose words are in the tree.
+        self._num_productions = 0
+        self._keywords = set()
+        self._tree = BKTree()
+        # word -> the keyword it stands for, or None
+        self._corrections = {}
+
+
+    def max_distance(self, word):
+        return 1 if len(word) < 8 else 2
+
+
+    def keywords(self):
+        # Productions are only ever added, and most of the new ones are the
+        # unknown words and names of the utterances (open categories): only
+        # the productions added since the last call are looked at, and the
+        # tree and the corrections are kept.
+        productions = self.sem.productions
+        if self._num_productions < len(productions):
+            new = set()
+            for prod in productions[self._num_productions:]:
+                if str(prod.lhs()) in self.open_categories:
+                    continue
+                for symbol in prod.rhs():
+                    if (not isinstance(symbol, cfg.Nonterminal) and
+                            symbol.isalpha() and symbol not in self._keywords):
+                        new.add(symbol)
+            self._num_productions = len(productions)
+            for keyword in sorted(new):
+                self._keywords.add(keyword)
+                self._tree.add(keyword)
+            # A new keyword only changes the correction of the words it is
+            # close enough to.
+            for word in list(self._corrections) if new else []:
+                if any(edit_distance(word, keyword) <= self.max_distance(word)
+                       for keyword in new):
+                    del self._corrections[word]
+        return self._tree
+
+
+    def correct_word(self, word):
+        """
+        Returns:
+            str: the keyword the word stands for, or None
+        """
+        tree = self.keywords()
+        # Words become known as they are added to the grammar (as names for
+        # instance), so this is not cached.
+        if (len(word) < self.min_length or not word.isalpha() or
+                word in self.sem.terminals):
+            return None
+        if word in self._corrections:
+            return self._corrections[word]
+        correction = None
+        found = tree.search(word, self.max_distance(word))
+        if found and (len(found) == 1 or found[0][0] < found[1][0]):
+            distance, keyword = found[0]
+            if (1 - float(distance) / len(word) >= self.min_confidence
+                    and not (self.is_word and self.is_word(word))):
+                correction = keyword
+        self._corrections[word] = correction
+        return correction
+
+
+    def correct(self, tokens, keep=()):
+        """
+        Args:
+            tokens (list of str): the words of an utterance
+            keep (iterable of str): words that are not to be corrected
+                (names taken from the utterance)
+
+        Returns:
+            (list of str, list of (str, str)): the corrected words, and the
+                corrections made
+        """
+        if not self.enabled:
+            return list(tokens), []
+        keep = set(keep)
+        corrected = []
+        corrections = []
+        for token in tokens:
+            keyword = None if token in keep else self.correct_word(token)
+            if keyword is None:
+                corrected.append(token)
+            else:
+                corrected.append(keyword)
+                corrections.append((token, keyword))
+        return corrected, corrections
@@ -0,0 +1,122 @@
+"""
+Tests of the packed parse forests and of the parse budgets.
+
+Run from the software/lab3 directory: python -m unittest test_forest
+"""
+
+import unittest
+
+from nltk import CFG
+from nltk.parse.earleychart import EarleyChartParser
+
+from forest import ForestNode, ParseForest
+from parse_budget import (BudgetedIncrementalChart, BudgetMeter, ParseBudget,
+                          ParseBudgetExceeded, ParseResult)
+
+# Every binary bracketing of a sequence of words: the number of trees of n
+# words is the Catalan number C(n-1).
+GRAMMAR = CFG.fromstring("""
+S -> S S | 'a'
+""")
+CATALAN = [1, 1, 2, 5, 14, 42, 132, 429]
+
+
+def chart_forest(num_words, budget=None):
+    parser = EarleyChartParser(
+        GRAMMAR, chart_class=lambda tokens: BudgetedIncrementalChart(tokens, budget))
+    chart = parser.chart_parse(['a'] * num_words)
+    return chart, chart.forest(GRAMMAR.start())
+
+
+class TestParseForest(unittest.TestCase):
+
+    def test_count_and_trees(self):
+        for n in range(1, 8):
+            chart, forest = chart_forest(n)
+            self.assertEqual(forest.count(), CATALAN[n - 1])
+            self.assertEqual(sorted(map(str, forest.trees())),
+                             sorted(map(str, chart.parses(GRAMMAR.start()))))
+
+    def test_limit(self):
+        chart, forest = chart_forest(7)
+        every = list(forest.trees())
+        for limit in (0, 1, 10, 131, 132, 500):
+            self.assertEqual(list(forest.trees(limit)), every[:limit])
+
+    def test_best_tree(self):
+        chart, forest = chart_forest(6)
+        best = forest.best_tree()
+        heights = [tree.height() for tree in forest.trees()]
+        self.assertEqual(best.height(), min(heights))
+        self.assertEqual(forest.min_height(), min(heights))
+        self.assertEqual(best, list(forest.trees())[heights.index(min(heights))])
+
+    def test_transparent_nodes(self):
+        # X is an intermediate symbol: its children take its place.
+        x = ForestNode('X', 0, 2, transparent=True)
+        x.add(['a', 'b'])
+        s = ForestNode('S', 0, 3)
+        s.add([x, 'c'])
+        s.add([x, 'c'])
+        forest = ParseForest([s])
+        self.assertEqual(forest.count(), 1)
+        self.assertEqual(str(forest.best_tree()), '(S a b c)')
+        self.assertEqual(forest.min_height(), 2)
+
+    def test_empty_forest(self):
+        forest = ParseForest()
+        self.assertEqual(forest.count(), 0)
+        self.assertEqual(forest.best_tree(), None)
+        self.assertEqual(list(forest.trees()), [])
+
+
+class TestParseBudget(unittest.TestCase):
+
+    def test_edge_limit(self):
+        meter = BudgetMeter(ParseBudget(max_edges=3))
+        for _ in range(3):
+            meter.add_edge()
+        with self.assertRaises(ParseBudgetExceeded) as raised:
+            meter.add_edge()
+        self.assertEqual(raised.exception.as_dict(),
+                         {'budget_exceeded': 'edges', 'maximum': 3, 'value': 4})
+
+    def test_time_limit(self):
+        meter = BudgetMeter(ParseBudget(max_seconds=10.0))
+        meter.check_deadline()
+        meter.deadline -= 20.0
+        with self.assertRaises(ParseBudgetExceeded) as raised:
+            meter.check_deadline()
+        self.assertEqual(raised.exception.limit, 'seconds')
+
+    def test_chart_stops_at_the_edge_limit(self):
+        with self.assertRaises(ParseBudgetExceeded):
+            chart_forest(7, ParseBudget(max_edges=50))
+        chart, forest = chart_forest(7, ParseBudget(max_edges=10000))
+        self.assertEqual(chart._meter.num_edges, chart.num_edges())
+
+    def test_result_of_a_forest(self):
+        chart, forest = chart_forest(6)
+        result = ParseResult(forest=forest)
+        self.assertEqual(len(result), 42)
+        self.assertEqual(result.best(), forest.best_tree())
+        self.assertEqual(list(result), list(forest.trees()))
+
+    def test_result_with_a_tree_limit(self):
+        chart, forest = chart_forest(6)
+        result = ParseResult(forest=forest, max_trees=5)
+        self.assertEqual(len(result), 5)
+        kept = list(forest.trees(5))
+        self.assertEqual(list(result), kept)
+        heights = [tree.height() for tree in kept]
+        self.assertEqual(result.best(), kept[heights.index(min(heights))])
+
+    def test_result_of_trees(self):
+        result = ParseResult([], budget_exceeded=ParseBudgetExceeded('edges', 1, 2))
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result.best(), None)
+        self.assertEqual(result.budget_exceeded.limit, 'edges')
+
+
+if __name__ == '__main__':
+    unittest.main()
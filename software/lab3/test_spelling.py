@@ -0,0 +1,110 @@
+"""
+Tests of the correction of misspelled keywords.
+
+Run from the software/lab3 directory: python -m unittest test_spelling
+"""
+
+import random
+import unittest
+
+import cfg
+from spelling import BKTree, KeywordCorrector, edit_distance
+
+
+class RuleSet(object):
+    """The parts of a SemanticRuleSet a KeywordCorrector reads."""
+
+    def __init__(self):
+        self.productions = []
+        self.terminals = set()
+
+    def add(self, lhs, words):
+        for word in words:
+            self.productions.append(cfg.Production(cfg.Nonterminal(lhs), [word]))
+            self.terminals.add(word)
+
+
+class TestEditDistance(unittest.TestCase):
+
+    def test_distances(self):
+        self.assertEqual(edit_distance('wait', 'wait'), 0)
+        self.assertEqual(edit_distance('brodcast', 'broadcast'), 1)
+        self.assertEqual(edit_distance('wiat', 'wait'), 1)
+        self.assertEqual(edit_distance('chnage', 'change'), 1)
+        self.assertEqual(edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(edit_distance('', 'say'), 3)
+
+
+class TestBKTree(unittest.TestCase):
+
+    def test_search_finds_the_words_a_scan_finds(self):
+        rng = random.Random(0)
+        words = set(''.join(rng.choice('abcde') for _ in range(rng.randint(1, 6)))
+                    for _ in range(300))
+        tree = BKTree(sorted(words))
+        self.assertEqual(len(tree), len(words))
+        for query in ['abc', 'edcba', 'a', 'bbbbbb']:
+            for max_distance in (0, 1, 2):
+                expected = sorted((edit_distance(query, w), w) for w in words
+                                  if edit_distance(query, w) <= max_distance)
+                self.assertEqual(tree.search(query, max_distance), expected)
+
+
+class TestKeywordCorrector(unittest.TestCase):
+
+    def setUp(self):
+        self.sem = RuleSet()
+        self.sem.add('Wait', ['wait'])
+        self.sem.add('Broadcast', ['broadcast'])
+        self.sem.add('Play', ['play'])
+        self.sem.add('Say', ['say'])
+        self.corrector = KeywordCorrector(self.sem, open_categories=['Unk'],
+                                          is_word=lambda word: word == 'plat')
+
+    def test_corrections(self):
+        corrected, corrections = self.corrector.correct(
+            ['brodcast', 'hello', 'and', 'wiat'])
+        self.assertEqual(corrected, ['broadcast', 'hello', 'and', 'wait'])
+        self.assertEqual(corrections, [('brodcast', 'broadcast'), ('wiat', 'wait')])
+
+    def test_words_not_corrected(self):
+        # too short, kept, a word of the language, too far
+        self.assertEqual(self.corrector.correct(['sya'])[1], [])
+        self.assertEqual(self.corrector.correct(['wiat'], keep=['wiat'])[1], [])
+        self.assertEqual(self.corrector.correct(['plat'])[1], [])
+        self.assertEqual(self.corrector.correct(['wlat'])[1], [])
+
+    def test_tie_is_not_corrected(self):
+        self.sem.add('Want', ['want'])
+        self.assertEqual(self.corrector.correct_word('wanit'), None)
+
+    def test_disabled(self):
+        self.corrector.enabled = False
+        self.assertEqual(self.corrector.correct(['wiat']), (['wiat'], []))
+
+    def test_unknown_words_keep_the_tree_and_corrections(self):
+        self.assertEqual(self.corrector.correct_word('wiat'), 'wait')
+        tree = self.corrector.keywords()
+        self.sem.add('Unk', ['xyzzy', 'plugh'])
+        self.assertTrue(self.corrector.keywords() is tree)
+        self.assertTrue('wiat' in self.corrector._corrections)
+        self.assertEqual(self.corrector.correct_word('xyzzy'), None)
+
+    def test_new_keywords(self):
+        self.assertEqual(self.corrector.correct_word('wiat'), 'wait')
+        self.assertEqual(self.corrector.correct_word('brodcast'), 'broadcast')
+        # A keyword as close as the correction makes it ambiguous; the
+        # corrections of the other words are kept.
+        self.sem.add('Writ', ['wiit'])
+        self.assertEqual(self.corrector.correct_word('wiat'), None)
+        self.assertTrue('brodcast' in self.corrector._corrections)
+
+    def test_words_added_to_the_grammar(self):
+        self.assertEqual(self.corrector.correct_word('wiat'), 'wait')
+        # Made the name of a variable.
+        self.sem.add('VARIABLE_NAME', ['wiat'])
+        self.assertEqual(self.corrector.correct_word('wiat'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()